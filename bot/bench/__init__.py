@@ -0,0 +1 @@
+"""Стенды нагрузки бота. Запуск из корня репозитория: python -m bot.bench.<модуль>."""
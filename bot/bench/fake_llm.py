@@ -0,0 +1,161 @@
+"""Локальный OpenAI-совместимый сервер для нагрузочных тестов без LLM.
+
+Отвечает на POST /v1/chat/completions валидным миксом из табаков,
+перечисленных в промпте, после задержки latency ± jitter (нормальное
+распределение, не меньше нуля). Поле usage заполняется грубой оценкой
+токенов, чтобы метрики LLM выглядели как в бою.
+
+    python -m bot.bench.fake_llm [--port 8090] [--latency 0.5] [--jitter 0.2]
+
+После запуска: LLM_API_URL=http://127.0.0.1:8090/v1
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List, Optional, Set
+
+ROLES = ("база", "дополнение", "акцент")
+PORTIONS = {2: (60, 40), 3: (50, 30, 20), 4: (40, 30, 20, 10)}
+
+
+def collection_names(prompt: str) -> List[str]:
+    """Названия табаков из строк «- Название (Бренд) [Категория]» промпта."""
+    names = []
+    for line in prompt.splitlines():
+        if not line.startswith("- "):
+            continue
+        name = line[2:]
+        for separator in (" (", " ["):
+            name = name.split(separator, 1)[0]
+        names.append(name.strip())
+    return names
+
+
+class FakeLLMServer:
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, seed: Optional[int] = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set[asyncio.Task] = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8090) -> int:
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            # Клиенты держат keep-alive: закрываем соединения сами
+            for task in list(self._handlers):
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self.server.wait_closed()
+
+    def completion(self, request: dict) -> dict:
+        prompt = "\n".join(m.get("content") or "" for m in request.get("messages", []))
+        names = collection_names(prompt) or ["Табак"]
+        count = min(len(names), self.rng.choice((2, 3, 3, 4)))
+        picked = self.rng.sample(names, count) if count > 1 else names * 2
+        portions = PORTIONS[len(picked)]
+        content = json.dumps(
+            {
+                "name": f"Бенч-микс {self.rng.randrange(1_000_000)}",
+                "components": [
+                    {"tobacco": name, "portion": portion, "role": ROLES[min(i, 2)]}
+                    for i, (name, portion) in enumerate(zip(picked, portions))
+                ],
+                "description": "Синтетический ответ для нагрузочного теста.",
+                "tips": "Забивать пышно, прогрев 5 минут.",
+            },
+            ensure_ascii=False,
+        )
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-bench-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "bench"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @staticmethod
+    def response(status: str, body: bytes) -> bytes:
+        return (
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode() + body
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                method, path = request_line.split()[:2]
+                if method != b"POST" or not path.endswith(b"/chat/completions"):
+                    writer.write(self.response("404 Not Found", b'{"error": "not found"}'))
+                    await writer.drain()
+                    continue
+
+                self.requests += 1
+                delay = max(self.rng.gauss(self.latency, self.jitter), 0.0) if self.jitter else self.latency
+                await asyncio.sleep(delay)
+                payload = json.dumps(self.completion(json.loads(body)), ensure_ascii=False)
+                writer.write(self.response("200 OK", payload.encode("utf-8")))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+
+async def serve(host: str, port: int, latency: float, jitter: float) -> None:
+    server = FakeLLMServer(latency, jitter)
+    port = await server.start(host, port)
+    print(f"Fake LLM listening on http://{host}:{port}/v1 (latency {latency}s ± {jitter}s)")
+    await server.server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.5, help="средняя задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.2, help="стандартное отклонение задержки, с")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.latency, args.jitter))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
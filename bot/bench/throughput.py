@@ -0,0 +1,426 @@
+"""Стенд пропускной способности бота без Telegram.
+
+Диспетчер из bot.main.create_dispatcher получает синтетические Update
+через dp.feed_update; запросы к Bot API уходят в FakeSession, которая
+отвечает сразу (или после --api-latency) и запоминает последнюю
+клавиатуру каждого чата — виртуальный пользователь «нажимает» кнопки
+из неё, как живой. Генерация миксов идёт в локальный fake LLM.
+
+Сценарий пользователя: /start → коллекция → массовое добавление →
+коллекция → следующая страница → меню миксов → «удиви меня» → оценка →
+микс по табаку → история.
+
+Печатает updates/s, задержки обработчиков и запросы к БД на апдейт;
+--output сохраняет профиль в JSON, --compare сравнивает с прошлым.
+
+    python -m bot.bench.throughput [--users 1000] [--concurrency 100]
+    python -m bot.bench.throughput --output before.json
+    python -m bot.bench.throughput --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message, TelegramObject, Update
+
+from bot.bench.fake_llm import FakeLLMServer
+
+BOT_TOKEN = "123456:bench-token"
+BULK_LINES = 40
+
+FLAVORS = (
+    "Мята Манго Клубника Арбуз Дыня Лимон Лайм Виноград Персик Вишня Кокос "
+    "Шоколад Кофе Mint Ice Cola Berry Peach Cherry Banana Vanilla Grape Guava"
+).split()
+BRANDS = "Darkside Musthave Element Tangiers Sebero Blackburn Duft Satyr".split()
+
+
+# ============ BOT API ============
+
+class FakeSession(BaseSession):
+    """Сессия Bot API без сети: считает методы и помнит клавиатуры чатов."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.keyboards: Dict[int, List[str]] = {}
+        self._message_id = 1000
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def make_request(self, bot: Bot, method, timeout: Optional[int] = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        markup = getattr(method, "reply_markup", None)
+        chat_id = getattr(method, "chat_id", None)
+        if markup is not None and hasattr(markup, "inline_keyboard") and chat_id is not None:
+            self.keyboards[int(chat_id)] = [
+                button.callback_data
+                for row in markup.inline_keyboard
+                for button in row
+                if button.callback_data
+            ]
+
+        if isinstance(method, SendMessage):
+            self._message_id += 1
+            return Message(
+                message_id=self._message_id,
+                date=int(time.time()),
+                chat=Chat(id=int(method.chat_id), type="private"),
+                text=method.text,
+            )
+        return True
+
+
+# ============ ЗАМЕРЫ ============
+
+def normalize(statement: str) -> str:
+    """SQL без переменной части: списки IN (?, ?, …) и VALUES схлопываются."""
+    statement = " ".join(statement.split())
+    statement = re.sub(r"\((?:\?, )+\?\)", "(?…)", statement)
+    return re.sub(r"(?:\(\?…\), )+\(\?…\)", "(?…)…", statement)
+
+
+@dataclass
+class HandlerStats:
+    latencies: List[float] = field(default_factory=list)
+    queries: int = 0
+    db_seconds: float = 0.0
+    errors: int = 0
+    statements: Counter = field(default_factory=Counter)
+
+    def summary(self) -> dict:
+        count = len(self.latencies)
+        ordered = sorted(self.latencies)
+
+        def pct(q: float) -> float:
+            return round(ordered[min(int(q / 100 * count), count - 1)] * 1000, 2)
+
+        return {
+            "count": count,
+            "p50_ms": pct(50),
+            "p95_ms": pct(95),
+            "p99_ms": pct(99),
+            "queries_per_update": round(self.queries / count, 2),
+            "db_ms_per_update": round(self.db_seconds / count * 1000, 3),
+            "errors": self.errors,
+            "statements": {
+                statement: round(calls / count, 2)
+                for statement, calls in sorted(self.statements.items())
+            },
+        }
+
+
+class BenchMiddleware(BaseMiddleware):
+    """Inner middleware: время и профиль SQL каждого обработчика."""
+
+    def __init__(self, profiling: Callable, handler_name: Callable[[Any], str]):
+        self.profiling = profiling
+        self.handler_name = handler_name
+        self.handlers: Dict[str, HandlerStats] = defaultdict(HandlerStats)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = self.handler_name(data.get("handler"))
+        started = time.perf_counter()
+        with self.profiling(name) as profile:
+            try:
+                return await handler(event, data)
+            except Exception:
+                self.handlers[name].errors += 1
+                raise
+            finally:
+                stats = self.handlers[name]
+                stats.latencies.append(time.perf_counter() - started)
+                stats.queries += profile.queries
+                stats.db_seconds += profile.seconds
+                for statement, statement_stats in profile.statements.items():
+                    stats.statements[normalize(statement)] += statement_stats.count
+
+
+# ============ ПОЛЬЗОВАТЕЛИ ============
+
+class VirtualUser:
+    def __init__(self, harness: "Harness", telegram_id: int, rng: random.Random):
+        self.harness = harness
+        self.telegram_id = telegram_id
+        self.rng = rng
+
+    def _base(self) -> dict:
+        return {
+            "from": {"id": self.telegram_id, "is_bot": False, "first_name": "Bench", "username": f"u{self.telegram_id}"},
+        }
+
+    async def send(self, text: str) -> None:
+        await self.harness.feed({
+            "message": {
+                "message_id": self.harness.next_id(),
+                "date": int(time.time()),
+                "chat": {"id": self.telegram_id, "type": "private"},
+                "text": text,
+                **self._base(),
+            },
+        })
+
+    async def press(self, data: str) -> None:
+        update_id = self.harness.next_id()
+        await self.harness.feed({
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": "bench",
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": self.telegram_id, "type": "private"},
+                    "text": "…",
+                },
+                **self._base(),
+            },
+        })
+
+    async def press_button(self, prefix: str) -> bool:
+        """Нажимает первую кнопку последней клавиатуры с callback_data на prefix."""
+        for data in self.harness.session.keyboards.get(self.telegram_id, []):
+            if data.startswith(prefix):
+                await self.press(data)
+                return True
+        return False
+
+    async def journey(self) -> None:
+        await self.send("/start")
+        await self.press("collection")
+        await self.press("add_tobacco_bulk")
+        lines = {
+            f"{' '.join(self.rng.sample(FLAVORS, 2))} {self.rng.randrange(100)} | {self.rng.choice(BRANDS)}"
+            for _ in range(BULK_LINES)
+        }
+        await self.send("\n".join(sorted(lines)))
+        await self.press("collection")
+        await self.press_button("collection_page:")
+        await self.press("mix_menu")
+        await self.press("mix_surprise")
+        await self.press_button("rate_mix:")
+        await self.press("mix_by_tobacco")
+        await self.press_button("mix_with:")
+        await self.press("history")
+
+
+class Harness:
+    def __init__(self, dp, bot: Bot, session: FakeSession):
+        self.dp = dp
+        self.bot = bot
+        self.session = session
+        self.updates = 0
+        self.update_latencies: List[float] = []
+        self.errors: Counter = Counter()
+        self._id = 0
+
+    def next_id(self) -> int:
+        self._id += 1
+        return self._id
+
+    async def feed(self, payload: dict) -> None:
+        update = Update.model_validate(
+            {"update_id": self.next_id(), **payload}, context={"bot": self.bot}
+        )
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            # Ошибка — тоже результат замера (например, database is locked)
+            self.errors[type(e).__name__] += 1
+        self.update_latencies.append(time.perf_counter() - started)
+        self.updates += 1
+
+
+# ============ ЗАПУСК ============
+
+def configure_environment(tmp: str, llm_port: int, args) -> None:
+    """Настройки бота читаются при импорте bot.config — задаём их до импорта."""
+    os.environ.update(
+        DATABASE_URL=f"sqlite+aiosqlite:///{tmp}/bench.db",
+        DB_SHARDS=str(args.shards),
+        DB_SHARD_URL_TEMPLATE=f"sqlite+aiosqlite:///{tmp}/bench_shard{{shard}}.db",
+        BOT_TOKEN=BOT_TOKEN,
+        ADMIN_ID="1",
+        LLM_API_URL=f"http://127.0.0.1:{llm_port}/v1",
+        LLM_API_KEY="bench",
+        LLM_CACHE_TTL="0",
+        CACHE_URL="",
+        RATE_LIMIT_ENABLED="false",
+        MIX_RETENTION_DAYS="0",
+        METRICS_PORT="0",
+    )
+    # Под нагрузкой SQLite медленный почти каждый INSERT — журнал по желанию
+    os.environ.setdefault("SQL_SLOW_QUERY_MS", "0")
+
+
+async def run(args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="hookah-bot-bench-")
+    llm = FakeLLMServer(latency=args.llm_latency, jitter=args.llm_jitter, seed=args.seed)
+    llm_port = await llm.start("127.0.0.1", 0)
+    configure_environment(tmp, llm_port, args)
+
+    from bot.database.catalog import load_catalog
+    from bot.database.categories import load_categories
+    from bot.database.db import init_db, router
+    from bot.main import create_dispatcher
+    from bot.services.cache import cache
+    from bot.services.metrics import handler_name
+    from bot.services.profiler import profile_engine, profiling
+
+    await init_db()
+    async with router.session() as session:
+        await load_categories(session)
+        await load_catalog(session)
+    await cache.start()
+    # Строки INFO на каждый апдейт и запрос к LLM заглушают отчёт
+    logging.getLogger().setLevel(logging.WARNING)
+
+    fake = FakeSession(latency=args.api_latency)
+    bot = Bot(token=BOT_TOKEN, session=fake)
+    dp = create_dispatcher()
+    for shard_engine in router.engines:
+        profile_engine(shard_engine)
+    bench = BenchMiddleware(profiling, handler_name)
+    dp.message.middleware(bench)
+    dp.callback_query.middleware(bench)
+
+    harness = Harness(dp, bot, fake)
+    rng = random.Random(args.seed)
+    users = [VirtualUser(harness, 10_000 + i, random.Random(rng.random())) for i in range(args.users)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_user(user: VirtualUser) -> None:
+        async with semaphore:
+            await user.journey()
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_user(user) for user in users))
+    finally:
+        seconds = time.perf_counter() - started
+        await cache.close()
+        await router.dispose()
+        await llm.stop()
+
+    total_queries = sum(stats.queries for stats in bench.handlers.values())
+    return {
+        "config": {
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "shards": args.shards,
+            "api_latency": args.api_latency,
+            "llm_latency": args.llm_latency,
+            "llm_jitter": args.llm_jitter,
+        },
+        "totals": {
+            "updates": harness.updates,
+            "seconds": round(seconds, 2),
+            "updates_per_second": round(harness.updates / seconds, 1),
+            "update_p50_ms": round(statistics.median(harness.update_latencies) * 1000, 2),
+            "queries_per_update": round(total_queries / harness.updates, 2),
+            "errors": dict(sorted(harness.errors.items())),
+            "llm_requests": llm.requests,
+            "bot_api_calls": dict(sorted(fake.calls.items())),
+        },
+        "handlers": {name: stats.summary() for name, stats in sorted(bench.handlers.items())},
+    }
+
+
+def print_profile(profile: dict) -> None:
+    totals = profile["totals"]
+    print(
+        f"\n{totals['updates']} updates in {totals['seconds']} s: "
+        f"{totals['updates_per_second']} updates/s, "
+        f"p50 {totals['update_p50_ms']} ms, {totals['queries_per_update']} queries/update"
+    )
+    if totals["errors"]:
+        print("errors: " + ", ".join(f"{name} ×{count}" for name, count in totals["errors"].items()))
+    print(
+        f"{'handler':<36} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'q/upd':>6} {'db ms':>7} {'err':>5}"
+    )
+    for name, stats in profile["handlers"].items():
+        print(
+            f"{name:<36} {stats['count']:>6} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} "
+            f"{stats['p99_ms']:>8.1f} {stats['queries_per_update']:>6.1f} {stats['db_ms_per_update']:>7.2f} {stats['errors']:>5}"
+        )
+
+
+def print_diff(before: dict, after: dict) -> None:
+    """Разница профилей: запросы на апдейт, p95 и изменившиеся SQL по обработчикам."""
+    print("\n== diff (before → after)")
+    b, a = before["totals"], after["totals"]
+    print(
+        f"updates/s {b['updates_per_second']} → {a['updates_per_second']}, "
+        f"queries/update {b['queries_per_update']} → {a['queries_per_update']}"
+    )
+    for name in sorted(set(before["handlers"]) | set(after["handlers"])):
+        old, new = before["handlers"].get(name), after["handlers"].get(name)
+        if old is None or new is None:
+            print(f"{name}: {'added' if old is None else 'removed'}")
+            continue
+        lines = []
+        if old["queries_per_update"] != new["queries_per_update"]:
+            lines.append(f"queries/update {old['queries_per_update']} → {new['queries_per_update']}")
+        for statement in sorted(set(old["statements"]) | set(new["statements"])):
+            was, now = old["statements"].get(statement, 0), new["statements"].get(statement, 0)
+            if was != now:
+                lines.append(f"  {was} → {now}  {statement[:140]}")
+        lines.append(f"p95 {old['p95_ms']} → {new['p95_ms']} ms")
+        print(f"{name}: " + "\n    ".join(lines))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100, help="пользователей одновременно")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка Bot API, с")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--llm-jitter", type=float, default=0.02)
+    parser.add_argument("--output", type=Path, help="сохранить профиль (JSON)")
+    parser.add_argument("--compare", type=Path, help="сравнить с сохранённым профилем")
+    args = parser.parse_args()
+
+    profile = asyncio.run(run(args))
+    print_profile(profile)
+    if args.output:
+        args.output.write_text(json.dumps(profile, indent=2, ensure_ascii=False) + "\n")
+        print(f"\nProfile saved to {args.output}")
+    if args.compare:
+        print_diff(json.loads(args.compare.read_text()), profile)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,60 @@ class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite+aiosqlite:///./hookah_bot.db"
 
+    # Шардирование по пользователям (1 — одна общая база)
+    db_shards: int = 1
+    db_shard_url_template: str = "sqlite+aiosqlite:///./hookah_bot_shard{shard}.db"
+
+    # Retention миксов без оценки и не в избранном (0 — выключено)
+    mix_retention_days: int = 0
+    mix_retention_mode: str = "archive"  # archive/delete
+    mix_retention_batch_size: int = 200
+    mix_retention_interval_hours: int = 24
+
+    # Кэш пользователей (telegram_id → user.id)
+    identity_cache_ttl: float = 300.0
+    identity_flush_interval: float = 5.0
+
+    # Общий кэш: пусто — в памяти процесса, redis://host:port/db — общий для процессов
+    cache_url: str = ""
+    cache_prefix: str = "hookah-bot"
+    cache_max_bytes: int = 64 * 1024 * 1024
+    near_cache_max_bytes: int = 16 * 1024 * 1024
+    near_cache_ttl: float = 5.0
+    llm_cache_ttl: float = 0.0  # 0 — ответы LLM не кэшируются
+
+    # Поиск по коллекции: индексы последних пользователей
+    search_index_cache_size: int = 256
+
+    # Ограничение частоты: token bucket на пользователя
+    rate_limit_enabled: bool = True
+    rate_limit_store: str = "memory"  # memory/database (общий для процессов)
+    rate_limit_max_buckets: int = 10000
+    rate_limit_generate_burst: int = 3
+    rate_limit_generate_per_minute: float = 6.0
+    rate_limit_read_burst: int = 30
+    rate_limit_read_per_minute: float = 120.0
+
+    # Дедлайны, с (0 — без дедлайна): бюджет всего запроса, из остатка
+    # берут таймаут вызовы БД и LLM
+    deadline_default: float = 10.0
+    deadline_base: float = 30.0  # генерация по request_type
+    deadline_profile: float = 30.0
+    deadline_surprise: float = 40.0
+    deadline_save_reserve: float = 2.0  # LLM оставляет это время на сохранение микса
+    deadline_llm_min: float = 3.0  # меньше — к LLM не обращаемся, микс составляется локально
+
+    # Метрики Prometheus: порт 0 — HTTP-сервер метрик не запускается
+    metrics_enabled: bool = True
+    metrics_host: str = "0.0.0.0"
+    metrics_port: int = 0
+
+    # Профилировщик SQL: предупреждения о N+1 на каждый обработчик
+    sql_profiler_enabled: bool = False
+    sql_repeat_threshold: int = 5  # одинаковых запросов за обработчик → предупреждение
+    sql_slow_query_ms: float = 200.0  # 0 — журнал медленных запросов выключен
+    sql_explain_slow: bool = True
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
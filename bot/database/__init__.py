@@ -1,2 +1,2 @@
-from .db import async_session, init_db
-from .models import Base, Category, Mix, Tobacco, User
+from .db import async_session, init_db, router
+from .models import Base, CatalogItem, Category, Mix, MixArchive, MixIngredient, RateBucket, Tobacco, User
@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.models import Category
+
+
+@dataclass(frozen=True)
+class CategoryInfo:
+    """Категория вкуса (неизменяемая копия строки categories)."""
+    id: int
+    name: str
+    emoji: str
+    taste_profile: str
+
+
+class CategoryRegistry:
+    """Неизменяемый реестр категорий на весь процесс.
+
+    Категории засеваются один раз и не меняются, поэтому клавиатуры и
+    карточки табаков строятся по этому реестру, без запросов к БД.
+    """
+
+    def __init__(self, categories: Iterable[CategoryInfo] = ()):
+        self.categories: Tuple[CategoryInfo, ...] = tuple(
+            sorted(categories, key=lambda c: c.name)
+        )
+        self._by_id = MappingProxyType({c.id: c for c in self.categories})
+        self._by_name = MappingProxyType({c.name.lower(): c for c in self.categories})
+
+    def __len__(self) -> int:
+        return len(self.categories)
+
+    def get(self, category_id: Optional[int]) -> Optional[CategoryInfo]:
+        return self._by_id.get(category_id) if category_id is not None else None
+
+    def by_name(self, name: str) -> Optional[CategoryInfo]:
+        return self._by_name.get(name.strip().lower())
+
+    def name_for(self, category_id: Optional[int]) -> Optional[str]:
+        category = self.get(category_id)
+        return category.name if category else None
+
+    def emoji_for(self, category_id: Optional[int], default: str = "🔸") -> str:
+        category = self.get(category_id)
+        return category.emoji if category else default
+
+
+_registry = CategoryRegistry()
+
+
+def get_registry() -> CategoryRegistry:
+    """Текущий реестр категорий."""
+    return _registry
+
+
+async def load_categories(session: AsyncSession) -> CategoryRegistry:
+    """Загружает категории из БД в реестр процесса."""
+    global _registry
+    result = await session.execute(select(Category))
+    _registry = CategoryRegistry(
+        CategoryInfo(
+            id=c.id,
+            name=c.name,
+            emoji=c.emoji,
+            taste_profile=c.taste_profile,
+        )
+        for c in result.scalars().all()
+    )
+    return _registry
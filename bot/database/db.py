@@ -1,28 +1,76 @@
 import logging
 
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
 
 from bot.config import settings
+from bot.database.counters import reconcile_counters
+from bot.database.mix_components import backfill_mix_components
 from bot.database.models import Base, Category
+from bot.database.sharding import ShardRouter, shard_urls
 
 logger = logging.getLogger(__name__)
 
-engine = create_async_engine(settings.database_url)
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+router = ShardRouter(
+    shard_urls(settings.database_url, settings.db_shards, settings.db_shard_url_template)
+)
+
+# Шард 0: единственная база в обычном режиме и источник глобальных данных
+engine = router.engines[0]
+async_session = router.sessionmakers[0]
 
 
 async def init_db() -> None:
-    """Создаёт таблицы и заполняет начальные данные."""
-    async with engine.begin() as conn:
+    """Создаёт таблицы и заполняет начальные данные во всех шардах."""
+    for shard_engine, session_factory in zip(router.engines, router.sessionmakers):
+        await init_shard(shard_engine, session_factory)
+
+    logger.info("Database initialized (%s shard(s))", router.count)
+
+
+async def init_shard(shard_engine: AsyncEngine, session_factory: async_sessionmaker) -> None:
+    """Создаёт схему и глобальные данные в одном шарде."""
+    async with shard_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    
-    await init_categories()
-    logger.info("Database initialized")
+        await conn.run_sync(_add_missing_columns)
+
+    await init_categories(session_factory)
+
+    # Сверяем денормализованные счётчики с данными (первичное заполнение и ремонт)
+    async with session_factory() as session:
+        await reconcile_counters(session)
+
+    # Разворачиваем компоненты старых миксов в mix_components
+    async with session_factory() as session:
+        await backfill_mix_components(session)
+
+
+def _add_missing_columns(connection) -> None:
+    """Добавляет в существующие таблицы колонки, появившиеся в моделях.
+
+    create_all не изменяет уже созданные таблицы, поэтому новые колонки
+    докидываются через ALTER TABLE ADD COLUMN (со server_default, если он задан).
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            column_type = column.type.compile(dialect=connection.dialect)
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            connection.exec_driver_sql(ddl)
+            logger.info("Added column %s.%s", table.name, column.name)
 
 
-async def init_categories() -> None:
-    """Создаёт категории табаков если их нет."""
+async def init_categories(session_factory: async_sessionmaker = async_session) -> None:
+    """Создаёт категории табаков если их нет (категории реплицируются во все шарды)."""
     categories_data = [
         ("Ягодные", "🍓", "сладкий"),
         ("Цитрусовые", "🍊", "кислый"),
@@ -36,7 +84,7 @@ async def init_categories() -> None:
         ("Пряные", "🌶", "терпкий"),
     ]
 
-    async with async_session() as session:
+    async with session_factory() as session:
         # Проверяем есть ли уже категории
         result = await session.execute(select(Category).limit(1))
         if result.scalar_one_or_none() is not None:
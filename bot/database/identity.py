@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
+
+from sqlalchemy import update
+
+from bot.config import settings
+from bot.database.models import User
+from bot.database.sharding import current_epoch
+from bot.services.cache import Cache, cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Identity:
+    """Минимальные данные пользователя, нужные обработчикам запросов."""
+    id: int
+    telegram_id: int
+    username: Optional[str] = None
+    first_name: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user: User) -> "Identity":
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            username=user.username,
+            first_name=user.first_name,
+        )
+
+
+class IdentityCache:
+    """Кэш telegram_id → Identity поверх общего кэша (cache.Cache).
+
+    Попадание в кэш избавляет от SELECT пользователя на каждом запросе;
+    с CACHE_URL=redis://… запись видят все воркеры. Изменения профиля
+    (username, first_name) копятся в памяти и записываются в БД пачкой
+    фоновой задачей (write-behind).
+    """
+
+    NAMESPACE = "identity"
+
+    def __init__(self, cache: Cache, ttl: float = 300.0, epoch: str = ""):
+        self.cache = cache
+        self.ttl = ttl
+        # Метка схемы шардов в ключе: после ребалансировки id из общего
+        # кэша (Redis переживает перезапуск) указывал бы в чужие строки
+        self.epoch = epoch
+        self._pending: Dict[int, Identity] = {}
+
+    def _key(self, telegram_id: int) -> str:
+        return f"{self.epoch}:{telegram_id}"
+
+    async def get(self, telegram_id: int) -> Optional[Identity]:
+        data = await self.cache.get(self.NAMESPACE, self._key(telegram_id))
+        return Identity(*data) if data else None
+
+    async def put(self, identity: Identity) -> None:
+        await self.cache.set(
+            self.NAMESPACE,
+            self._key(identity.telegram_id),
+            [identity.id, identity.telegram_id, identity.username, identity.first_name],
+            self.ttl,
+        )
+
+    async def invalidate(self, telegram_id: int) -> None:
+        await self.cache.delete(self.NAMESPACE, self._key(telegram_id))
+
+    async def update_profile(
+        self, identity: Identity, username: Optional[str], first_name: Optional[str]
+    ) -> Identity:
+        """Обновляет профиль в кэше и ставит запись в БД в очередь."""
+        if identity.username == username and identity.first_name == first_name:
+            return identity
+
+        updated = replace(identity, username=username, first_name=first_name)
+        await self.put(updated)
+        self._pending[updated.telegram_id] = updated
+        return updated
+
+    def drain_pending(self) -> List[Identity]:
+        pending = list(self._pending.values())
+        self._pending.clear()
+        return pending
+
+
+async def flush_profiles(cache: IdentityCache, router) -> int:
+    """Записывает накопленные изменения профилей, одна транзакция на шард."""
+    pending = cache.drain_pending()
+    if not pending:
+        return 0
+
+    by_shard: Dict[int, List[Identity]] = {}
+    for identity in pending:
+        by_shard.setdefault(router.shard_for(identity.telegram_id), []).append(identity)
+
+    for shard, identities in by_shard.items():
+        async with router.sessionmakers[shard]() as session:
+            await session.execute(
+                update(User).execution_options(synchronize_session=False),
+                [
+                    {"id": i.id, "username": i.username, "first_name": i.first_name}
+                    for i in identities
+                ],
+            )
+            await session.commit()
+
+    return len(pending)
+
+
+async def flush_loop(cache: IdentityCache, router, interval: float) -> None:
+    """Фоновая задача write-behind для профилей пользователей."""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await flush_profiles(cache, router)
+            except Exception:
+                logger.exception("Profile flush failed")
+    finally:
+        # Дописываем остатки при остановке
+        await flush_profiles(cache, router)
+
+
+identity_cache = IdentityCache(cache, ttl=settings.identity_cache_ttl, epoch=current_epoch())
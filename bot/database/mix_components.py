@@ -0,0 +1,164 @@
+import logging
+from typing import Dict, Iterable, List
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.models import Mix, MixIngredient, Tobacco
+
+logger = logging.getLogger(__name__)
+
+
+def build_ingredient_rows(
+    mix_id: int,
+    components: dict,
+    tobacco_ids: Dict[str, int],
+) -> List[dict]:
+    """Разворачивает JSON компонентов микса в строки mix_components.
+
+    ``tobacco_ids`` — словарь {название в нижнем регистре: id табака}
+    для привязки компонента к табаку из коллекции.
+    """
+    rows = []
+    for name, data in (components or {}).items():
+        if isinstance(data, dict):
+            portion = data.get("portion", 0)
+            role = data.get("role")
+        else:
+            # Старый формат {"табак": процент}
+            portion, role = data, None
+
+        rows.append({
+            "mix_id": mix_id,
+            "tobacco_id": tobacco_ids.get(name.strip().lower()),
+            "name": name,
+            "portion": int(portion or 0),
+            "role": role,
+        })
+    return rows
+
+
+async def write_mix_components(
+    session: AsyncSession,
+    mix_id: int,
+    components: dict,
+    tobacco_ids: Dict[str, int],
+) -> None:
+    """Записывает компоненты микса в текущей транзакции."""
+    rows = build_ingredient_rows(mix_id, components, tobacco_ids)
+    if rows:
+        await session.execute(insert(MixIngredient), rows)
+
+
+async def detach_tobaccos(session: AsyncSession, tobacco_ids: Iterable[int]) -> None:
+    """Отвязывает компоненты от удалённых табаков (ON DELETE SET NULL)."""
+    tobacco_ids = list(tobacco_ids)
+    if not tobacco_ids:
+        return
+
+    await session.execute(
+        update(MixIngredient)
+        .where(MixIngredient.tobacco_id.in_(tobacco_ids))
+        .values(tobacco_id=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def backfill_mix_components(session: AsyncSession, batch_size: int = 500) -> int:
+    """Заполняет mix_components для миксов, созданных до появления таблицы.
+
+    Работает пачками по ``batch_size`` миксов с коммитом после каждой пачки.
+    Возвращает количество обработанных миксов.
+    """
+    has_components = select(MixIngredient.id).where(MixIngredient.mix_id == Mix.id).exists()
+    processed = 0
+    last_id = 0
+
+    while True:
+        result = await session.execute(
+            select(Mix.id, Mix.user_id, Mix.components)
+            .where(Mix.id > last_id, ~has_components)
+            .order_by(Mix.id)
+            .limit(batch_size)
+        )
+        mixes = result.all()
+        if not mixes:
+            break
+
+        user_ids = {user_id for _, user_id, _ in mixes}
+        result = await session.execute(
+            select(Tobacco.user_id, Tobacco.name, Tobacco.id)
+            .where(Tobacco.user_id.in_(user_ids))
+        )
+        tobacco_ids: Dict[int, Dict[str, int]] = {}
+        for user_id, name, tobacco_id in result.all():
+            tobacco_ids.setdefault(user_id, {})[name.lower()] = tobacco_id
+
+        rows = []
+        for mix_id, user_id, components in mixes:
+            rows.extend(build_ingredient_rows(mix_id, components, tobacco_ids.get(user_id, {})))
+        if rows:
+            await session.execute(insert(MixIngredient), rows)
+        await session.commit()
+
+        processed += len(mixes)
+        last_id = mixes[-1][0]
+
+    if processed:
+        logger.info("Backfilled mix_components for %s mixes", processed)
+    return processed
+
+
+async def mixes_with_tobacco(session: AsyncSession, user_id: int, tobacco_id: int) -> List[Mix]:
+    """Миксы пользователя, в которых участвует табак."""
+    result = await session.execute(
+        select(Mix)
+        .join(MixIngredient, MixIngredient.mix_id == Mix.id)
+        .where(Mix.user_id == user_id, MixIngredient.tobacco_id == tobacco_id)
+        .order_by(Mix.created_at.desc())
+    )
+    return list(result.scalars().unique().all())
+
+
+async def top_tobaccos(
+    session: AsyncSession, user_id: int, limit: int = 10
+) -> List[dict]:
+    """Самые используемые в миксах табаки пользователя."""
+    uses = func.count(MixIngredient.id).label("uses")
+    result = await session.execute(
+        select(
+            func.min(MixIngredient.name),
+            func.max(MixIngredient.tobacco_id).label("tobacco_id"),
+            uses,
+            func.avg(MixIngredient.portion).label("avg_portion"),
+        )
+        .join(Mix, Mix.id == MixIngredient.mix_id)
+        .where(Mix.user_id == user_id)
+        .group_by(func.lower(MixIngredient.name))
+        .order_by(uses.desc())
+        .limit(limit)
+    )
+    return [
+        {
+            "name": name,
+            "tobacco_id": tobacco_id,
+            "uses": count,
+            "avg_portion": round(float(avg_portion or 0), 1),
+        }
+        for name, tobacco_id, count, avg_portion in result.all()
+    ]
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    from bot.database.db import router
+
+    async def _main() -> None:
+        processed = 0
+        for session_factory in router.sessionmakers:
+            async with session_factory() as session:
+                processed += await backfill_mix_components(session)
+        print(f"Обработано миксов: {processed}")
+
+    asyncio.run(_main())
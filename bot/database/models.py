@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import BigInteger, ForeignKey, Text, JSON
+from sqlalchemy import BigInteger, ForeignKey, Text, JSON, UniqueConstraint
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -21,6 +21,15 @@ class User(Base):
     first_name: Mapped[Optional[str]] = mapped_column(nullable=True)
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
 
+    # Денормализованные счётчики (обновляются в той же транзакции, что и мутации)
+    tobaccos_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    mixes_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    favorites_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    likes_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    dislikes_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    # Версия данных пользователя: растёт при каждом изменении коллекции/миксов
+    data_version: Mapped[int] = mapped_column(default=0, server_default="0")
+
     # Relationships
     tobaccos: Mapped[list["Tobacco"]] = relationship(
         back_populates="user",
@@ -56,6 +65,10 @@ class Tobacco(Base):
         ForeignKey("categories.id"), nullable=True
     )
     notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Ссылка на глобальный каталог: название и бренд тогда канонические
+    catalog_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("catalog.id"), nullable=True, index=True
+    )
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
 
     # Relationships
@@ -81,3 +94,70 @@ class Mix(Base):
 
     # Relationships
     user: Mapped["User"] = relationship(back_populates="mixes")
+
+
+class CatalogItem(Base):
+    """Запись глобального каталога: бренд или вкус бренда.
+
+    Каталог общий для всех пользователей и копируется во все шарды
+    с одинаковыми id, поэтому Tobacco.catalog_id переносится между шардами.
+    """
+
+    __tablename__ = "catalog"
+    __table_args__ = (UniqueConstraint("kind", "brand_id", "normalized"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(index=True)  # brand/flavor
+    name: Mapped[str]  # каноническое написание
+    normalized: Mapped[str] = mapped_column(index=True)  # нижний регистр, ё → е
+    brand_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("catalog.id"), nullable=True, index=True
+    )
+    category_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("categories.id"), nullable=True
+    )
+
+
+class MixIngredient(Base):
+    """Компонент микса — нормализованная копия Mix.components."""
+
+    __tablename__ = "mix_components"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    mix_id: Mapped[int] = mapped_column(ForeignKey("mixes.id", ondelete="CASCADE"), index=True)
+    tobacco_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("tobaccos.id", ondelete="SET NULL"), nullable=True, index=True
+    )
+    name: Mapped[str] = mapped_column(index=True)  # название как его вернул LLM
+    portion: Mapped[int]
+    role: Mapped[Optional[str]] = mapped_column(nullable=True)
+
+
+class MixArchive(Base):
+    """Компактная запись об удалённом по retention миксе.
+
+    Хранит только то, что нужно для защиты от повторов: название и сигнатуру состава.
+    """
+
+    __tablename__ = "mix_archive"
+
+    id: Mapped[int] = mapped_column(primary_key=True)  # id исходного микса
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    name: Mapped[str]
+    signature: Mapped[str] = mapped_column(index=True)  # название|табак1,табак2,...
+    request_type: Mapped[str]
+    created_at: Mapped[datetime]
+    archived_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+
+
+class RateBucket(Base):
+    """Ведро token bucket в общем хранилище лимитов (RATE_LIMIT_STORE=database).
+
+    Строки простаивающих вёдер удаляются: полное ведро равно отсутствующему.
+    """
+
+    __tablename__ = "rate_buckets"
+
+    key: Mapped[str] = mapped_column(primary_key=True)  # scope:пользователь
+    tokens: Mapped[float]
+    updated_at: Mapped[float] = mapped_column(index=True)  # unix time
@@ -1,6 +1,7 @@
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.database.identity import Identity, identity_cache
 from bot.database.models import User
 
 
@@ -9,28 +10,29 @@ async def get_or_create_user(
     telegram_id: int,
     username: str = None,
     first_name: str = None,
-) -> User:
-    """Получает пользователя из БД или создаёт нового."""
-    # Используем fresh query каждый раз
-    result = await session.execute(
-        select(User).where(User.telegram_id == telegram_id)
-    )
-    user = result.scalar_one_or_none()
+) -> Identity:
+    """Получает пользователя (из кэша или БД) или создаёт нового.
 
-    if not user:
-        user = User(
-            telegram_id=telegram_id,
-            username=username,
-            first_name=first_name,
+    Изменения username/first_name записываются в БД фоном (write-behind).
+    """
+    identity = await identity_cache.get(telegram_id)
+    if identity is None:
+        result = await session.execute(
+            select(User).where(User.telegram_id == telegram_id)
         )
-        session.add(user)
-        await session.commit()
-        await session.refresh(user)
-    else:
-        # Обновляем данные если изменились
-        if user.username != username or user.first_name != first_name:
-            user.username = username
-            user.first_name = first_name
+        user = result.scalar_one_or_none()
+
+        if not user:
+            user = User(
+                telegram_id=telegram_id,
+                username=username,
+                first_name=first_name,
+            )
+            session.add(user)
             await session.commit()
+            await session.refresh(user)
+
+        identity = Identity.from_user(user)
+        await identity_cache.put(identity)
 
-    return user
+    return await identity_cache.update_profile(identity, username, first_name)
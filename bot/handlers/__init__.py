@@ -1 +1 @@
-from . import collection, mix, start
+from . import collection, mix, search, start
@@ -2,11 +2,14 @@ from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, Message
-from sqlalchemy import select
+from sqlalchemy import delete, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from bot.database.models import Category, Tobacco, User
+from bot.database.catalog import get_catalog
+from bot.database.categories import get_registry
+from bot.database.counters import bump_counters
+from bot.database.mix_components import detach_tobaccos
+from bot.database.models import Tobacco, User
 from bot.database.utils import get_or_create_user
 from bot.keyboards.menus import (
     back_to_menu,
@@ -52,7 +55,6 @@ async def show_collection(callback: CallbackQuery, session: AsyncSession) -> Non
     result = await session.execute(
         select(Tobacco)
         .where(Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
         .order_by(Tobacco.name)
     )
     tobaccos = result.scalars().all()
@@ -89,7 +91,6 @@ async def collection_page(callback: CallbackQuery, session: AsyncSession) -> Non
     result = await session.execute(
         select(Tobacco)
         .where(Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
         .order_by(Tobacco.name)
     )
     tobaccos = result.scalars().all()
@@ -108,7 +109,6 @@ async def show_tobacco(callback: CallbackQuery, session: AsyncSession) -> None:
     result = await session.execute(
         select(Tobacco)
         .where(Tobacco.id == tobacco_id)
-        .options(selectinload(Tobacco.category))
     )
     tobacco = result.scalar_one_or_none()
 
@@ -116,8 +116,9 @@ async def show_tobacco(callback: CallbackQuery, session: AsyncSession) -> None:
         await callback.answer("Табак не найден", show_alert=True)
         return
 
-    emoji = tobacco.category.emoji if tobacco.category else "🔸"
-    category_name = tobacco.category.name if tobacco.category else "Не указана"
+    registry = get_registry()
+    emoji = registry.emoji_for(tobacco.category_id)
+    category_name = registry.name_for(tobacco.category_id) or "Не указана"
     brand = tobacco.brand or "Не указан"
     date = tobacco.created_at.strftime("%d.%m.%Y")
 
@@ -180,15 +181,11 @@ async def skip_brand(callback: CallbackQuery, state: FSMContext, session: AsyncS
     await state.update_data(brand=None)
     await state.set_state(AddTobaccoStates.waiting_category)
 
-    # Получаем категории
-    result = await session.execute(select(Category).order_by(Category.name))
-    categories = result.scalars().all()
-
     await callback.message.edit_text(
         "📁 *Выбери категорию вкуса:*\n\n"
         "_Категория поможет AI лучше\nподбирать сочетания_",
         parse_mode="Markdown",
-        reply_markup=categories_menu(list(categories)),
+        reply_markup=categories_menu(list(get_registry().categories)),
     )
     await callback.answer()
 
@@ -200,15 +197,11 @@ async def process_brand(message: Message, state: FSMContext, session: AsyncSessi
     await state.update_data(brand=brand)
     await state.set_state(AddTobaccoStates.waiting_category)
 
-    # Получаем категории
-    result = await session.execute(select(Category).order_by(Category.name))
-    categories = result.scalars().all()
-
     await message.answer(
         "📁 *Выбери категорию вкуса:*\n\n"
         "_Категория поможет AI лучше\nподбирать сочетания_",
         parse_mode="Markdown",
-        reply_markup=categories_menu(list(categories)),
+        reply_markup=categories_menu(list(get_registry().categories)),
     )
 
 
@@ -224,6 +217,12 @@ async def process_category(callback: CallbackQuery, state: FSMContext, session:
     name = data["name"]
     brand = data.get("brand")
 
+    # Табак из каталога сохраняем с каноническим названием и брендом
+    entry = get_catalog().match(name, brand)
+    if entry:
+        name, brand = entry.name, entry.brand
+        category_id = category_id or entry.category_id
+
     # Получаем или создаём пользователя
     user = await get_or_create_user(
         session,
@@ -256,8 +255,10 @@ async def process_category(callback: CallbackQuery, state: FSMContext, session:
         name=name,
         brand=brand,
         category_id=category_id,
+        catalog_id=entry.id if entry else None,
     )
     session.add(tobacco)
+    await bump_counters(session, user.id, tobaccos_count=1)
     await session.commit()
 
     # Очищаем state
@@ -320,9 +321,9 @@ async def process_bulk_tobaccos(message: Message, state: FSMContext, session: As
         first_name=message.from_user.first_name,
     )
     
-    # Получаем категории для сопоставления
-    result = await session.execute(select(Category))
-    categories = {c.name.lower(): c.id for c in result.scalars().all()}
+    # Категории и каталог для сопоставления по названию
+    registry = get_registry()
+    catalog = get_catalog()
     
     # Получаем существующие табаки пользователя для проверки дубликатов
     result = await session.execute(
@@ -330,7 +331,7 @@ async def process_bulk_tobaccos(message: Message, state: FSMContext, session: As
     )
     existing_names = {name.lower() for name in result.scalars().all()}
     
-    added = []
+    rows = []
     skipped = []
     errors = []
     
@@ -342,24 +343,39 @@ async def process_bulk_tobaccos(message: Message, state: FSMContext, session: As
             errors.append(f"• `{line}` — слишком короткое название")
             continue
         
+        brand = parts[1] if len(parts) > 1 else None
+        category = registry.by_name(parts[2]) if len(parts) > 2 else None
+        category_id = category.id if category else None
+        
+        entry = catalog.match(name, brand)
+        if entry:
+            name, brand = entry.name, entry.brand
+            category_id = category_id or entry.category_id
+        
         # Проверяем дубликат
         if name.lower() in existing_names:
             skipped.append(f"• {name}")
             continue
         
-        brand = parts[1] if len(parts) > 1 else None
-        category_name = parts[2].lower() if len(parts) > 2 else None
-        category_id = categories.get(category_name) if category_name else None
-        
-        tobacco = Tobacco(
-            user_id=user.id,
-            name=name,
-            brand=brand,
-            category_id=category_id,
-        )
-        session.add(tobacco)
+        rows.append({
+            "user_id": user.id,
+            "name": name,
+            "brand": brand,
+            "category_id": category_id,
+            "catalog_id": entry.id if entry else None,
+        })
         existing_names.add(name.lower())  # Добавляем в набор чтобы избежать дублей в одном списке
-        added.append(f"• {name}" + (f" ({brand})" if brand else ""))
+    
+    # Один executemany на весь список; названия и бренды уже в rows,
+    # RETURNING не нужен
+    added = []
+    if rows:
+        await session.execute(insert(Tobacco), rows)
+        added = [
+            f"• {row['name']}" + (f" ({row['brand']})" if row["brand"] else "")
+            for row in rows
+        ]
+        await bump_counters(session, user.id, tobaccos_count=len(added))
     
     await session.commit()
     await state.clear()
@@ -417,18 +433,6 @@ async def delete_tobacco(callback: CallbackQuery, session: AsyncSession) -> None
     """Удаляет табак."""
     tobacco_id = int(callback.data.split(":")[1])
 
-    result = await session.execute(
-        select(Tobacco).where(Tobacco.id == tobacco_id)
-    )
-    tobacco = result.scalar_one_or_none()
-
-    if tobacco:
-        await session.delete(tobacco)
-        await session.commit()
-
-    await callback.answer("✅ Удалено!")
-
-    # Показываем коллекцию
     user = await get_or_create_user(
         session,
         telegram_id=callback.from_user.id,
@@ -436,10 +440,23 @@ async def delete_tobacco(callback: CallbackQuery, session: AsyncSession) -> None
         first_name=callback.from_user.first_name,
     )
 
+    result = await session.execute(
+        delete(Tobacco)
+        .where(Tobacco.id == tobacco_id, Tobacco.user_id == user.id)
+        .returning(Tobacco.id)
+        .execution_options(synchronize_session=False)
+    )
+    deleted_ids = list(result.scalars().all())
+    await detach_tobaccos(session, deleted_ids)
+    await bump_counters(session, user.id, tobaccos_count=-len(deleted_ids))
+    await session.commit()
+
+    await callback.answer("✅ Удалено!")
+
+    # Показываем коллекцию
     result = await session.execute(
         select(Tobacco)
         .where(Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
         .order_by(Tobacco.name)
     )
     tobaccos = result.scalars().all()
@@ -475,7 +492,6 @@ async def start_delete_mode(callback: CallbackQuery, state: FSMContext, session:
     result = await session.execute(
         select(Tobacco)
         .where(Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
         .order_by(Tobacco.name)
     )
     tobaccos = result.scalars().all()
@@ -523,7 +539,6 @@ async def toggle_delete_selection(callback: CallbackQuery, state: FSMContext, se
     result = await session.execute(
         select(Tobacco)
         .where(Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
         .order_by(Tobacco.name)
     )
     tobaccos = result.scalars().all()
@@ -553,7 +568,6 @@ async def delete_page(callback: CallbackQuery, state: FSMContext, session: Async
     result = await session.execute(
         select(Tobacco)
         .where(Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
         .order_by(Tobacco.name)
     )
     tobaccos = result.scalars().all()
@@ -574,15 +588,24 @@ async def delete_selected_tobaccos(callback: CallbackQuery, state: FSMContext, s
         await callback.answer("Ничего не выбрано", show_alert=True)
         return
     
-    # Удаляем выбранные табаки
-    result = await session.execute(
-        select(Tobacco).where(Tobacco.id.in_(selected))
+    user = await get_or_create_user(
+        session,
+        telegram_id=callback.from_user.id,
+        username=callback.from_user.username,
+        first_name=callback.from_user.first_name,
     )
-    tobaccos_to_delete = result.scalars().all()
-    
-    count = len(tobaccos_to_delete)
-    for tobacco in tobaccos_to_delete:
-        await session.delete(tobacco)
+
+    # Удаляем выбранные табаки одним DELETE, только из коллекции пользователя
+    result = await session.execute(
+        delete(Tobacco)
+        .where(Tobacco.user_id == user.id, Tobacco.id.in_(selected))
+        .returning(Tobacco.id)
+        .execution_options(synchronize_session=False)
+    )
+    deleted_ids = list(result.scalars().all())
+    count = len(deleted_ids)
+    await detach_tobaccos(session, deleted_ids)
+    await bump_counters(session, user.id, tobaccos_count=-count)
     
     await session.commit()
     await state.clear()
@@ -590,17 +613,9 @@ async def delete_selected_tobaccos(callback: CallbackQuery, state: FSMContext, s
     await callback.answer(f"✅ Удалено: {count} табаков")
     
     # Возвращаемся в коллекцию
-    user = await get_or_create_user(
-        session,
-        telegram_id=callback.from_user.id,
-        username=callback.from_user.username,
-        first_name=callback.from_user.first_name,
-    )
-
     result = await session.execute(
         select(Tobacco)
         .where(Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
         .order_by(Tobacco.name)
     )
     tobaccos = result.scalars().all()
@@ -646,13 +661,15 @@ async def delete_all_tobaccos(callback: CallbackQuery, session: AsyncSession) ->
     )
 
     result = await session.execute(
-        select(Tobacco).where(Tobacco.user_id == user.id)
+        delete(Tobacco)
+        .where(Tobacco.user_id == user.id)
+        .returning(Tobacco.id)
+        .execution_options(synchronize_session=False)
     )
-    tobaccos = result.scalars().all()
-    
-    count = len(tobaccos)
-    for tobacco in tobaccos:
-        await session.delete(tobacco)
+    deleted_ids = list(result.scalars().all())
+    count = len(deleted_ids)
+    await detach_tobaccos(session, deleted_ids)
+    await bump_counters(session, user.id, tobaccos_count=-count)
     
     await session.commit()
     
@@ -2,17 +2,33 @@ from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
+from bot.database.catalog import get_catalog
+from bot.database.categories import get_registry
+from bot.database.counters import bump_counters, rating_deltas
+from bot.database.mix_components import write_mix_components
 from bot.database.models import Mix, Tobacco, User
+from bot.database.retention import archived_mixes
 from bot.database.utils import get_or_create_user
-from bot.keyboards.menus import back_to_menu, confirm_delete_all_menu, favorites_menu, mix_menu, mix_rating_menu
+from bot.keyboards.menus import (
+    back_to_menu,
+    confirm_delete_all_menu,
+    favorites_menu,
+    generation_menu,
+    mix_menu,
+    mix_rating_menu,
+)
+from bot.services.deadline import rebudget
+from bot.services.generations import GenerationCancelled, generations
 from bot.services.llm_service import llm_service
 
 router = Router()
 
+# Сколько табаков показывать в выборе основы; остальные — через поиск
+BASE_PICKER_LIMIT = 15
+
 
 def get_role_emoji(role: str) -> str:
     """Возвращает emoji для роли компонента."""
@@ -37,12 +53,11 @@ async def show_mix_menu(callback: CallbackQuery, session: AsyncSession) -> None:
         first_name=callback.from_user.first_name,
     )
 
-    result = await session.execute(
-        select(Tobacco).where(Tobacco.user_id == user.id)
+    count = await session.scalar(
+        select(User.tobaccos_count).where(User.id == user.id)
     )
-    tobaccos = result.scalars().all()
 
-    if len(tobaccos) < 2:
+    if count < 2:
         await callback.message.edit_text(
             "⚠️ *Мало табаков*\n\n"
             "Нужно минимум 2 для микса.\n"
@@ -73,28 +88,33 @@ async def select_base_tobacco(callback: CallbackQuery, session: AsyncSession) ->
     result = await session.execute(
         select(Tobacco)
         .where(Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
         .order_by(Tobacco.name)
-        .limit(15)
+        .limit(BASE_PICKER_LIMIT)
     )
     tobaccos = result.scalars().all()
 
     # Создаём динамическую клавиатуру
     builder = InlineKeyboardBuilder()
+    registry = get_registry()
     for tobacco in tobaccos:
-        emoji = tobacco.category.emoji if tobacco.category else "🔸"
+        emoji = registry.emoji_for(tobacco.category_id)
         builder.button(
             text=f"{emoji} {tobacco.name}",
             callback_data=f"mix_with:{tobacco.id}",
         )
     builder.adjust(1)
 
-    # Кнопка назад
+    # Поиск и кнопка назад
+    builder.button(text="🔍 Поиск", callback_data="search_tobacco:mix")
     builder.button(text="◀️ Назад", callback_data="mix_menu")
     builder.adjust(1)
 
+    text = "🎯 *Выбери табак-основу:*"
+    if len(tobaccos) == BASE_PICKER_LIMIT:
+        text += f"\n\n_Показаны первые {BASE_PICKER_LIMIT} — остальные найдутся через поиск_"
+
     await callback.message.edit_text(
-        "🎯 *Выбери табак-основу:*",
+        text,
         parse_mode="Markdown",
         reply_markup=builder.as_markup(),
     )
@@ -114,6 +134,7 @@ async def generate_mix_by_tobacco(
     await callback.message.edit_text(
         "🔮 *Составляю микс...*",
         parse_mode="Markdown",
+        reply_markup=generation_menu(),
     )
 
     # Получаем выбранный табак
@@ -155,6 +176,7 @@ async def generate_mix_by_profile(
     await callback.message.edit_text(
         "🔮 *Составляю микс...*",
         parse_mode="Markdown",
+        reply_markup=generation_menu(),
     )
 
     # Сохраняем параметры для retry
@@ -180,6 +202,7 @@ async def generate_surprise_mix(
     await callback.message.edit_text(
         "🔮 *Составляю микс...*",
         parse_mode="Markdown",
+        reply_markup=generation_menu(),
     )
 
     # Сохраняем параметры для retry
@@ -216,6 +239,7 @@ async def retry_mix(
     await callback.message.edit_text(
         "🔮 *Составляю другой вариант...*",
         parse_mode="Markdown",
+        reply_markup=generation_menu(),
     )
 
     await _generate_mix(
@@ -235,6 +259,8 @@ async def _generate_mix(
     taste_profile: str = None,
 ) -> None:
     """Общая функция генерации микса."""
+    # Бюджет апдейта — по типу генерации
+    rebudget(request_type)
     try:
         # Получаем или создаём пользователя
         user = await get_or_create_user(
@@ -248,7 +274,6 @@ async def _generate_mix(
         result = await session.execute(
             select(Tobacco)
             .where(Tobacco.user_id == user.id)
-            .options(selectinload(Tobacco.category))
         )
         tobaccos = result.scalars().all()
 
@@ -261,14 +286,17 @@ async def _generate_mix(
             return
 
         # Формируем данные табаков
-        tobaccos_data = [
-            {
+        # Для табаков из каталога бренд и категория — канонические
+        registry = get_registry()
+        catalog = get_catalog()
+        tobaccos_data = []
+        for t in tobaccos:
+            entry = catalog.get(t.catalog_id)
+            tobaccos_data.append({
                 "name": t.name,
-                "brand": t.brand,
-                "category": t.category.name if t.category else None,
-            }
-            for t in tobaccos
-        ]
+                "brand": entry.brand if entry else t.brand,
+                "category": registry.name_for(t.category_id or (entry.category_id if entry else None)),
+            })
 
         # Получаем историю оценок
         result = await session.execute(
@@ -290,15 +318,22 @@ async def _generate_mix(
         recent_mixes = result.scalars().all()
         previous_names = [m.name for m in recent_mixes]
 
-        # Генерируем микс
-        recommendation = await llm_service.generate_mix(
-            tobaccos=tobaccos_data,
-            request_type=request_type,
-            base_tobacco=base_tobacco,
-            taste_profile=taste_profile,
-            liked_mixes=liked if liked else None,
-            disliked_mixes=disliked if disliked else None,
-            previous_mixes=previous_names if previous_names else None,
+        # Давние миксы из архива retention — по сигнатурам состава
+        archived = await archived_mixes(session, user.id)
+
+        # Генерируем микс; новый callback на этом сообщении её отменит
+        recommendation = await generations.run(
+            (callback.message.chat.id, callback.message.message_id),
+            llm_service.generate_mix(
+                tobaccos=tobaccos_data,
+                request_type=request_type,
+                base_tobacco=base_tobacco,
+                taste_profile=taste_profile,
+                liked_mixes=liked if liked else None,
+                disliked_mixes=disliked if disliked else None,
+                previous_mixes=previous_names if previous_names else None,
+                archived_mixes=archived if archived else None,
+            ),
         )
 
         # Сохраняем микс в БД
@@ -316,6 +351,12 @@ async def _generate_mix(
             request_type=request_type,
         )
         session.add(mix)
+        await session.flush()
+        await write_mix_components(
+            session, mix.id, components_dict,
+            {t.name.lower(): t.id for t in tobaccos},
+        )
+        await bump_counters(session, user.id, mixes_count=1)
         await session.commit()
         await session.refresh(mix)
 
@@ -334,6 +375,10 @@ async def _generate_mix(
             reply_markup=mix_rating_menu(mix.id),
         )
 
+    except GenerationCancelled:
+        # Пользователь ушёл: сообщение уже занято новым обработчиком,
+        # микс не сохраняем
+        pass
     except Exception as e:
         await callback.message.edit_text(
             f"❌ *Ошибка генерации*\n\n{str(e)}",
@@ -359,6 +404,7 @@ async def rate_mix(callback: CallbackQuery, session: AsyncSession) -> None:
     mix = result.scalar_one_or_none()
 
     if mix:
+        await bump_counters(session, mix.user_id, **rating_deltas(mix.rating, rating))
         mix.rating = rating
         await session.commit()
 
@@ -380,6 +426,10 @@ async def favorite_mix(callback: CallbackQuery, session: AsyncSession) -> None:
 
     if mix:
         mix.is_favorite = not mix.is_favorite
+        await bump_counters(
+            session, mix.user_id,
+            favorites_count=1 if mix.is_favorite else -1,
+        )
         await session.commit()
 
         if mix.is_favorite:
@@ -503,15 +553,14 @@ async def clear_all_favorites(callback: CallbackQuery, session: AsyncSession) ->
     )
 
     result = await session.execute(
-        select(Mix)
+        update(Mix)
         .where(Mix.user_id == user.id)
         .where(Mix.is_favorite == True)
+        .values(is_favorite=False)
+        .execution_options(synchronize_session=False)
     )
-    mixes = result.scalars().all()
-    
-    count = len(mixes)
-    for mix in mixes:
-        mix.is_favorite = False
+    count = result.rowcount
+    await bump_counters(session, user.id, favorites_count=-count)
     
     await session.commit()
     
@@ -0,0 +1,70 @@
+from aiogram import F, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import CallbackQuery, Message
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.utils import get_or_create_user
+from bot.handlers.collection import show_collection
+from bot.handlers.mix import select_base_tobacco
+from bot.keyboards.menus import search_prompt_menu, search_results_menu
+from bot.services.search import search_tobaccos
+
+router = Router()
+
+
+class SearchStates(StatesGroup):
+    """Состояния поиска по коллекции."""
+    waiting_query = State()
+
+
+@router.callback_query(F.data.startswith("search_tobacco:"))
+async def start_search(callback: CallbackQuery, state: FSMContext) -> None:
+    """Запрашивает строку поиска."""
+    target = callback.data.split(":", 1)[1]
+    await state.set_state(SearchStates.waiting_query)
+    await state.update_data(search_target=target)
+
+    await callback.message.edit_text(
+        "🔍 *Поиск по коллекции*\n\n"
+        "Напиши название, бренд или вкус.\n"
+        "_Можно с опечатками, по-русски или латиницей: «мята», «mint», «myata»_",
+        parse_mode="Markdown",
+        reply_markup=search_prompt_menu(target),
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("search_cancel:"))
+async def cancel_search(callback: CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
+    """Отменяет поиск и возвращает туда, откуда он был начат."""
+    await state.clear()
+    if callback.data.split(":", 1)[1] == "mix":
+        await select_base_tobacco(callback, session)
+    else:
+        await show_collection(callback, session)
+
+
+@router.message(SearchStates.waiting_query)
+async def process_search(message: Message, state: FSMContext, session: AsyncSession) -> None:
+    """Показывает найденные табаки."""
+    data = await state.get_data()
+    target = data.get("search_target", "collection")
+    await state.clear()
+
+    user = await get_or_create_user(
+        session,
+        telegram_id=message.from_user.id,
+        username=message.from_user.username,
+        first_name=message.from_user.first_name,
+    )
+
+    query = (message.text or "").strip()
+    results = [tobacco for tobacco, _ in await search_tobaccos(session, user, query)]
+
+    if results:
+        text = f"🔍 Найдено: {len(results)}"
+    else:
+        text = "😕 Ничего не нашлось. Попробуй другое написание или бренд."
+
+    await message.answer(text, reply_markup=search_results_menu(results, target))
@@ -4,7 +4,7 @@ from aiogram.types import CallbackQuery, Message
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.database.models import Tobacco, User
+from bot.database.models import User
 from bot.database.utils import get_or_create_user
 from bot.keyboards.menus import main_menu
 
@@ -44,16 +44,9 @@ async def cmd_start(message: Message, session: AsyncSession) -> None:
             reply_markup=main_menu(),
         )
     else:
-        # Считаем количество табаков
-        result = await session.execute(
-            select(Tobacco).where(Tobacco.user_id == user.id)
-        )
-        tobaccos = result.scalars().all()
-        count = len(tobaccos)
-
         await message.answer(
             f"👋 *С возвращением, {first_name}!*\n\n"
-            f"📦 В коллекции: *{count}* табаков\n\n"
+            f"📦 В коллекции: *{user.tobaccos_count}* табаков\n\n"
             "Что делаем?",
             parse_mode="Markdown",
             reply_markup=main_menu(),
@@ -71,11 +64,9 @@ async def show_main_menu(callback: CallbackQuery, session: AsyncSession) -> None
         first_name=callback.from_user.first_name,
     )
 
-    result = await session.execute(
-        select(Tobacco).where(Tobacco.user_id == user.id)
+    count = await session.scalar(
+        select(User.tobaccos_count).where(User.id == user.id)
     )
-    tobaccos = result.scalars().all()
-    count = len(tobaccos)
 
     await callback.message.edit_text(
         "🏠 *Главное меню*\n\n"
@@ -3,6 +3,8 @@ from typing import Any, List
 from aiogram.types import InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from bot.database.categories import get_registry
+
 
 def main_menu() -> InlineKeyboardMarkup:
     """Главное меню бота."""
@@ -43,8 +45,9 @@ def collection_menu(
     page_tobaccos = tobaccos[start_idx:end_idx]
 
     # Кнопки табаков
+    registry = get_registry()
     for tobacco in page_tobaccos:
-        emoji = tobacco.category.emoji if tobacco.category else "🔸"
+        emoji = registry.emoji_for(tobacco.category_id)
         brand = f" • {tobacco.brand}" if tobacco.brand else ""
         text = f"{emoji} {tobacco.name}{brand}"
         builder.button(text=text, callback_data=f"tobacco:{tobacco.id}")
@@ -65,10 +68,11 @@ def collection_menu(
 
     # Нижние кнопки
     bottom = InlineKeyboardBuilder()
+    bottom.button(text="🔍 Поиск", callback_data="search_tobacco:collection")
     bottom.button(text="➕ Добавить", callback_data="add_tobacco")
     bottom.button(text="🗑 Удалить", callback_data="delete_mode")
     bottom.button(text="◀️ Меню", callback_data="main_menu")
-    bottom.adjust(2, 1)
+    bottom.adjust(1, 2, 1)
     builder.attach(bottom)
 
     return builder.as_markup()
@@ -181,6 +185,13 @@ def confirm_delete_all_menu(action: str) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+def generation_menu() -> InlineKeyboardMarkup:
+    """Кнопка отмены под статусом генерации (новый callback отменяет запрос к LLM)."""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✖️ Отменить", callback_data="mix_menu")
+    return builder.as_markup()
+
+
 def back_to_menu() -> InlineKeyboardMarkup:
     """Кнопка возврата в главное меню."""
     builder = InlineKeyboardBuilder()
@@ -198,6 +209,44 @@ def favorites_menu(has_favorites: bool = True) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+# Куда ведёт найденный табак: (префикс callback, кнопка «Назад»)
+SEARCH_TARGETS = {
+    "collection": ("tobacco", "collection"),
+    "mix": ("mix_with", "mix_by_tobacco"),
+}
+
+
+def search_prompt_menu(target: str) -> InlineKeyboardMarkup:
+    """Отмена поиска."""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="❌ Отмена", callback_data=f"search_cancel:{target}")
+    return builder.as_markup()
+
+
+def search_results_menu(results: List[dict], target: str) -> InlineKeyboardMarkup:
+    """Результаты поиска: карточка табака или выбор основы микса."""
+    prefix, back = SEARCH_TARGETS.get(target, SEARCH_TARGETS["collection"])
+    builder = InlineKeyboardBuilder()
+
+    registry = get_registry()
+    for tobacco in results:
+        emoji = registry.emoji_for(tobacco["category_id"])
+        brand = f" • {tobacco['brand']}" if tobacco["brand"] else ""
+        builder.button(
+            text=f"{emoji} {tobacco['name']}{brand}",
+            callback_data=f"{prefix}:{tobacco['id']}",
+        )
+    builder.adjust(1)
+
+    bottom = InlineKeyboardBuilder()
+    bottom.button(text="🔍 Искать ещё", callback_data=f"search_tobacco:{target}")
+    bottom.button(text="◀️ Назад", callback_data=back)
+    bottom.adjust(2)
+    builder.attach(bottom)
+
+    return builder.as_markup()
+
+
 def skip_brand_menu() -> InlineKeyboardMarkup:
     """Меню пропуска бренда при добавлении табака."""
     builder = InlineKeyboardBuilder()
@@ -1,15 +1,43 @@
 import asyncio
 import logging
+import math
+import time
 from typing import Any, Awaitable, Callable, Dict
 
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import BotCommand, TelegramObject
+from aiogram.types import BotCommand, CallbackQuery, Message, TelegramObject, User
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
 
 from bot.config import settings
-from bot.database.db import async_session, init_db
-from bot.handlers import collection, mix, start
+from bot.database.catalog import load_catalog
+from bot.database.categories import load_categories
+from bot.database.db import init_db, router
+from bot.database.identity import flush_loop, identity_cache
+from bot.database.retention import retention_loop
+from bot.handlers import collection, mix, search, start
+from bot.services.cache import cache
+from bot.services.deadline import DeadlineExceeded, deadline_scope
+from bot.services.generations import generations
+from bot.services.metrics import (
+    QueryStats,
+    bot_handler_seconds,
+    bot_update_db_queries,
+    bot_update_db_seconds,
+    bot_update_seconds,
+    bot_updates,
+    bot_updates_in_progress,
+    collect_cache,
+    current_queries,
+    handler_name,
+    instrument_engine,
+    rate_limit_rejected,
+    registry,
+    start_metrics_server,
+)
+from bot.services.profiler import profile_engine, profiling, report
+from bot.services.ratelimit import RateLimiter, rate_limiter
 
 # Логирование
 logging.basicConfig(
@@ -20,7 +48,7 @@ logger = logging.getLogger(__name__)
 
 
 class DatabaseMiddleware(BaseMiddleware):
-    """Middleware для инъекции сессии БД в handlers."""
+    """Middleware для инъекции сессии БД (в шарде пользователя) в handlers."""
 
     async def __call__(
         self,
@@ -28,11 +56,159 @@ class DatabaseMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        async with async_session() as session:
+        user: User = data.get("event_from_user")
+        async with router.session(user.id if user else None) as session:
             data["session"] = session
             return await handler(event, data)
 
 
+class DeadlineMiddleware(BaseMiddleware):
+    """Дедлайн на апдейт: его бюджет расходуют БД и LLM в обработчике.
+
+    Если бюджета не хватило, пользователь получает короткий ответ
+    вместо кнопки, которая так и не отреагировала.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        with deadline_scope():
+            try:
+                return await handler(event, data)
+            except DeadlineExceeded:
+                text = "⏳ Не успели ответить, попробуйте ещё раз"
+                if getattr(event, "callback_query", None) is not None:
+                    await event.callback_query.answer(text, show_alert=True)
+                elif getattr(event, "message", None) is not None:
+                    await event.message.answer(text)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Время, результат и запросы к БД каждого апдейта (outer на update)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_type = getattr(event, "event_type", "unknown")
+        stats = QueryStats()
+        token = current_queries.set(stats)
+        result = "error"
+        started = time.perf_counter()
+        bot_updates_in_progress.inc()
+        try:
+            response = await handler(event, data)
+            result = "unhandled" if response is UNHANDLED else "handled"
+            return response
+        finally:
+            bot_updates_in_progress.dec()
+            current_queries.reset(token)
+            bot_updates.labels(update_type, result).inc()
+            bot_update_seconds.labels(update_type).observe(time.perf_counter() - started)
+            bot_update_db_queries.labels(update_type).observe(stats.queries)
+            bot_update_db_seconds.labels(update_type).observe(stats.seconds)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время конкретного обработчика (inner: handler уже выбран фильтрами)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            bot_handler_seconds.labels(handler_name(data.get("handler"))).observe(
+                time.perf_counter() - started
+            )
+
+
+class ProfilerMiddleware(BaseMiddleware):
+    """Профиль SQL обработчика: предупреждение, если запросы повторяются (N+1)."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        with profiling(handler_name(data.get("handler"))) as profile:
+            result = await handler(event, data)
+        report(profile)
+        return result
+
+
+@registry.collector
+def collect_runtime_metrics() -> None:
+    collect_cache(cache.stats())
+    rate_limit_rejected.labels().set(rate_limiter.rejected)
+
+
+# Колбэки, запускающие генерацию микса через LLM
+GENERATION_CALLBACKS = ("mix_with:", "mix_profile:", "mix_surprise", "mix_retry")
+
+
+class SupersedeMiddleware(BaseMiddleware):
+    """Callback на сообщении с идущей генерацией отменяет её (outer на callback_query).
+
+    Стоит раньше лимитов: отмена срабатывает, даже если сам callback отклонён.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, CallbackQuery) and event.message is not None:
+            generations.cancel((event.message.chat.id, event.message.message_id))
+        return await handler(event, data)
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """Token bucket на пользователя: генерация и остальные события отдельно."""
+
+    def __init__(self, limiter: RateLimiter = rate_limiter):
+        self.limiter = limiter
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        is_generation = isinstance(event, CallbackQuery) and (event.data or "").startswith(
+            GENERATION_CALLBACKS
+        )
+        wait = await self.limiter.check("generate" if is_generation else "read", user.id)
+        if not wait:
+            return await handler(event, data)
+
+        seconds = max(math.ceil(wait), 1)
+        if is_generation:
+            text = f"⏳ Миксы подбираются не так часто. Попробуйте через {seconds} с"
+        else:
+            text = f"⏳ Слишком много запросов. Попробуйте через {seconds} с"
+        if isinstance(event, CallbackQuery):
+            await event.answer(text, show_alert=True)
+        elif isinstance(event, Message):
+            await event.answer(text)
+        return None
+
+
 async def set_commands(bot: Bot) -> None:
     """Устанавливает команды бота."""
     commands = [
@@ -44,29 +220,85 @@ async def set_commands(bot: Bot) -> None:
     await bot.set_my_commands(commands)
 
 
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер со всеми middleware и роутерами.
+
+    Роутеры хендлеров — глобальные объекты, поэтому диспетчер создаётся
+    один раз на процесс: боту (main) или стенду нагрузки (bot.bench).
+    """
+    dp = Dispatcher(storage=MemoryStorage())
+
+    # Middleware
+    dp.update.middleware(DeadlineMiddleware())
+    dp.update.middleware(DatabaseMiddleware())
+    dp.callback_query.outer_middleware(SupersedeMiddleware())
+    throttling = RateLimitMiddleware()
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+
+    # Журнал медленных запросов и профиль SQL на каждый обработчик
+    if settings.sql_profiler_enabled or settings.sql_slow_query_ms > 0:
+        for shard_engine in router.engines:
+            profile_engine(shard_engine)
+    if settings.sql_profiler_enabled:
+        profiler = ProfilerMiddleware()
+        dp.message.middleware(profiler)
+        dp.callback_query.middleware(profiler)
+
+    # Метрики: апдейт целиком и отдельные обработчики
+    if settings.metrics_enabled:
+        for shard_engine in router.engines:
+            instrument_engine(shard_engine)
+        dp.update.outer_middleware(UpdateMetricsMiddleware())
+        handler_metrics = HandlerMetricsMiddleware()
+        dp.message.middleware(handler_metrics)
+        dp.callback_query.middleware(handler_metrics)
+
+    # Роутеры
+    dp.include_router(start.router)
+    dp.include_router(collection.router)
+    dp.include_router(mix.router)
+    dp.include_router(search.router)
+    return dp
+
+
 async def main() -> None:
     """Главная функция запуска бота."""
     logger.info("Starting bot...")
 
     # Инициализация БД
     await init_db()
+    async with router.session() as session:
+        await load_categories(session)
+        await load_catalog(session)
     logger.info("Database initialized")
 
     # Создание бота и диспетчера
     bot = Bot(token=settings.bot_token)
-    dp = Dispatcher(storage=MemoryStorage())
+    dp = create_dispatcher()
 
-    # Middleware
-    dp.update.middleware(DatabaseMiddleware())
-
-    # Роутеры
-    dp.include_router(start.router)
-    dp.include_router(collection.router)
-    dp.include_router(mix.router)
+    metrics_server = None
+    if settings.metrics_enabled and settings.metrics_port:
+        metrics_server = await start_metrics_server(settings.metrics_host, settings.metrics_port)
 
     # Команды
     await set_commands(bot)
 
+    # Фоновый retention старых миксов
+    retention_tasks = []
+    if settings.mix_retention_days > 0:
+        retention_tasks = [
+            asyncio.create_task(retention_loop(session_factory, shard))
+            for shard, session_factory in enumerate(router.sessionmakers)
+        ]
+
+    await cache.start()
+
+    # Отложенная запись изменений профилей пользователей
+    flush_task = asyncio.create_task(
+        flush_loop(identity_cache, router, settings.identity_flush_interval)
+    )
+
     # Запуск
     await bot.delete_webhook(drop_pending_updates=True)
     logger.info("Bot started successfully!")
@@ -74,7 +306,15 @@ async def main() -> None:
     try:
         await dp.start_polling(bot)
     finally:
+        for task in retention_tasks:
+            task.cancel()
+        flush_task.cancel()
+        await asyncio.gather(flush_task, return_exceptions=True)
+        if metrics_server is not None:
+            metrics_server.close()
+        await cache.close()
         await bot.session.close()
+        await router.dispose()
         logger.info("Bot stopped")
 
 
@@ -0,0 +1,390 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from bot.config import settings
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+Listener = Callable[[bytes], None]
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class LRUStore:
+    """TTL/LRU словарь ключ → байты с ограничением по суммарному размеру."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> Optional[bytes]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] < monotonic():
+            self.pop(key)
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.pop(key)
+        cost = len(key) + len(value)
+        if cost > self.max_bytes:
+            return
+        self._items[key] = (monotonic() + ttl, value)
+        self.size += cost
+        while self.size > self.max_bytes:
+            old_key, (_, old_value) = self._items.popitem(last=False)
+            self.size -= len(old_key) + len(old_value)
+
+    def pop(self, key: str) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.size -= len(key) + len(item[1])
+
+    def clear(self) -> None:
+        self._items.clear()
+        self.size = 0
+
+
+# ============ БЭКЕНДЫ ============
+
+class MemoryBackend:
+    """Кэш в памяти процесса; pub/sub — между подписчиками этого процесса."""
+
+    def __init__(self, max_bytes: int):
+        self.store = LRUStore(max_bytes)
+        self._listeners: Dict[str, List[Listener]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.store.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.store.set(key, value, ttl)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.store.pop(key)
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        for listener in self._listeners.get(channel, ()):
+            listener(message)
+
+    async def subscribe(self, channel: str, listener: Listener) -> None:
+        self._listeners.setdefault(channel, []).append(listener)
+
+    async def close(self) -> None:
+        self._listeners.clear()
+
+
+class RespError(Exception):
+    """Ошибка, которую вернул Redis-совместимый сервер."""
+
+
+class RespConnection:
+    """Одно соединение по протоколу RESP2 (Redis): команда → ответ."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int, db: int = 0, password: Optional[str] = None):
+        reader, writer = await asyncio.open_connection(host, port)
+        connection = cls(reader, writer)
+        if password:
+            await connection.command("AUTH", password)
+        if db:
+            await connection.command("SELECT", db)
+        return connection
+
+    @staticmethod
+    def encode(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def send(self, *args) -> None:
+        self.writer.write(self.encode(*args))
+        await self.writer.drain()
+
+    async def read_reply(self) -> Any:
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Соединение с кэшем закрыто")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RespError(payload.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self.read_reply() for _ in range(length)]
+        raise RespError(f"Неизвестный ответ: {line!r}")
+
+    async def command(self, *args) -> Any:
+        await self.send(*args)
+        return await self.read_reply()
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+class RedisBackend:
+    """Кэш на Redis-совместимом сервере (redis://[:password@]host:port/db).
+
+    Одно соединение для команд (запросы по очереди под замком) и отдельное
+    для подписок. Недоступный сервер не ломает запросы: get возвращает
+    промах, set/delete пропускаются, соединение переоткрывается.
+    """
+
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.errors = 0
+        self._retry_at = 0.0
+        self._connection: Optional[RespConnection] = None
+        self._lock = asyncio.Lock()
+        self._listeners: Dict[str, List[Listener]] = {}
+        self._subscriber: Optional[asyncio.Task] = None
+
+    async def _drop_connection(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    async def _command(self, *args) -> Any:
+        # После сбоя сервер не дёргается RECONNECT_DELAY секунд
+        if monotonic() < self._retry_at:
+            return None
+        async with self._lock:
+            try:
+                if self._connection is None:
+                    self._connection = await RespConnection.open(
+                        self.host, self.port, self.db, self.password
+                    )
+                return await self._connection.command(*args)
+            except asyncio.CancelledError:
+                # Ответ на отправленную команду уже не прочитать
+                await self._drop_connection()
+                raise
+            except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                self.errors += 1
+                self._retry_at = monotonic() + self.RECONNECT_DELAY
+                await self._drop_connection()
+                logger.warning("Cache command %s failed: %s", args[0], e)
+                return None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._command("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._command("SET", key, value, "PX", max(int(ttl * 1000), 1))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._command("DEL", *keys)
+
+    async def publish(self, channel: str, message: bytes) -> None:
+        await self._command("PUBLISH", channel, message)
+
+    async def subscribe(self, channel: str, listener: Listener) -> None:
+        self._listeners.setdefault(channel, []).append(listener)
+        if self._subscriber is None:
+            self._subscriber = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        """Фоновое чтение подписок; при обрыве — переподключение."""
+        while True:
+            connection = None
+            try:
+                connection = await RespConnection.open(
+                    self.host, self.port, self.db, self.password
+                )
+                await connection.send("SUBSCRIBE", *self._listeners)
+                while True:
+                    reply = await connection.read_reply()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        for listener in self._listeners.get(reply[1].decode(), ()):
+                            listener(reply[2])
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, RespError) as e:
+                logger.warning("Cache subscription lost: %s", e)
+                await asyncio.sleep(self.RECONNECT_DELAY)
+            finally:
+                if connection is not None:
+                    await connection.close()
+
+    async def close(self) -> None:
+        if self._subscriber is not None:
+            self._subscriber.cancel()
+            await asyncio.gather(self._subscriber, return_exceptions=True)
+            self._subscriber = None
+        await self._drop_connection()
+
+
+# ============ КЭШ ============
+
+class Cache:
+    """Кэш с пространствами имён, TTL и ближним кэшем в памяти процесса.
+
+    Ключи бэкенда: ``<prefix>:<namespace>:<key>``. Ближний кэш держит
+    недавно прочитанные значения локально (короткий TTL); set и delete
+    рассылают ключ по каналу инвалидации, и остальные процессы
+    выбрасывают его из своих ближних кэшей.
+    """
+
+    def __init__(
+        self,
+        backend,
+        prefix: str = "hookah",
+        near: Optional[LRUStore] = None,
+        near_ttl: float = 5.0,
+    ):
+        self.backend = backend
+        self.prefix = prefix
+        self.near = near
+        self.near_ttl = near_ttl
+        self.channel = f"{prefix}:invalidate"
+        # Свои сообщения об инвалидации узнаём по метке процесса
+        self._origin = os.urandom(6).hex().encode()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def key(self, namespace: str, key: Any) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    async def start(self) -> None:
+        if self.near is not None:
+            await self.backend.subscribe(self.channel, self._on_invalidate)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    def _on_invalidate(self, message: bytes) -> None:
+        origin, _, key = message.partition(b" ")
+        if origin != self._origin and self.near is not None:
+            self.near.pop(key.decode())
+
+    def _count(self, counter: Dict[str, int], namespace: str) -> None:
+        counter[namespace] = counter.get(namespace, 0) + 1
+
+    async def get_bytes(self, namespace: str, key: Any) -> Optional[bytes]:
+        full_key = self.key(namespace, key)
+        value = self.near.get(full_key) if self.near is not None else None
+        if value is None:
+            value = await self.backend.get(full_key)
+            if value is not None and self.near is not None:
+                self.near.set(full_key, value, self.near_ttl)
+
+        self._count(self.hits if value is not None else self.misses, namespace)
+        return value
+
+    async def set_bytes(self, namespace: str, key: Any, value: bytes, ttl: float) -> None:
+        full_key = self.key(namespace, key)
+        await self.backend.set(full_key, value, ttl)
+        if self.near is not None:
+            self.near.set(full_key, value, min(ttl, self.near_ttl))
+            await self.backend.publish(self.channel, self._origin + b" " + full_key.encode())
+
+    async def get(self, namespace: str, key: Any) -> Any:
+        value = await self.get_bytes(namespace, key)
+        return _loads(value) if value is not None else None
+
+    async def set(self, namespace: str, key: Any, value: Any, ttl: float) -> None:
+        await self.set_bytes(namespace, key, _dumps(value), ttl)
+
+    async def delete(self, namespace: str, key: Any) -> None:
+        full_key = self.key(namespace, key)
+        await self.backend.delete(full_key)
+        if self.near is not None:
+            self.near.pop(full_key)
+            await self.backend.publish(self.channel, self._origin + b" " + full_key.encode())
+
+    async def get_or_set(
+        self,
+        namespace: str,
+        key: Any,
+        ttl: float,
+        compute: Callable[[], Awaitable[bytes]],
+    ) -> bytes:
+        """Байты из кэша или из compute() с сохранением."""
+        value = await self.get_bytes(namespace, key)
+        if value is None:
+            value = await compute()
+            await self.set_bytes(namespace, key, value, ttl)
+        return value
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            namespace: {
+                "hits": self.hits.get(namespace, 0),
+                "misses": self.misses.get(namespace, 0),
+            }
+            for namespace in sorted(set(self.hits) | set(self.misses))
+        }
+
+
+def create_cache(url: str = settings.cache_url) -> Cache:
+    """Кэш по CACHE_URL: пусто — память процесса, redis://… — общий сервер."""
+    if url.startswith("redis://"):
+        return Cache(
+            RedisBackend(url),
+            prefix=settings.cache_prefix,
+            near=LRUStore(settings.near_cache_max_bytes),
+            near_ttl=settings.near_cache_ttl,
+        )
+    if url:
+        raise ValueError(f"Неподдерживаемый CACHE_URL: {url}")
+    # В одном процессе ближний кэш не нужен: бэкенд и так локальный
+    return Cache(MemoryBackend(settings.cache_max_bytes), prefix=settings.cache_prefix)
+
+
+cache = create_cache()
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+from typing import Awaitable, Dict, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Сообщение с кнопками: (chat_id, message_id)
+MessageKey = Tuple[int, int]
+
+
+class GenerationCancelled(Exception):
+    """Генерацию заменил более новый callback на том же сообщении."""
+
+
+class GenerationRegistry:
+    """Генерации, привязанные к сообщению, на котором нажата кнопка.
+
+    Новый callback на том же сообщении значит, что пользователь ушёл
+    дальше (нажал «Отменить» или снова выбрал микс): текущий запрос
+    к LLM отменяется, и его результат не сохраняется.
+    """
+
+    def __init__(self):
+        self._running: Dict[MessageKey, asyncio.Task] = {}
+
+    async def run(self, key: MessageKey, work: Awaitable[T]) -> T:
+        """Выполняет work как отменяемую генерацию сообщения key.
+
+        Поднимает GenerationCancelled, если генерацию отменил cancel(key);
+        отмена самого обработчика пробрасывается как CancelledError.
+        """
+        task = asyncio.ensure_future(work)
+        self._running[key] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if task.cancelled() and not (current and current.cancelling()):
+                raise GenerationCancelled() from None
+            raise
+        finally:
+            if self._running.get(key) is task:
+                del self._running[key]
+
+    def cancel(self, key: MessageKey) -> bool:
+        """Отменяет генерацию сообщения key; True — если она шла."""
+        task = self._running.get(key)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        logger.info("Generation for message %s:%s superseded", *key)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._running)
+
+
+generations = GenerationRegistry()
@@ -0,0 +1,386 @@
+"""Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Реестр рассчитан на один event loop: счётчики меняются без блокировок,
+события SQLAlchemy выполняются в том же потоке. Значения, которые проще
+прочитать в момент опроса (статистика кэша, отказы лимитера), собираются
+функциями-коллекторами перед отрисовкой.
+"""
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Value:
+    """Значение счётчика или gauge для одного набора меток."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class HistogramValue:
+    """Гистограмма для одного набора меток: счётчики по корзинам, сумма, число."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new(self):
+        return Value()
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+            child = self._children[key] = self._new()
+        return child
+
+    def _samples(self, key: Tuple[str, ...], child) -> Iterator[Tuple[str, str, float]]:
+        yield self.name, _format_labels(self.labelnames, key), child.value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for key, child in list(self._children.items()):
+            for name, labels, value in self._samples(key, child):
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self, key, child: HistogramValue):
+        names = self.labelnames + ("le",)
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(names, key + (_format_value(float(bound)),))
+            yield f"{self.name}_bucket", labels, cumulative
+        labels = _format_labels(self.labelnames, key)
+        yield f"{self.name}_sum", labels, child.sum
+        yield f"{self.name}_count", labels, child.count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, func: Callable[[], None]) -> Callable[[], None]:
+        """Функция, обновляющая метрики перед каждым опросом (декоратор)."""
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> bytes:
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception:
+                logger.exception("Metrics collector failed")
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+registry = Registry()
+
+
+# ============ БАЗА ДАННЫХ ============
+
+db_queries = registry.counter("db_queries_total", "Выполненные SQL-запросы")
+db_query_seconds = registry.histogram(
+    "db_query_duration_seconds", "Время одного SQL-запроса", buckets=QUERY_BUCKETS
+)
+
+
+@dataclass
+class QueryStats:
+    """Запросы к БД в рамках одного апдейта бота."""
+    queries: int = 0
+    seconds: float = 0.0
+
+
+current_queries: ContextVar[Optional[QueryStats]] = ContextVar("current_queries", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    db_queries.inc()
+    db_query_seconds.observe(elapsed)
+    stats = current_queries.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+def _handle_error(context) -> None:
+    started = context.connection.info.get("query_started") if context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подписывает счётчики запросов на события engine (один раз на engine)."""
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+# ============ LLM ============
+
+llm_seconds = registry.histogram(
+    "llm_request_duration_seconds", "Время запроса к LLM", ["model"]
+)
+llm_tokens = registry.counter("llm_tokens_total", "Токены LLM", ["model", "kind"])
+llm_errors = registry.counter(
+    "llm_errors_total", "Ошибки LLM: api — запрос не удался, parse — ответ не разобран", ["model", "kind"]
+)
+llm_cancelled = registry.counter(
+    "llm_cancelled_total", "Запросы к LLM, отменённые до ответа (пользователь ушёл)", ["model"]
+)
+
+llm_fallbacks = registry.counter(
+    "llm_fallbacks_total", "Миксы, составленные локально: на LLM не хватило бюджета запроса", ["model"]
+)
+deadline_exhausted = registry.counter(
+    "deadline_exhausted_total", "Исчерпания бюджета времени запроса по фазам (db, llm)",
+    ["request_type", "phase"],
+)
+
+
+def observe_llm(model: str, seconds: float, usage) -> None:
+    """Учитывает успешный ответ LLM; usage — response.usage или None."""
+    llm_seconds.labels(model).observe(seconds)
+    if usage is not None:
+        llm_tokens.labels(model, "prompt").inc(usage.prompt_tokens or 0)
+        llm_tokens.labels(model, "completion").inc(usage.completion_tokens or 0)
+
+
+# ============ КЭШ И ЛИМИТЫ ============
+
+cache_requests = registry.counter(
+    "cache_requests_total", "Обращения к кэшу по пространствам имён", ["namespace", "result"]
+)
+cache_hit_ratio = registry.gauge(
+    "cache_hit_ratio", "Доля попаданий в кэш с запуска", ["namespace"]
+)
+rate_limit_rejected = registry.counter(
+    "rate_limit_rejected_total", "Запросы, отклонённые лимитом частоты"
+)
+
+
+def collect_cache(stats: Dict[str, Dict[str, int]]) -> None:
+    """Переносит счётчики Cache.stats() в метрики."""
+    for namespace, counts in stats.items():
+        hits, misses = counts["hits"], counts["misses"]
+        cache_requests.labels(namespace, "hit").set(hits)
+        cache_requests.labels(namespace, "miss").set(misses)
+        cache_hit_ratio.labels(namespace).set(hits / (hits + misses) if hits + misses else 0.0)
+
+
+# ============ RETENTION ============
+
+retention_mixes_removed = registry.counter(
+    "retention_mixes_removed_total", "Миксы, убранные retention", ["shard", "mode"]
+)
+retention_bytes_reclaimed = registry.counter(
+    "retention_bytes_reclaimed_total", "Оценка объёма данных, освобождённого retention", ["shard", "mode"]
+)
+retention_freelist_bytes = registry.gauge(
+    "retention_freelist_bytes", "Свободные страницы SQLite после последнего прогона retention", ["shard"]
+)
+
+
+# ============ АПДЕЙТЫ БОТА ============
+
+bot_updates = registry.counter(
+    "bot_updates_total", "Апдейты Telegram по типам и результату", ["type", "result"]
+)
+bot_update_seconds = registry.histogram(
+    "bot_update_duration_seconds", "Время обработки апдейта", ["type"]
+)
+bot_updates_in_progress = registry.gauge(
+    "bot_updates_in_progress", "Апдейты в обработке"
+)
+bot_handler_seconds = registry.histogram(
+    "bot_handler_duration_seconds", "Время работы обработчика", ["handler"]
+)
+bot_update_db_queries = registry.histogram(
+    "bot_update_db_queries", "SQL-запросов на апдейт", ["type"], buckets=COUNT_BUCKETS
+)
+bot_update_db_seconds = registry.histogram(
+    "bot_update_db_seconds", "Время в БД на апдейт", ["type"]
+)
+
+
+def handler_name(handler) -> str:
+    """mix.process_generate — модуль и имя функции обработчика."""
+    callback = getattr(handler, "callback", None)
+    if callback is None:
+        return "unknown"
+    module = getattr(callback, "__module__", "") or ""
+    return f"{module.rsplit('.', 1)[-1]}.{getattr(callback, '__name__', 'handler')}"
+
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+            status, content_type, body = b"200 OK", CONTENT_TYPE.encode(), registry.render()
+        else:
+            status, content_type, body = b"404 Not Found", b"text/plain", b"Not Found\n"
+        writer.write(
+            b"HTTP/1.1 " + status + b"\r\n"
+            b"Content-Type: " + content_type + b"\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+            b"Connection: close\r\n\r\n" + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.AbstractServer:
+    """Минимальный HTTP-сервер: GET /metrics отдаёт реестр."""
+    server = await asyncio.start_server(_serve_metrics, host, port)
+    logger.info("Metrics server listening on %s:%d", *server.sockets[0].getsockname()[:2])
+    return server
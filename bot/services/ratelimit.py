@@ -0,0 +1,153 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.config import settings
+from bot.database.models import RateBucket
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Бюджет token bucket: ёмкость (всплеск) и пополнение в токенах/сек."""
+    capacity: float
+    rate: float
+
+    @classmethod
+    def per_minute(cls, burst: float, per_minute: float) -> "Limit":
+        return cls(capacity=float(burst), rate=per_minute / 60.0)
+
+    def refill(self, tokens: float, elapsed: float) -> float:
+        return min(self.capacity, tokens + max(elapsed, 0.0) * self.rate)
+
+
+class MemoryBuckets:
+    """Вёдра в памяти процесса: LRU не больше maxsize ключей.
+
+    Ведро, которое успело наполниться, равно отсутствующему, поэтому
+    простаивающие вёдра выбрасываются с головы LRU при каждом обращении.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        # key → (токены, время обновления, момент, когда ведро снова полное)
+        self._items: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        """Списывает cost токенов. Возвращает 0 или сколько секунд ждать."""
+        now = time.monotonic()
+        while self._items:
+            oldest = next(iter(self._items.values()))
+            if oldest[2] > now:
+                break
+            self._items.popitem(last=False)
+
+        tokens, updated, _ = self._items.pop(key, (limit.capacity, now, now))
+        tokens = limit.refill(tokens, now - updated)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / limit.rate
+
+        self._items[key] = (tokens, now, now + (limit.capacity - tokens) / limit.rate)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return wait
+
+
+class DatabaseBuckets:
+    """Вёдра в таблице rate_buckets — общие для всех процессов с одной БД.
+
+    Списание — один условный UPDATE; строки простаивающих вёдер
+    периодически удаляются.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, session_factory: async_sessionmaker, idle_ttl: float):
+        self.session_factory = session_factory
+        self.idle_ttl = idle_ttl
+        self._calls = 0
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        now = time.time()
+        refill = RateBucket.tokens + (now - RateBucket.updated_at) * limit.rate
+        refilled = case((refill > limit.capacity, limit.capacity), else_=refill)
+
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(RateBucket)
+                .where(RateBucket.key == key, refilled >= cost)
+                .values(tokens=refilled - cost, updated_at=now)
+                .returning(RateBucket.key)
+            )
+            taken = result.first() is not None
+            wait = 0.0
+            if not taken:
+                row = (await session.execute(
+                    select(RateBucket.tokens, RateBucket.updated_at).where(RateBucket.key == key)
+                )).first()
+                if row is None:
+                    await session.execute(
+                        sqlite_insert(RateBucket)
+                        .values(key=key, tokens=limit.capacity - cost, updated_at=now)
+                        .on_conflict_do_nothing()
+                    )
+                else:
+                    tokens = limit.refill(row.tokens, now - row.updated_at)
+                    wait = max((cost - tokens) / limit.rate, 0.0)
+
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                await session.execute(
+                    delete(RateBucket).where(RateBucket.updated_at < now - self.idle_ttl)
+                )
+            await session.commit()
+        return wait
+
+
+class RateLimiter:
+    """Лимиты по пользователю и виду запроса (scope) поверх хранилища вёдер."""
+
+    def __init__(self, limits: Dict[str, Limit], store, enabled: bool = True):
+        self.limits = limits
+        self.store = store
+        self.enabled = enabled
+        self.rejected = 0
+
+    async def check(self, scope: str, key, cost: float = 1.0) -> float:
+        """0 — запрос разрешён, иначе секунды до следующей попытки."""
+        if not self.enabled:
+            return 0.0
+        wait = await self.store.take(f"{scope}:{key}", self.limits[scope], cost)
+        if wait:
+            self.rejected += 1
+        return wait
+
+
+def create_limiter() -> RateLimiter:
+    limits = {
+        "generate": Limit.per_minute(
+            settings.rate_limit_generate_burst, settings.rate_limit_generate_per_minute
+        ),
+        "read": Limit.per_minute(settings.rate_limit_read_burst, settings.rate_limit_read_per_minute),
+    }
+    if settings.rate_limit_store == "database":
+        from bot.database.db import router
+
+        idle_ttl = max(limit.capacity / limit.rate for limit in limits.values())
+        store = DatabaseBuckets(router.sessionmakers[0], idle_ttl)
+    else:
+        store = MemoryBuckets(settings.rate_limit_max_buckets)
+    return RateLimiter(limits, store, enabled=settings.rate_limit_enabled)
+
+
+rate_limiter = create_limiter()
@@ -0,0 +1,265 @@
+import heapq
+import re
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.config import settings
+from bot.database.models import Tobacco, User
+
+# Транслитерация кириллицы: индекс и запросы приводятся к латинице,
+# поэтому «Мята» и «myata» дают одни и те же триграммы
+TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e",
+    "ж": "zh", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "h", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+})
+
+# Основы русских названий вкусов → английские названия («Мята» ↔ «Mint»).
+# Ключи — основы, чтобы покрыть формы: мята, мятный, мятой. Сравнение идёт
+# после транслитерации, так что «myata» тоже раскрывается в «mint»
+FLAVOR_SYNONYMS = {
+    "мят": ("mint",),
+    "манг": ("mango",),
+    "арбуз": ("watermelon",),
+    "дын": ("melon",),
+    "лимон": ("lemon",),
+    "лайм": ("lime",),
+    "апельсин": ("orange",),
+    "мандарин": ("tangerine", "mandarin"),
+    "грейпфрут": ("grapefruit",),
+    "виноград": ("grape",),
+    "черник": ("blueberry",),
+    "голубик": ("blueberry",),
+    "клубник": ("strawberry",),
+    "земляник": ("strawberry",),
+    "малин": ("raspberry",),
+    "ежевик": ("blackberry",),
+    "смородин": ("currant",),
+    "вишн": ("cherry",),
+    "черешн": ("cherry",),
+    "персик": ("peach",),
+    "абрикос": ("apricot",),
+    "яблок": ("apple",),
+    "яблоч": ("apple",),
+    "груш": ("pear",),
+    "ананас": ("pineapple",),
+    "банан": ("banana",),
+    "кокос": ("coconut",),
+    "маракуй": ("passion", "passionfruit"),
+    "гранат": ("pomegranate",),
+    "киви": ("kiwi",),
+    "ягод": ("berry", "berries"),
+    "ванил": ("vanilla",),
+    "шоколад": ("chocolate",),
+    "кофе": ("coffee",),
+    "карамел": ("caramel",),
+    "кориц": ("cinnamon",),
+    "мед": ("honey",),
+    "жвачк": ("gum", "bubblegum"),
+    "кола": ("cola",),
+    "чай": ("tea",),
+    "роз": ("rose",),
+    "лед": ("ice",),
+    "холод": ("ice", "cool"),
+    "хвой": ("pine",),
+    "фисташ": ("pistachio",),
+    "орех": ("nut",),
+}
+
+# Вес полей в ранжировании
+FIELD_WEIGHTS = (("name", 3.0), ("brand", 1.5), ("notes", 0.5))
+
+# Совпадение через синоним чуть ниже прямого
+SYNONYM_WEIGHT = 0.9
+
+MIN_SIMILARITY = 0.3
+
+# Одна опечатка (замена, пропуск, лишняя буква, перестановка) — для слов от 4 букв
+TYPO_MIN_LENGTH = 4
+TYPO_SIMILARITY = 0.75
+
+_WORD = re.compile(r"\w+")
+
+_SYNONYM_STEMS = tuple(
+    (stem.translate(TRANSLIT), synonyms) for stem, synonyms in FLAVOR_SYNONYMS.items()
+)
+
+
+def _synonyms(word: str) -> Tuple[str, ...]:
+    for stem, synonyms in _SYNONYM_STEMS:
+        # Короткие основы («med», «chay») — только слово целиком или с окончанием
+        if word.startswith(stem) and (len(stem) > 3 or len(word) <= len(stem) + 1):
+            return synonyms
+    return ()
+
+
+def token_variants(word: str) -> List[Tuple[str, float]]:
+    """Латинские варианты слова с весом: транслитерация и английские синонимы."""
+    latin = word.lower().translate(TRANSLIT)
+    variants = {latin: 1.0} if latin else {}
+    for synonym in _synonyms(latin):
+        variants.setdefault(synonym, SYNONYM_WEIGHT)
+    return list(variants.items())
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _WORD.findall(text.lower()) if text else []
+
+
+def trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def deletes(token: str) -> set:
+    """Варианты слова без одной буквы (индекс опечаток, как в SymSpell)."""
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+class SearchIndex:
+    """Триграммный индекс табаков одного пользователя.
+
+    Словарь различных токенов индексируется по триграммам (похожесть,
+    префиксы) и по вариантам без одной буквы (опечатки); через постинги
+    запрос выходит на табаки с весом поля, где встретился токен.
+    """
+
+    def __init__(self, documents: Sequence[dict]):
+        self.documents = list(documents)
+        self._vocab: List[str] = []
+        self._vocab_trigrams: List[int] = []
+        self._token_ids: Dict[str, int] = {}
+        self._by_trigram: Dict[str, List[int]] = defaultdict(list)
+        self._by_delete: Dict[str, List[int]] = defaultdict(list)
+        self._postings: List[Dict[int, float]] = []
+
+        for doc_index, document in enumerate(self.documents):
+            for field, field_weight in FIELD_WEIGHTS:
+                for word in tokenize(document.get(field)):
+                    for variant, variant_weight in token_variants(word):
+                        weight = field_weight * variant_weight
+                        posting = self._postings[self._token_id(variant)]
+                        if posting.get(doc_index, 0.0) < weight:
+                            posting[doc_index] = weight
+
+    def _token_id(self, token: str) -> int:
+        token_id = self._token_ids.get(token)
+        if token_id is None:
+            token_id = len(self._vocab)
+            self._token_ids[token] = token_id
+            self._vocab.append(token)
+            grams = trigrams(token)
+            self._vocab_trigrams.append(len(grams))
+            for gram in grams:
+                self._by_trigram[gram].append(token_id)
+            if len(token) >= TYPO_MIN_LENGTH:
+                for variant in deletes(token) | {token}:
+                    self._by_delete[variant].append(token_id)
+            self._postings.append({})
+        return token_id
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _similar_tokens(self, token: str) -> Dict[int, float]:
+        """Токены словаря с похожестью (коэффициент Дайса по триграммам)."""
+        grams = trigrams(token)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for token_id in self._by_trigram.get(gram, ()):
+                shared[token_id] += 1
+
+        similar = {}
+        for token_id, count in shared.items():
+            score = 2 * count / (len(grams) + self._vocab_trigrams[token_id])
+            candidate = self._vocab[token_id]
+            if candidate == token:
+                score = 1.0
+            elif candidate.startswith(token):
+                score = max(score, 0.6 + 0.3 * len(token) / len(candidate))
+            if score >= MIN_SIMILARITY:
+                similar[token_id] = score
+
+        if len(token) >= TYPO_MIN_LENGTH:
+            for variant in deletes(token) | {token}:
+                for token_id in self._by_delete.get(variant, ()):
+                    if similar.get(token_id, 0.0) < TYPO_SIMILARITY:
+                        similar[token_id] = TYPO_SIMILARITY
+        return similar
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[dict, float]]:
+        """Ранжированные табаки по запросу: [(документ, оценка), ...]."""
+        scores: Dict[int, float] = defaultdict(float)
+        for word in tokenize(query):
+            best: Dict[int, float] = {}
+            for variant, variant_weight in token_variants(word):
+                for token_id, similarity in self._similar_tokens(variant).items():
+                    for doc_index, weight in self._postings[token_id].items():
+                        score = similarity * weight * variant_weight
+                        if score > best.get(doc_index, 0.0):
+                            best[doc_index] = score
+            for doc_index, score in best.items():
+                scores[doc_index] += score
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        top.sort(key=lambda item: (-item[1], self.documents[item[0]]["name"].lower()))
+        return [(self.documents[doc_index], round(score, 3)) for doc_index, score in top]
+
+
+class SearchIndexCache:
+    """Индексы по пользователям, действительные для версии данных.
+
+    Любое изменение коллекции сдвигает data_version, поэтому устаревший
+    индекс просто не находится и перестраивается при следующем поиске.
+    Ключ — telegram_id: users.id уникален только внутри шарда.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[int, Tuple[int, SearchIndex]]" = OrderedDict()
+
+    def get(self, telegram_id: int, version: int) -> Optional[SearchIndex]:
+        item = self._items.get(telegram_id)
+        if item is None or item[0] != version:
+            return None
+        self._items.move_to_end(telegram_id)
+        return item[1]
+
+    def put(self, telegram_id: int, version: int, documents: Iterable[dict]) -> SearchIndex:
+        index = SearchIndex(list(documents))
+        self._items[telegram_id] = (version, index)
+        self._items.move_to_end(telegram_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return index
+
+
+search_indexes = SearchIndexCache(maxsize=settings.search_index_cache_size)
+
+
+async def search_tobaccos(
+    session: AsyncSession, user: User, query: str, limit: int = 10
+) -> List[Tuple[dict, float]]:
+    """Ищет в коллекции пользователя, перестраивая индекс при смене data_version."""
+    result = await session.execute(select(User.data_version).where(User.id == user.id))
+    version = result.scalar_one_or_none() or 0
+
+    index = search_indexes.get(user.telegram_id, version)
+    if index is None:
+        result = await session.execute(
+            select(
+                Tobacco.id,
+                Tobacco.name,
+                Tobacco.brand,
+                Tobacco.category_id,
+                Tobacco.notes,
+            ).where(Tobacco.user_id == user.id)
+        )
+        index = search_indexes.put(user.telegram_id, version, [row._asdict() for row in result])
+
+    return index.search(query, limit)
@@ -0,0 +1,157 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl
+
+from config import settings
+from identity import Identity
+from sharding import current_epoch
+
+
+class AuthError(Exception):
+    """Ошибка проверки initData или токена сессии."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+# ============ TELEGRAM INITDATA ============
+
+def validate_init_data(init_data: str, bot_token: str, max_age: int = 86400) -> dict:
+    """Проверяет подпись Telegram WebApp initData и возвращает её поля.
+
+    Алгоритм из документации Telegram: secret = HMAC_SHA256("WebAppData", bot_token),
+    hash = HMAC_SHA256(secret, data_check_string).
+    """
+    if not bot_token:
+        raise AuthError("Bot token не настроен")
+
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received_hash = fields.pop("hash", None)
+    if not received_hash:
+        raise AuthError("В initData нет подписи")
+
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    expected_hash = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected_hash, received_hash):
+        raise AuthError("Неверная подпись initData")
+
+    auth_date = int(fields.get("auth_date", 0))
+    if max_age and time.time() - auth_date > max_age:
+        raise AuthError("initData устарела")
+
+    if "user" in fields:
+        fields["user"] = json.loads(fields["user"])
+    return fields
+
+
+# ============ SESSION TOKENS ============
+
+class SessionTokens:
+    """Короткоживущие подписанные токены сессии.
+
+    Формат: ``base64url(payload).base64url(HMAC_SHA256(payload))``, где payload —
+    компактный JSON с внутренним user.id, telegram_id, профилем, сроком жизни
+    и меткой схемы шардов. Проверка stateless: без БД и без повторной
+    проверки initData. Уже проверенные токены держатся в небольшом LRU, так
+    что повторные запросы с тем же токеном не пересчитывают даже подпись.
+
+    user.id уникален только в своём шарде, поэтому токен действителен лишь
+    при той схеме шардов, в которой выдан: после ребалансировки клиент
+    получает 401 и заново обменивает initData на токен.
+    """
+
+    def __init__(self, secret: bytes, ttl: int = 3600, cache_size: int = 4096, epoch: str = ""):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.epoch = epoch
+        self._mac = hmac.new(secret, digestmod=hashlib.sha256)
+        self._verified: "OrderedDict[str, Tuple[int, Identity]]" = OrderedDict()
+
+    def _sign(self, payload: bytes) -> str:
+        mac = self._mac.copy()
+        mac.update(payload)
+        return _b64encode(mac.digest())
+
+    def issue(self, identity: Identity) -> Tuple[str, int]:
+        """Выпускает токен для пользователя. Возвращает (токен, expires_at)."""
+        expires_at = int(time.time()) + self.ttl
+        payload = json.dumps(
+            [
+                identity.id, identity.telegram_id, identity.username, identity.first_name,
+                expires_at, self.epoch,
+            ],
+            separators=(",", ":"),
+            ensure_ascii=False,
+        ).encode()
+        return f"{_b64encode(payload)}.{self._sign(payload)}", expires_at
+
+    def verify(self, token: str) -> Identity:
+        """Проверяет токен и возвращает пользователя из него."""
+        cached = self._verified.get(token)
+        if cached is not None:
+            expires_at, identity = cached
+            if expires_at < time.time():
+                del self._verified[token]
+                raise AuthError("Токен истёк")
+            self._verified.move_to_end(token)
+            return identity
+
+        try:
+            encoded_payload, signature = token.split(".", 1)
+            payload = _b64decode(encoded_payload)
+        except (ValueError, TypeError):
+            raise AuthError("Некорректный токен")
+
+        if not hmac.compare_digest(self._sign(payload), signature):
+            raise AuthError("Неверная подпись токена")
+
+        try:
+            user_id, telegram_id, username, first_name, expires_at, epoch = json.loads(payload)
+        except (ValueError, TypeError):
+            raise AuthError("Некорректный токен")
+        if expires_at < time.time():
+            raise AuthError("Токен истёк")
+        if epoch != self.epoch:
+            raise AuthError("Токен выдан до перераспределения шардов")
+
+        identity = Identity(
+            id=user_id,
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+        )
+        self._verified[token] = (expires_at, identity)
+        while len(self._verified) > self.cache_size:
+            self._verified.popitem(last=False)
+        return identity
+
+
+def peek_telegram_id(token: str) -> Optional[int]:
+    """telegram_id из токена без проверки подписи (только для выбора шарда)."""
+    try:
+        return int(json.loads(_b64decode(token.split(".", 1)[0]))[1])
+    except (ValueError, TypeError, IndexError):
+        return None
+
+
+def _session_secret() -> bytes:
+    if settings.session_secret:
+        return settings.session_secret.encode()
+    # По умолчанию секрет выводится из токена бота
+    return hmac.new(b"SessionToken", settings.bot_token.encode(), hashlib.sha256).digest()
+
+
+session_tokens = SessionTokens(
+    _session_secret(), ttl=settings.session_token_ttl, epoch=current_epoch()
+)
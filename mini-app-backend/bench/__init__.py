@@ -0,0 +1 @@
+"""Бенчмарки backend. Запуск из каталога mini-app-backend: python -m bench.<модуль>."""
@@ -0,0 +1,67 @@
+"""Микробенчмарк проверки авторизации на запрос.
+
+Сравнивает полную проверку Telegram initData (то, что пришлось бы делать
+на каждом запросе без токенов) с проверкой токена сессии: первой
+(с подписью) и повторной (из LRU проверенных токенов).
+
+    python -m bench.auth_tokens [--number 20000]
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import time
+import timeit
+from urllib.parse import urlencode
+
+from auth import SessionTokens, validate_init_data
+from identity import Identity
+
+BOT_TOKEN = "123456:bench-token"
+
+
+def make_init_data(user_id: int = 42) -> str:
+    """Собирает корректно подписанную initData, как её отдаёт Telegram."""
+    fields = {
+        "auth_date": str(int(time.time())),
+        "query_id": "AAHdF6IQAAAAAN0XohDhrOrc",
+        "user": json.dumps(
+            {"id": user_id, "first_name": "Иван", "username": "ivan", "language_code": "ru"},
+            ensure_ascii=False,
+        ),
+    }
+    data_check_string = "\n".join(f"{k}={fields[k]}" for k in sorted(fields))
+    secret = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def bench(label: str, func, number: int) -> None:
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{label:<40} {seconds / number * 1e6:8.2f} µs/op")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    init_data = make_init_data()
+    identity = Identity(id=1, telegram_id=42, username="ivan", first_name="Иван")
+
+    tokens = SessionTokens(b"bench-secret", cache_size=0)
+    token, _ = tokens.issue(identity)
+    cached_tokens = SessionTokens(b"bench-secret")
+    cached_tokens.verify(token)
+
+    assert validate_init_data(init_data, BOT_TOKEN)["user"]["id"] == 42
+    assert tokens.verify(token) == identity
+
+    bench("initData HMAC validation", lambda: validate_init_data(init_data, BOT_TOKEN), args.number)
+    bench("session token issue", lambda: tokens.issue(identity), args.number)
+    bench("session token verify (signature)", lambda: tokens.verify(token), args.number)
+    bench("session token verify (cached)", lambda: cached_tokens.verify(token), args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""Нагрузочный бенчмарк API: сценарии пользователей на растущей конкурентности.
+
+Поднимает main:app в отдельном процессе uvicorn на временной SQLite,
+заполненной фоновыми пользователями, и локальный fake LLM
+(bench.fake_llm) с задержкой latency ± jitter. Затем на каждом уровне
+конкурентности N виртуальных пользователей проходят сценарий:
+
+    bootstrap → 200 табаков пачками → список → генерация ×2 →
+    оценка → избранное → история → избранные
+
+Для каждого эндпоинта печатаются p50/p95/p99 и пропускная способность
+уровня. Прогон повторяется --runs раз с чистой БД, замеры всех прогонов
+сводятся в одну выборку и сравниваются с сохранённым baseline: p50 хуже
+больше чем на --tolerance плюс --slack-ms (для p95 допуск вдвое шире)
+или падение пропускной способности — регрессия, код выхода 1.
+
+    python -m bench.load [--levels 1,4,16] [--rounds 3] [--llm-latency 0.3]
+    python -m bench.load --save-baseline   # обновить bench/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from bench.fake_llm import FakeLLMServer
+from bench.search import BRANDS, FLAVORS
+
+APP_DIR = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+# Фоновые пользователи получают id с этого смещения, виртуальные — после них
+SEED_USER_OFFSET = 1_000_000
+JOURNEY_USER_OFFSET = 2_000_000
+
+TOBACCOS_PER_JOURNEY = 200
+BULK_CHUNK = 50
+
+# p95 по ближайшему рангу отбрасывает лишь 5% выборки: на 32 замерах это
+# второй по величине, т. е. одна пауза на блокировке SQLite. Сравниваем p95
+# только когда в общей выборке прогонов над ним не меньше 5 значений;
+# допуск для него вдвое шире
+MIN_SAMPLES_P95 = 100
+P95_TOLERANCE_FACTOR = 2.0
+
+
+# ============ ЗАМЕРЫ ============
+
+@dataclass
+class LevelResult:
+    concurrency: int
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    requests: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "throughput": round(self.throughput, 2),
+            "requests": self.requests,
+            "endpoints": {
+                label: {
+                    "count": len(values),
+                    "p50": round(percentile(values, 50) * 1000, 2),
+                    "p95": round(percentile(values, 95) * 1000, 2),
+                    "p99": round(percentile(values, 99) * 1000, 2),
+                }
+                for label, values in sorted(self.latencies.items())
+            },
+        }
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Client:
+    """HTTP-клиент виртуального пользователя, пишущий задержки в LevelResult.
+
+    Любой ответ 4xx/5xx прерывает прогон: ошибка под нагрузкой — тоже регрессия.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, telegram_id: int, result: Optional[LevelResult]):
+        self.http = http
+        self.result = result
+        self.headers = {"X-Telegram-User-Id": str(telegram_id), "X-Telegram-First-Name": "Bench"}
+
+    async def request(self, label: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.http.request(method, url, headers=self.headers, **kwargs)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f"{label}: HTTP {response.status_code} {response.text[:200]}")
+        if self.result is not None:
+            self.result.requests += 1
+            self.result.latencies[label].append(elapsed)
+        return response
+
+
+def make_tobaccos(rng: random.Random, count: int) -> List[dict]:
+    names = set()
+    while len(names) < count:
+        names.add(f"{' '.join(rng.sample(FLAVORS, 2))} {rng.randrange(1000)}")
+    return [
+        {"name": name, "brand": rng.choice(BRANDS), "category_id": rng.randint(1, 10)}
+        for name in sorted(names)
+    ]
+
+
+# ============ СЦЕНАРИИ ============
+
+async def journey(client: Client, rng: random.Random) -> None:
+    """Полный сценарий нового пользователя."""
+    await client.request("GET /api/bootstrap", "GET", "/api/bootstrap")
+
+    tobaccos = make_tobaccos(rng, TOBACCOS_PER_JOURNEY)
+    for start in range(0, len(tobaccos), BULK_CHUNK):
+        await client.request(
+            "POST /api/tobaccos/bulk", "POST", "/api/tobaccos/bulk",
+            json={"tobaccos": tobaccos[start:start + BULK_CHUNK]},
+        )
+    await client.request("GET /api/tobaccos", "GET", "/api/tobaccos")
+
+    mix_ids = []
+    for payload in (
+        {"request_type": "surprise"},
+        {"request_type": "base", "base_tobacco": tobaccos[0]["name"]},
+    ):
+        response = await client.request(
+            "POST /api/mixes/generate", "POST", "/api/mixes/generate", json=payload
+        )
+        mix_ids.append(response.json()["id"])
+
+    await client.request(
+        "POST /api/mixes/{id}/rate", "POST", f"/api/mixes/{mix_ids[0]}/rate", json={"rating": 1}
+    )
+    await client.request(
+        "POST /api/mixes/{id}/favorite", "POST", f"/api/mixes/{mix_ids[1]}/favorite",
+        json={"is_favorite": True},
+    )
+    await client.request("GET /api/mixes", "GET", "/api/mixes")
+    await client.request("GET /api/mixes/favorites", "GET", "/api/mixes/favorites")
+
+
+async def seed_user(http: httpx.AsyncClient, telegram_id: int, rng: random.Random, tobaccos: int, mixes: int) -> None:
+    client = Client(http, telegram_id, None)
+    await client.request("seed", "POST", "/api/tobaccos/bulk", json={"tobaccos": make_tobaccos(rng, tobaccos)})
+    for i in range(mixes):
+        response = await client.request("seed", "POST", "/api/mixes/generate", json={"request_type": "surprise"})
+        if i % 3 == 0:
+            await client.request(
+                "seed", "POST", f"/api/mixes/{response.json()['id']}/rate",
+                json={"rating": rng.choice((-1, 1))},
+            )
+
+
+async def gather_limited(coroutines, limit: int) -> None:
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            await coroutine
+
+    await asyncio.gather(*(run(c) for c in coroutines))
+
+
+async def run_level(http: httpx.AsyncClient, concurrency: int, rounds: int, first_user: int, seed: int) -> LevelResult:
+    result = LevelResult(concurrency)
+
+    async def worker(index: int) -> None:
+        rng = random.Random(seed * 1000 + concurrency * 100 + index)
+        for round_ in range(rounds):
+            telegram_id = first_user + index * rounds + round_
+            await journey(Client(http, telegram_id, result), rng)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+# ============ ОКРУЖЕНИЕ ============
+
+async def wait_healthy(http: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn завершился с кодом {process.returncode}")
+        try:
+            if (await http.get("/api/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("API не поднялся за отведённое время")
+
+
+def start_app(database_url: str, llm_url: str, port: int, workers: int, log) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        DB_SHARDS="1",
+        BOT_TOKEN="",
+        LLM_API_URL=llm_url,
+        LLM_API_KEY="bench",
+        LLM_CACHE_TTL="0",
+        CACHE_URL="",
+        RATE_LIMIT_ENABLED="false",
+        SQL_PROFILER_ENABLED="false",
+        MIX_RETENTION_DAYS="0",
+        DRAIN_DELAY="0",
+    )
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+        ],
+        cwd=APP_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+# ============ ОТЧЁТ И BASELINE ============
+
+def print_level(summary: dict, concurrency: int) -> None:
+    print(
+        f"\n== concurrency {concurrency}: {summary['requests']} requests, "
+        f"{summary['throughput']:.1f} req/s"
+    )
+    print(f"{'endpoint':<34} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, stats in summary["endpoints"].items():
+        print(f"{label:<34} {stats['count']:>6} {stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['p99']:>9.1f}")
+
+
+def merge_runs(runs: List[dict]) -> dict:
+    """Сводит прогоны: задержки — в одну выборку, пропускная способность — медиана.
+
+    Паузы на блокировке SQLite случаются не в каждом прогоне, и p95 отдельного
+    прогона скачет в разы; по общей выборке хвост устойчивее.
+    """
+    merged = {"config": runs[0]["config"], "levels": {}}
+    for level in runs[0]["levels"]:
+        results = [run["levels"][level] for run in runs]
+        pooled = LevelResult(results[0].concurrency)
+        for result in results:
+            pooled.requests += result.requests
+            for label, values in result.latencies.items():
+                pooled.latencies[label].extend(values)
+        summary = pooled.summary()
+        summary["throughput"] = round(statistics.median(r.throughput for r in results), 2)
+        merged["levels"][level] = summary
+    return merged
+
+
+def compare(current: dict, baseline: dict, tolerance: float, slack_ms: float) -> List[str]:
+    """Регрессии относительно baseline: задержки эндпоинтов и пропускная способность уровней."""
+    problems = []
+    for level, base in baseline["levels"].items():
+        now = current["levels"].get(level)
+        if now is None:
+            continue
+        if now["throughput"] < base["throughput"] * (1 - tolerance):
+            problems.append(
+                f"concurrency {level}: throughput {now['throughput']:.1f} req/s "
+                f"< baseline {base['throughput']:.1f} req/s"
+            )
+        for label, stats in base["endpoints"].items():
+            got = now["endpoints"].get(label)
+            if got is None:
+                continue
+            checks = [("p50", tolerance)]
+            if min(stats["count"], got["count"]) >= MIN_SAMPLES_P95:
+                checks.append(("p95", tolerance * P95_TOLERANCE_FACTOR))
+            for key, allowed in checks:
+                limit = stats[key] * (1 + allowed) + slack_ms
+                if got[key] > limit:
+                    problems.append(
+                        f"concurrency {level}: {label} {key} {got[key]:.1f} ms "
+                        f"> baseline {stats[key]:.1f} ms (limit {limit:.1f} ms)"
+                    )
+    return problems
+
+
+async def run(args) -> dict:
+    tmp = tempfile.mkdtemp(prefix="hookah-bench-")
+    database_url = f"sqlite+aiosqlite:///{tmp}/bench.db"
+
+    llm = FakeLLMServer(latency=0.0, jitter=0.0, seed=args.seed)
+    llm_port = await llm.start("127.0.0.1", 0)
+    log_path = Path(tmp) / "app.log"
+    log = open(log_path, "wb")
+    process = start_app(database_url, f"http://127.0.0.1:{llm_port}/v1", args.port, args.workers, log)
+    print(f"API log: {log_path}")
+
+    limits = httpx.Limits(max_connections=max(args.levels) + 8, max_keepalive_connections=max(args.levels) + 8)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=60.0
+        ) as http:
+            await wait_healthy(http, process)
+
+            # Фоновые пользователи: LLM без задержки, чтобы не ждать заполнения
+            rng = random.Random(args.seed)
+            started = time.perf_counter()
+            await gather_limited(
+                (
+                    seed_user(http, SEED_USER_OFFSET + i, random.Random(rng.random()), args.seed_tobaccos, args.seed_mixes)
+                    for i in range(args.seed_users)
+                ),
+                limit=8,
+            )
+            print(f"Seeded {args.seed_users} users in {time.perf_counter() - started:.1f} s")
+
+            llm.latency, llm.jitter = args.llm_latency, args.llm_jitter
+            results = {}
+            first_user = JOURNEY_USER_OFFSET
+            for concurrency in args.levels:
+                level = await run_level(http, concurrency, args.rounds, first_user, args.seed)
+                first_user += concurrency * args.rounds
+                results[str(concurrency)] = level
+                print_level(level.summary(), concurrency)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        await llm.stop()
+
+    return {
+        "config": {
+            "levels": args.levels,
+            "rounds": args.rounds,
+            "runs": args.runs,
+            "workers": args.workers,
+            "seed_users": args.seed_users,
+            "seed_tobaccos": args.seed_tobaccos,
+            "seed_mixes": args.seed_mixes,
+            "llm_latency": args.llm_latency,
+            "llm_jitter": args.llm_jitter,
+        },
+        "levels": results,
+    }
+
+
+def parse_levels(value: str) -> List[int]:
+    return [int(level) for level in value.split(",") if level.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", type=parse_levels, default=[1, 4, 16], help="уровни конкурентности через запятую")
+    parser.add_argument("--rounds", type=int, default=2, help="сценариев на виртуального пользователя")
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--runs", type=int, default=3, help="прогонов с чистой БД; замеры сводятся в одну выборку")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--seed-users", type=int, default=100)
+    parser.add_argument("--seed-tobaccos", type=int, default=60)
+    parser.add_argument("--seed-mixes", type=int, default=6)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="записать результат как новый baseline")
+    parser.add_argument("--output", type=Path, help="куда сохранить результат (JSON)")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="допустимое ухудшение, доля")
+    parser.add_argument("--slack-ms", type=float, default=20.0, help="абсолютный запас к задержке, мс")
+    args = parser.parse_args()
+
+    runs = []
+    for index in range(args.runs):
+        if args.runs > 1:
+            print(f"\n##### run {index + 1}/{args.runs}")
+        runs.append(asyncio.run(run(args)))
+    current = merge_runs(runs)
+    if args.runs > 1:
+        print("\n##### all runs")
+        for level, summary in current["levels"].items():
+            print_level(summary, int(level))
+    if args.output:
+        args.output.write_text(json.dumps(current, indent=2, ensure_ascii=False) + "\n")
+
+    failed = False
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(current, indent=2, ensure_ascii=False) + "\n")
+        print(f"\nBaseline сохранён в {args.baseline}")
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("config") != current["config"]:
+            print(f"\nВнимание: параметры запуска отличаются от baseline: {baseline.get('config')}")
+        problems = compare(current, baseline, args.tolerance, args.slack_ms)
+        if problems:
+            print("\n" + "!" * 72)
+            print(f"РЕГРЕССИЯ относительно {args.baseline}:")
+            for problem in problems:
+                print(f"  - {problem}")
+            print("!" * 72)
+            failed = True
+        else:
+            print(f"\nВ пределах baseline ({args.baseline}, tolerance {args.tolerance:.0%})")
+    else:
+        print(f"\nBaseline {args.baseline} не найден; сохранить: --save-baseline")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
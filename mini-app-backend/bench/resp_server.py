@@ -0,0 +1,186 @@
+"""Локальный Redis-совместимый сервер для проверки кэша без Redis.
+
+Понимает подмножество RESP2, которым пользуется cache.RedisBackend:
+PING, ECHO, AUTH, SELECT, GET, SET (EX/PX/NX/XX), DEL, EXISTS, INCR,
+PEXPIRE, PTTL, DBSIZE, FLUSHDB, FLUSHALL, PUBLISH, SUBSCRIBE, UNSUBSCRIBE,
+QUIT. Данные живут в памяти процесса, сроки жизни проверяются при чтении.
+
+    python -m bench.resp_server [--host 127.0.0.1] [--port 6390]
+
+После запуска: CACHE_URL=redis://127.0.0.1:6390/0
+"""
+import argparse
+import asyncio
+from time import monotonic
+from typing import Dict, List, Optional, Set, Tuple
+
+from cache import RespConnection
+
+
+class RespServer:
+    def __init__(self):
+        self.dbs: Dict[int, Dict[bytes, Tuple[Optional[float], bytes]]] = {}
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    # ============ ПРОТОКОЛ ============
+
+    @staticmethod
+    def reply(value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, bool):
+            return b":%d\r\n" % int(value)
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, Exception):
+            return b"-ERR %s\r\n" % str(value).encode()
+        if isinstance(value, str):
+            return b"+%s\r\n" % value.encode()
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(RespServer.reply(v) for v in value)
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 6390) -> int:
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = RespConnection(reader, writer)
+        db = 0
+        subscribed: Set[bytes] = set()
+        try:
+            while True:
+                try:
+                    request = await connection.read_reply()
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                if not isinstance(request, list) or not request:
+                    continue
+                command, args = request[0].upper(), request[1:]
+
+                if command == b"QUIT":
+                    writer.write(self.reply("OK"))
+                    break
+                if command == b"SELECT":
+                    db = int(args[0])
+                    writer.write(self.reply("OK"))
+                elif command in (b"SUBSCRIBE", b"UNSUBSCRIBE"):
+                    for channel in args:
+                        members = self.channels.setdefault(channel, set())
+                        if command == b"SUBSCRIBE":
+                            subscribed.add(channel)
+                            members.add(writer)
+                        else:
+                            subscribed.discard(channel)
+                            members.discard(writer)
+                        kind = command.lower()
+                        writer.write(self.reply([kind, channel, len(subscribed)]))
+                else:
+                    writer.write(self.reply(self.execute(db, command, args)))
+                await writer.drain()
+        finally:
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
+
+    # ============ КОМАНДЫ ============
+
+    def _get(self, db: int, key: bytes) -> Optional[bytes]:
+        data = self.dbs.setdefault(db, {})
+        item = data.get(key)
+        if item is None:
+            return None
+        if item[0] is not None and item[0] <= monotonic():
+            del data[key]
+            return None
+        return item[1]
+
+    def execute(self, db: int, command: bytes, args: List[bytes]):
+        data = self.dbs.setdefault(db, {})
+        if command == b"PING":
+            return args[0] if args else "PONG"
+        if command == b"ECHO":
+            return args[0]
+        if command == b"AUTH":
+            return "OK"
+        if command == b"GET":
+            return self._get(db, args[0])
+        if command == b"SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            expires = None
+            for name, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+                if name in options:
+                    expires = monotonic() + int(args[2 + options.index(name) + 1]) * scale
+            exists = self._get(db, key) is not None
+            if (b"NX" in options and exists) or (b"XX" in options and not exists):
+                return None
+            data[key] = (expires, value)
+            return "OK"
+        if command == b"DEL":
+            deleted = 0
+            for key in args:
+                if self._get(db, key) is not None:
+                    del data[key]
+                    deleted += 1
+            return deleted
+        if command == b"EXISTS":
+            return sum(1 for key in args if self._get(db, key) is not None)
+        if command == b"INCR":
+            value = int(self._get(db, args[0]) or 0) + 1
+            expires = data[args[0]][0] if args[0] in data else None
+            data[args[0]] = (expires, str(value).encode())
+            return value
+        if command == b"PEXPIRE":
+            value = self._get(db, args[0])
+            if value is None:
+                return 0
+            data[args[0]] = (monotonic() + int(args[1]) / 1000, value)
+            return 1
+        if command == b"PTTL":
+            if self._get(db, args[0]) is None:
+                return -2
+            expires = data[args[0]][0]
+            return -1 if expires is None else int((expires - monotonic()) * 1000)
+        if command == b"DBSIZE":
+            return len(data)
+        if command == b"FLUSHDB":
+            data.clear()
+            return "OK"
+        if command == b"FLUSHALL":
+            self.dbs.clear()
+            return "OK"
+        if command == b"PUBLISH":
+            members = list(self.channels.get(args[0], ()))
+            message = self.reply([b"message", args[0], args[1]])
+            for member in members:
+                member.write(message)
+            return len(members)
+        return Exception(f"unknown command '{command.decode()}'")
+
+
+async def serve(host: str, port: int) -> None:
+    server = RespServer()
+    port = await server.start(host, port)
+    print(f"RESP stand-in listening on redis://{host}:{port}/0")
+    await server.server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
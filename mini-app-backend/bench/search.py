@@ -0,0 +1,63 @@
+"""Бенчмарк поиска по коллекции.
+
+Строит индекс по синтетической коллекции (по умолчанию 10 000 табаков)
+и замеряет время построения и медианную задержку запросов: точных,
+с опечатками, транслитом и русско-английскими синонимами.
+
+    python -m bench.search [--size 10000] [--repeat 50]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from search import SearchIndex
+
+FLAVORS = (
+    "Мята Манго Клубника Арбуз Дыня Лимон Лайм Виноград Персик Вишня Кокос "
+    "Шоколад Кофе Mint Ice Cola Berry Peach Cherry Banana Vanilla Grape Guava "
+    "Pineapple Pinkman Supernova Cactus Tropic Fresh Blue Red Green Wild Sweet Sour"
+).split()
+BRANDS = "Darkside Musthave Element Tangiers Sebero Blackburn Duft Satyr Overdose".split()
+NOTES = (None, None, "свежий и сладкий", "кислинка", "очень мятный холодок")
+
+QUERIES = ("Мята", "myata", "mint", "mnit", "клубника лед", "pinkmn", "darksid", "су", "sweet cola")
+
+
+def make_documents(size: int) -> list:
+    rng = random.Random(1)
+    return [
+        {
+            "id": i,
+            "name": " ".join(rng.sample(FLAVORS, 2)),
+            "brand": rng.choice(BRANDS),
+            "notes": rng.choice(NOTES),
+            "category_id": None,
+        }
+        for i in range(1, size + 1)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    documents = make_documents(args.size)
+    started = time.perf_counter()
+    index = SearchIndex(documents)
+    print(f"index build ({args.size} tobaccos): {(time.perf_counter() - started) * 1e3:.1f} ms")
+
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            results = index.search(query, limit=20)
+            timings.append(time.perf_counter() - started)
+        top = ", ".join(doc["name"] for doc, _ in results[:2])
+        print(f"{query:<14} {statistics.median(timings) * 1e3:7.2f} ms  {top}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Бенчмарк сериализации списков табаков и миксов.
+
+Сравнивает путь через response_model (валидация каждой строки в
+TobaccoResponse/MixResponse и кодирование JSON) с быстрым путём
+serialization.py (кортежи колонок → dict → orjson). Для каждого
+размера выводится время и процессорное время на один запрос.
+
+    python -m bench.serialization [--rows 500 5000] [--repeat 20]
+"""
+import argparse
+import json
+import statistics
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List
+
+from pydantic import TypeAdapter
+
+import categories
+import serialization
+from categories import CategoryInfo, CategoryRegistry
+from schemas import MixResponse, TobaccoResponse
+
+CATEGORIES = [
+    CategoryInfo(id=i, name=f"Категория {i}", emoji="🍃", taste_profile="свежий")
+    for i in range(1, 11)
+]
+
+TobaccoRow = namedtuple("TobaccoRow", [c.key for c in serialization.TOBACCO_COLUMNS])
+MixRow = namedtuple("MixRow", [c.key for c in serialization.MIX_COLUMNS])
+
+
+def make_tobaccos(count: int) -> List[TobaccoRow]:
+    start = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    return [
+        TobaccoRow(
+            id=i,
+            user_id=1,
+            name=f"Табак {i}",
+            brand="Darkside" if i % 3 else None,
+            category_id=i % 10 + 1 if i % 7 else None,
+            notes="Заметка" if i % 5 == 0 else None,
+            catalog_id=i if i % 2 else None,
+            created_at=start + timedelta(minutes=i),
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def make_mixes(count: int) -> List[MixRow]:
+    start = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    return [
+        MixRow(
+            id=i,
+            user_id=1,
+            name=f"Микс {i}",
+            components={
+                "Мята": {"portion": 40, "role": "база"},
+                "Манго": {"portion": 35, "role": "дополнение"},
+                "Лимон": {"portion": 25, "role": "акцент"},
+            },
+            description="Свежий фруктовый микс с мятной прохладой",
+            tips="Забивать воздушно, прогрев 5 минут",
+            request_type="surprise",
+            rating=(1, -1, None)[i % 3],
+            is_favorite=i % 4 == 0,
+            created_at=start + timedelta(minutes=i),
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def as_orm(rows, with_category: bool = False) -> list:
+    """Объекты с атрибутами, как их отдаёт ORM для response_model."""
+    objects = []
+    for row in rows:
+        obj = SimpleNamespace(**row._asdict())
+        if with_category:
+            info = categories.get_registry().get(row.category_id)
+            obj.category = SimpleNamespace(**info.__dict__) if info else None
+        objects.append(obj)
+    return objects
+
+
+def response_model_json(adapter: TypeAdapter, objects: list) -> bytes:
+    """Старый путь FastAPI: валидация в схему, jsonable-дамп, json.dumps."""
+    content = adapter.dump_python(
+        adapter.validate_python(objects, from_attributes=True), mode="json"
+    )
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def response_model_dump_json(adapter: TypeAdapter, objects: list) -> bytes:
+    """Новые версии FastAPI: валидация в схему и dump_json в pydantic-core."""
+    return adapter.dump_json(adapter.validate_python(objects, from_attributes=True))
+
+
+def measure(func, repeat: int):
+    """Медианы времени и процессорного времени на вызов, мс."""
+    wall, cpu = [], []
+    for _ in range(repeat):
+        w0, c0 = time.perf_counter(), time.process_time()
+        func()
+        wall.append(time.perf_counter() - w0)
+        cpu.append(time.process_time() - c0)
+    return statistics.median(wall) * 1e3, statistics.median(cpu) * 1e3
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[500, 5000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # Реестр категорий без БД: синтетические категории
+    categories._registry = CategoryRegistry(CATEGORIES)
+
+    encoder = "orjson" if serialization.orjson is not None else "json"
+    print(f"fast path encoder: {encoder}")
+    print(f"{'endpoint':<12} {'rows':>6} {'path':<28} {'wall ms':>9} {'cpu ms':>9}")
+
+    cases = [
+        ("tobaccos", make_tobaccos, TobaccoResponse, serialization.serialize_tobacco, True),
+        ("mixes", make_mixes, MixResponse, serialization.serialize_mix, False),
+    ]
+    for label, make_rows, model, serialize, with_category in cases:
+        adapter = TypeAdapter(List[model])
+        for count in args.rows:
+            rows = make_rows(count)
+            objects = as_orm(rows, with_category)
+
+            fast = serialization.dumps([serialize(row) for row in rows])
+            assert fast == response_model_dump_json(adapter, objects), "schema mismatch"
+
+            paths = [
+                ("response_model + json.dumps", lambda: response_model_json(adapter, objects)),
+                ("response_model + dump_json", lambda: response_model_dump_json(adapter, objects)),
+                (f"columns + {encoder}", lambda: serialization.dumps([serialize(row) for row in rows])),
+            ]
+            for name, func in paths:
+                wall, cpu = measure(func, args.repeat)
+                print(f"{label:<12} {count:>6} {name:<28} {wall:>9.2f} {cpu:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Бюджет холодного старта API.
+
+Проверяет то, что ждёт первый запрос после пробуждения инстанса:
+
+* импорт main под -X importtime: общее время (медиана --repeat запусков),
+  самые тяжёлые импорты и модули, которых при старте быть не должно
+  (клиент LLM импортируется лениво);
+* запуск uvicorn: время до первого ответа /api/health, до первого
+  запроса к БД и до готовности /api/ready (LLM — локальный fake) — на
+  новой базе (создание схемы) и повторно на той же (схема сверена,
+  create_all пропускается).
+
+Превышение любого бюджета или запрещённый импорт — код выхода 1.
+
+    python -m bench.startup [--import-budget 1.5] [--health-budget 3] [--db-budget 5] [--ready-budget 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import httpx
+
+from bench.fake_llm import FakeLLMServer
+from bench.load import APP_DIR, start_app, wait_healthy
+
+# Модули, импорт которых при старте — регрессия холодного старта
+FORBIDDEN_IMPORTS = ("openai",)
+
+
+# ============ ИМПОРТ ============
+
+def import_profile(module: str = "main") -> Dict[str, Tuple[int, int, int]]:
+    """Импорт module в чистом интерпретаторе: имя → (self µs, cumulative µs, глубина)."""
+    env = dict(os.environ, LLM_API_KEY=os.environ.get("LLM_API_KEY", "bench"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        profile[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return profile
+
+
+def check_imports(repeat: int, budget: float, top: int) -> List[str]:
+    profiles = [import_profile() for _ in range(repeat)]
+    total = statistics.median(profile["main"][1] for profile in profiles) / 1e6
+    print(f"import main: {total:.3f} s (median of {repeat}, budget {budget} s)")
+
+    # Прямые импорты main — из последнего прогона
+    direct = sorted(
+        ((name, cumulative) for name, (_, cumulative, depth) in profiles[-1].items() if depth == 1),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    for name, cumulative in direct[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    problems = []
+    if total > budget:
+        problems.append(f"import main: {total:.3f} s > {budget} s")
+    for name in FORBIDDEN_IMPORTS:
+        if any(module == name or module.startswith(name + ".") for module in profiles[-1]):
+            problems.append(f"{name} is imported at startup")
+    return problems
+
+
+# ============ ЗАПУСК ============
+
+async def wait_db(http: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    """Первый запрос, которому нужна БД (режим разработки, без BOT_TOKEN)."""
+    headers = {"X-Telegram-User-Id": "1", "X-Telegram-First-Name": "Startup"}
+    response = await http.get("/api/tobaccos", headers=headers, timeout=timeout)
+    response.raise_for_status()
+
+
+async def wait_ready(http: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while (await http.get("/api/ready")).status_code != 200:
+        if time.monotonic() > deadline:
+            raise RuntimeError("/api/ready не стал готовым за отведённое время")
+        await asyncio.sleep(0.02)
+
+
+async def measure_start(database_url: str, llm_url: str, port: int, log) -> Tuple[float, float, float]:
+    """Секунды от запуска процесса до /api/health, первого запроса к БД и /api/ready."""
+    started = time.perf_counter()
+    process = start_app(database_url, llm_url, port, 1, log)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as http:
+            await wait_healthy(http, process)
+            health = time.perf_counter() - started
+            await wait_db(http)
+            db = time.perf_counter() - started
+            await wait_ready(http)
+            return health, db, time.perf_counter() - started
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def check_start(args) -> List[str]:
+    tmp = tempfile.mkdtemp(prefix="hookah-startup-")
+    database_url = f"sqlite+aiosqlite:///{tmp}/startup.db"
+    log_path = Path(tmp) / "app.log"
+    llm = FakeLLMServer(latency=0.0, jitter=0.0)
+    llm_url = f"http://127.0.0.1:{await llm.start('127.0.0.1', 0)}/v1"
+    problems = []
+    try:
+        with open(log_path, "wb") as log:
+            for label in ("new database", "existing database"):
+                health, db, ready = await measure_start(database_url, llm_url, args.port, log)
+                print(
+                    f"{label}: /api/health {health:.2f} s, first DB request {db:.2f} s, "
+                    f"/api/ready {ready:.2f} s"
+                )
+                for name, value, budget in (
+                    ("/api/health", health, args.health_budget),
+                    ("first DB request", db, args.db_budget),
+                    ("/api/ready", ready, args.ready_budget),
+                ):
+                    if value > budget:
+                        problems.append(f"{label}: {name} {value:.2f} s > {budget} s")
+    finally:
+        await llm.stop()
+    print(f"API log: {log_path}")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="запусков импорта для медианы")
+    parser.add_argument("--import-budget", type=float, default=1.5, help="импорт main, с")
+    parser.add_argument("--health-budget", type=float, default=3.0, help="до ответа /api/health, с")
+    parser.add_argument("--db-budget", type=float, default=5.0, help="до первого запроса к БД, с")
+    parser.add_argument("--ready-budget", type=float, default=5.0, help="до готовности /api/ready, с")
+    parser.add_argument("--top", type=int, default=10, help="сколько тяжёлых импортов показать")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--imports-only", action="store_true", help="без запуска uvicorn")
+    args = parser.parse_args()
+
+    problems = check_imports(args.repeat, args.import_budget, args.top)
+    if not args.imports_only:
+        problems += asyncio.run(check_start(args))
+
+    if problems:
+        print("\nCOLD START REGRESSION:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("\nCold start within budget")
+
+
+if __name__ == "__main__":
+    main()
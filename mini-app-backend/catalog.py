@@ -0,0 +1,331 @@
+import asyncio
+import csv
+import json
+import logging
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import CatalogItem, Category
+from search import TRANSLIT
+
+logger = logging.getLogger(__name__)
+
+# Сколько лучших записей хранит узел префиксного дерева; больше подсказок
+# по одному виду не найти, поэтому это и предел limit в /api/catalog/suggest
+NODE_CAPACITY = 20
+
+
+def normalize(text: str) -> str:
+    """Ключ сравнения: нижний регистр, ё → е, одиночные пробелы."""
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """Запись каталога в памяти процесса."""
+    id: int
+    kind: str
+    name: str
+    brand_id: Optional[int]
+    brand: Optional[str]
+    category_id: Optional[int]
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class PrefixTrie:
+    """Префиксное дерево: узел хранит до NODE_CAPACITY id в порядке вставки.
+
+    Записи вставляются уже отсортированными по приоритету, поэтому
+    подсказка — это спуск по префиксу без обхода поддерева.
+    """
+
+    def __init__(self):
+        self._root: Tuple[dict, list] = ({}, [])
+
+    def insert(self, key: str, entry_id: int) -> None:
+        node = self._root
+        for char in key:
+            node = node[0].setdefault(char, ({}, []))
+            if len(node[1]) < NODE_CAPACITY and entry_id not in node[1]:
+                node[1].append(entry_id)
+
+    def find(self, prefix: str) -> List[int]:
+        node = self._root
+        for char in prefix:
+            node = node[0].get(char)
+            if node is None:
+                return []
+        return node[1]
+
+
+class Catalog:
+    """Неизменяемый каталог брендов и вкусов с автодополнением."""
+
+    def __init__(self, entries: Iterable[CatalogEntry] = ()):
+        ordered = sorted(
+            entries, key=lambda e: (e.kind != "brand", len(e.name), e.name.lower())
+        )
+        self.entries: Dict[int, CatalogEntry] = {e.id: e for e in ordered}
+        self._tries = {"brand": PrefixTrie(), "flavor": PrefixTrie()}
+        self._exact: Dict[Tuple[str, Optional[int], str], CatalogEntry] = {}
+        self._flavors_by_name: Dict[str, List[CatalogEntry]] = defaultdict(list)
+        self._flavors_by_brand: Dict[int, List[CatalogEntry]] = defaultdict(list)
+
+        for entry in ordered:
+            key = normalize(entry.name)
+            self._exact[(entry.kind, entry.brand_id, key)] = entry
+            if entry.kind == "flavor":
+                self._flavors_by_name[key].append(entry)
+                if entry.brand_id is not None:
+                    self._flavors_by_brand[entry.brand_id].append(entry)
+
+            trie = self._tries[entry.kind]
+            for text in self._keys(entry):
+                trie.insert(text, entry.id)
+
+    @staticmethod
+    def _keys(entry: CatalogEntry) -> List[str]:
+        """Ключи записи: каждое слово названия (и «бренд вкус») и их транслит."""
+        texts = [normalize(entry.name)]
+        if entry.brand:
+            texts.append(normalize(f"{entry.brand} {entry.name}"))
+
+        keys = []
+        for text in texts:
+            words = text.split(" ")
+            for i in range(len(words)):
+                suffix = " ".join(words[i:])
+                keys.append(suffix)
+                keys.append(suffix.translate(TRANSLIT))
+        return list(dict.fromkeys(keys))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, entry_id: Optional[int]) -> Optional[CatalogEntry]:
+        return self.entries.get(entry_id) if entry_id is not None else None
+
+    def suggest(
+        self,
+        query: str,
+        limit: int = 10,
+        kind: Optional[str] = None,
+        brand_id: Optional[int] = None,
+    ) -> List[CatalogEntry]:
+        """Подсказки по префиксу: сначала бренды, затем короткие названия."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        prefixes = dict.fromkeys((prefix, prefix.translate(TRANSLIT)))
+
+        if brand_id is not None:
+            # Вкусы одного бренда — немного, проверяем их напрямую
+            return [
+                entry
+                for entry in self._flavors_by_brand.get(brand_id, ())
+                if any(key.startswith(p) for key in self._keys(entry) for p in prefixes)
+            ][:limit]
+
+        kinds = (kind,) if kind else ("brand", "flavor")
+        found: List[CatalogEntry] = []
+        for trie_kind in kinds:
+            for p in prefixes:
+                for entry_id in self._tries[trie_kind].find(p):
+                    entry = self.entries[entry_id]
+                    if entry not in found:
+                        found.append(entry)
+        return found[:limit]
+
+    def match(self, name: str, brand: Optional[str] = None) -> Optional[CatalogEntry]:
+        """Вкус каталога по точному названию (и бренду, если указан).
+
+        Без бренда совпадение засчитывается, только если вкус с таким
+        названием в каталоге один.
+        """
+        key = normalize(name)
+        if brand:
+            brand_entry = self._exact.get(("brand", None, normalize(brand)))
+            if brand_entry is None:
+                return None
+            return self._exact.get(("flavor", brand_entry.id, key))
+
+        candidates = self._flavors_by_name.get(key, [])
+        return candidates[0] if len(candidates) == 1 else None
+
+
+_catalog = Catalog()
+
+
+def get_catalog() -> Catalog:
+    """Текущий каталог процесса."""
+    return _catalog
+
+
+async def load_catalog(session: AsyncSession) -> Catalog:
+    """Загружает каталог из БД и строит префиксные деревья."""
+    global _catalog
+    result = await session.execute(
+        select(
+            CatalogItem.id,
+            CatalogItem.kind,
+            CatalogItem.name,
+            CatalogItem.brand_id,
+            CatalogItem.category_id,
+        )
+    )
+    rows = result.all()
+    brands = {row.id: row.name for row in rows if row.kind == "brand"}
+    _catalog = Catalog(
+        CatalogEntry(
+            id=row.id,
+            kind=row.kind,
+            name=row.name,
+            brand_id=row.brand_id,
+            brand=brands.get(row.brand_id),
+            category_id=row.category_id,
+        )
+        for row in rows
+    )
+    return _catalog
+
+
+# ============ ЗАГРУЗКА ДАМПА ============
+
+def read_dump(path: Path) -> List[dict]:
+    """Читает дамп: CSV (brand,flavor[,category]) или JSON.
+
+    JSON — список записей {"brand", "flavor", "category"} или
+    {"brand", "flavors": [...]}.
+    """
+    if path.suffix.lower() == ".csv":
+        with path.open(encoding="utf-8-sig", newline="") as f:
+            return [
+                {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+                for row in csv.DictReader(f)
+            ]
+
+    records = []
+    for item in json.loads(path.read_text(encoding="utf-8")):
+        flavors = item.get("flavors")
+        if flavors is None:
+            records.append(item)
+            continue
+        for flavor in flavors:
+            if isinstance(flavor, dict):
+                records.append({"brand": item.get("brand"), **flavor})
+            else:
+                records.append({"brand": item.get("brand"), "flavor": flavor,
+                                "category": item.get("category")})
+    return records
+
+
+async def import_records(
+    session: AsyncSession, records: Iterable[dict], batch_size: int = 1000
+) -> Tuple[int, int]:
+    """Добавляет в каталог новые бренды и вкусы (дубликаты пропускаются).
+
+    Возвращает (добавлено брендов, добавлено вкусов).
+    """
+    result = await session.execute(select(Category.id, Category.name))
+    categories = {normalize(name): category_id for category_id, name in result.all()}
+
+    result = await session.execute(
+        select(CatalogItem.id, CatalogItem.kind, CatalogItem.normalized, CatalogItem.brand_id)
+    )
+    brand_ids: Dict[str, int] = {}
+    known_flavors = set()
+    for row in result.all():
+        if row.kind == "brand":
+            brand_ids[row.normalized] = row.id
+        else:
+            known_flavors.add((row.brand_id, row.normalized))
+
+    records = [r for r in records if (r.get("brand") or "").strip()]
+
+    # Бренды — одним INSERT ... RETURNING, чтобы получить их id для вкусов
+    new_brands = {}
+    for record in records:
+        name = " ".join(record["brand"].split())
+        key = normalize(name)
+        if key not in brand_ids and key not in new_brands:
+            new_brands[key] = name
+    if new_brands:
+        # id сопоставляются по normalized: упорядоченный RETURNING
+        # (sort_by_parameter_order) SQLite выполняет построчно
+        result = await session.execute(
+            insert(CatalogItem).returning(CatalogItem.id, CatalogItem.normalized),
+            [
+                {"kind": "brand", "name": name, "normalized": key}
+                for key, name in new_brands.items()
+            ],
+        )
+        brand_ids.update((key, brand_id) for brand_id, key in result.all())
+
+    rows = []
+    for record in records:
+        flavor = " ".join((record.get("flavor") or "").split())
+        if not flavor:
+            continue
+        brand_id = brand_ids[normalize(record["brand"])]
+        key = normalize(flavor)
+        if (brand_id, key) in known_flavors:
+            continue
+        known_flavors.add((brand_id, key))
+        rows.append({
+            "kind": "flavor",
+            "name": flavor,
+            "normalized": key,
+            "brand_id": brand_id,
+            "category_id": categories.get(normalize(record.get("category") or "")),
+        })
+
+    for start in range(0, len(rows), batch_size):
+        await session.execute(insert(CatalogItem), rows[start:start + batch_size])
+    await session.commit()
+    return len(new_brands), len(rows)
+
+
+async def replicate_catalog(source: AsyncSession, target: AsyncSession) -> int:
+    """Копирует каталог в другой шард с теми же id (заменяя существующий)."""
+    table = CatalogItem.__table__
+    rows = (await source.execute(select(table).order_by(table.c.id))).mappings().all()
+
+    await target.execute(delete(CatalogItem))
+    # Сначала бренды: вкусы ссылаются на них внешним ключом
+    ordered = sorted(rows, key=lambda row: row["kind"] != "brand")
+    for start in range(0, len(ordered), 1000):
+        await target.execute(insert(table), [dict(row) for row in ordered[start:start + 1000]])
+    await target.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import init_db, router
+
+    parser = argparse.ArgumentParser(description="Загрузка каталога брендов и вкусов")
+    parser.add_argument("path", type=Path, help="CSV (brand,flavor,category) или JSON")
+    args = parser.parse_args()
+
+    async def _main() -> None:
+        await init_db()
+        async with router.sessionmakers[0]() as session:
+            brands, flavors = await import_records(session, read_dump(args.path))
+            total = await session.scalar(select(func.count(CatalogItem.id)))
+        print(f"Добавлено брендов: {brands}, вкусов: {flavors}; всего в каталоге: {total}")
+
+        for index, session_factory in enumerate(router.sessionmakers[1:], start=1):
+            async with router.sessionmakers[0]() as source, session_factory() as target:
+                copied = await replicate_catalog(source, target)
+            print(f"Шард {index}: скопировано записей каталога: {copied}")
+        await router.dispose()
+
+    asyncio.run(_main())
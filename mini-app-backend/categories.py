@@ -0,0 +1,94 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from types import MappingProxyType
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Category
+
+
+@dataclass(frozen=True)
+class CategoryInfo:
+    """Категория вкуса (неизменяемая копия строки categories)."""
+    id: int
+    name: str
+    emoji: str
+    taste_profile: str
+
+
+class CategoryRegistry:
+    """Неизменяемый реестр категорий на весь процесс.
+
+    Категории засеваются один раз и не меняются, поэтому вместо JOIN
+    и selectinload на каждый запрос используется этот реестр.
+    """
+
+    def __init__(self, categories: Iterable[CategoryInfo] = ()):
+        self.categories: Tuple[CategoryInfo, ...] = tuple(
+            sorted(categories, key=lambda c: c.name)
+        )
+        self._by_id = MappingProxyType({c.id: c for c in self.categories})
+        self._by_name = MappingProxyType({c.name.lower(): c for c in self.categories})
+        self._dicts = MappingProxyType({c.id: asdict(c) for c in self.categories})
+
+        payload = json.dumps([asdict(c) for c in self.categories], ensure_ascii=False)
+        self.etag = f'"{hashlib.sha1(payload.encode()).hexdigest()[:16]}"'
+
+    def __len__(self) -> int:
+        return len(self.categories)
+
+    def get(self, category_id: Optional[int]) -> Optional[CategoryInfo]:
+        return self._by_id.get(category_id) if category_id is not None else None
+
+    def by_name(self, name: str) -> Optional[CategoryInfo]:
+        return self._by_name.get(name.strip().lower())
+
+    def name_for(self, category_id: Optional[int]) -> Optional[str]:
+        category = self.get(category_id)
+        return category.name if category else None
+
+    def as_dict(self, category_id: Optional[int]) -> Optional[dict]:
+        """Категория в виде CategoryResponse-совместимого словаря."""
+        return self._dicts.get(category_id) if category_id is not None else None
+
+
+# Категории засеваются с явными id, поэтому реестр известен без БД:
+# /api/categories отвечает ещё до прогрева базы
+CATEGORIES: Tuple[CategoryInfo, ...] = (
+    CategoryInfo(1, "Ягодные", "🍓", "сладкий"),
+    CategoryInfo(2, "Цитрусовые", "🍊", "кислый"),
+    CategoryInfo(3, "Фруктовые", "🍎", "сладкий"),
+    CategoryInfo(4, "Тропические", "🥭", "сладкий"),
+    CategoryInfo(5, "Мятные", "🍃", "свежий"),
+    CategoryInfo(6, "Холодок", "❄️", "свежий"),
+    CategoryInfo(7, "Десертные", "🍬", "сладкий"),
+    CategoryInfo(8, "Напитки", "🥤", "разный"),
+    CategoryInfo(9, "Цветочные", "🌸", "нейтральный"),
+    CategoryInfo(10, "Пряные", "🌶", "терпкий"),
+)
+
+_registry = CategoryRegistry(CATEGORIES)
+
+
+def get_registry() -> CategoryRegistry:
+    """Текущий реестр категорий."""
+    return _registry
+
+
+async def load_categories(session: AsyncSession) -> CategoryRegistry:
+    """Загружает категории из БД в реестр процесса."""
+    global _registry
+    result = await session.execute(select(Category))
+    _registry = CategoryRegistry(
+        CategoryInfo(
+            id=c.id,
+            name=c.name,
+            emoji=c.emoji,
+            taste_profile=c.taste_profile,
+        )
+        for c in result.scalars().all()
+    )
+    return _registry
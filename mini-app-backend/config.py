@@ -8,6 +8,11 @@ class Settings(BaseSettings):
     # Telegram Bot (для валидации initData)
     bot_token: str = ""
 
+    # Токены сессии Mini App (секрет по умолчанию выводится из bot_token)
+    session_secret: str = ""
+    session_token_ttl: int = 3600
+    init_data_max_age: int = 86400
+
     # LLM API
     llm_api_url: str = "https://api.openai.com/v1"
     llm_api_key: str = ""
@@ -18,9 +23,75 @@ class Settings(BaseSettings):
     # Database
     database_url: str = "sqlite+aiosqlite:///./hookah_app.db"
 
+    # Шардирование по пользователям (1 — одна общая база)
+    db_shards: int = 1
+    db_shard_url_template: str = "sqlite+aiosqlite:///./hookah_app_shard{shard}.db"
+
+    # Retention миксов без оценки и не в избранном (0 — выключено)
+    mix_retention_days: int = 0
+    mix_retention_mode: str = "archive"  # archive/delete
+    mix_retention_batch_size: int = 200
+    mix_retention_interval_hours: int = 24
+
+    # Сверка денормализованных счётчиков с данными (0 — выключена)
+    counters_reconcile_interval_hours: int = 24
+
+    # Кэш пользователей (telegram_id → user.id)
+    identity_cache_ttl: float = 300.0
+    identity_flush_interval: float = 5.0
+
+    # Общий кэш: пусто — в памяти процесса, redis://host:port/db — общий для воркеров
+    cache_url: str = ""
+    cache_prefix: str = "hookah"
+    cache_max_bytes: int = 64 * 1024 * 1024
+    near_cache_max_bytes: int = 16 * 1024 * 1024
+    near_cache_ttl: float = 5.0
+    listing_cache_ttl: float = 300.0
+    llm_cache_ttl: float = 0.0  # 0 — ответы LLM не кэшируются
+
+    # Поиск по коллекции: индексы последних пользователей
+    search_index_cache_size: int = 256
+
+    # Экспорт/импорт коллекции: строк на порцию курсора и на транзакцию
+    export_batch_size: int = 500
+    import_batch_size: int = 500
+    import_max_line_bytes: int = 65536
+
+    # Ограничение частоты запросов: token bucket на пользователя
+    rate_limit_enabled: bool = True
+    rate_limit_store: str = "memory"  # memory/database (общий для процессов)
+    rate_limit_max_buckets: int = 10000
+    rate_limit_generate_burst: int = 3
+    rate_limit_generate_per_minute: float = 6.0
+    rate_limit_read_burst: int = 60
+    rate_limit_read_per_minute: float = 300.0
+
+    # Дедлайны, с (0 — без дедлайна): бюджет всего запроса, из остатка
+    # берут таймаут вызовы БД и LLM
+    deadline_default: float = 10.0
+    deadline_base: float = 30.0  # генерация по request_type
+    deadline_profile: float = 30.0
+    deadline_surprise: float = 40.0
+    deadline_save_reserve: float = 2.0  # LLM оставляет это время на сохранение микса
+    deadline_llm_min: float = 3.0  # меньше — к LLM не обращаемся, микс составляется локально
+
     # CORS
     cors_origins: str = "*"
 
+    # Готовность (/api/ready) и остановка
+    ready_require_llm: bool = True  # без соединения с LLM инстанс не готов
+    drain_delay: float = 5.0  # с после SIGTERM: готовность снята, запросы ещё принимаются
+    drain_timeout: float = 60.0  # сколько ждать текущие генерации
+
+    # Метрики Prometheus на /metrics
+    metrics_enabled: bool = True
+
+    # Профилировщик SQL: Server-Timing и предупреждения о N+1 на каждый запрос
+    sql_profiler_enabled: bool = False
+    sql_repeat_threshold: int = 5  # одинаковых запросов за запрос → предупреждение
+    sql_slow_query_ms: float = 200.0  # 0 — журнал медленных запросов выключен
+    sql_explain_slow: bool = True
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from typing import Iterable, Optional
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from models import Mix, Tobacco, User
+
+logger = logging.getLogger(__name__)
+
+COUNTER_COLUMNS = (
+    "tobaccos_count",
+    "mixes_count",
+    "favorites_count",
+    "likes_count",
+    "dislikes_count",
+)
+
+
+async def bump_counters(session: AsyncSession, user_id: int, **deltas: int) -> None:
+    """Сдвигает счётчики пользователя в текущей транзакции.
+
+    Пример: ``await bump_counters(session, user.id, tobaccos_count=-3)``.
+    Каждый вызов также увеличивает ``data_version``, поэтому изменения
+    без сдвига счётчиков (правка табака) вызывают его без аргументов.
+    Коммит остаётся за вызывающим кодом.
+    """
+    values = {
+        name: getattr(User, name) + delta
+        for name, delta in deltas.items()
+        if delta
+    }
+    values["data_version"] = User.data_version + 1
+
+    await session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def get_data_version(session: AsyncSession, user_id: int) -> int:
+    """Текущая версия данных пользователя (один SELECT по первичному ключу)."""
+    result = await session.execute(
+        select(User.data_version).where(User.id == user_id)
+    )
+    return result.scalar_one_or_none() or 0
+
+
+def rating_deltas(old: Optional[int], new: Optional[int]) -> dict:
+    """Дельты likes/dislikes при смене оценки микса."""
+    deltas = {"likes_count": 0, "dislikes_count": 0}
+    for rating, sign in ((old, -1), (new, 1)):
+        if rating == 1:
+            deltas["likes_count"] += sign
+        elif rating == -1:
+            deltas["dislikes_count"] += sign
+    return deltas
+
+
+def _expected_counts() -> dict:
+    """Коррелированные подзапросы с фактическими значениями счётчиков."""
+    def count(model, *criteria):
+        return (
+            select(func.count(model.id))
+            .where(model.user_id == User.id, *criteria)
+            .scalar_subquery()
+        )
+
+    return {
+        "tobaccos_count": count(Tobacco),
+        "mixes_count": count(Mix),
+        "favorites_count": count(Mix, Mix.is_favorite == True),
+        "likes_count": count(Mix, Mix.rating == 1),
+        "dislikes_count": count(Mix, Mix.rating == -1),
+    }
+
+
+async def reconcile_counters(
+    session: AsyncSession, user_ids: Optional[Iterable[int]] = None
+) -> int:
+    """Пересчитывает счётчики и исправляет расхождения.
+
+    Обновляются только пользователи, у которых счётчики разошлись
+    с реальными данными. Возвращает количество исправленных пользователей.
+    """
+    expected = _expected_counts()
+    stmt = (
+        update(User)
+        .where(or_(*(getattr(User, name) != value for name, value in expected.items())))
+        .values(**expected, data_version=User.data_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if user_ids is not None:
+        stmt = stmt.where(User.id.in_(list(user_ids)))
+
+    result = await session.execute(stmt)
+    await session.commit()
+
+    if result.rowcount:
+        logger.warning("Counters drift repaired for %s users", result.rowcount)
+    return result.rowcount
+
+
+async def reconcile_loop(session_factory) -> None:
+    """Фоновая задача: сверка счётчиков при старте и затем по расписанию."""
+    while True:
+        try:
+            async with session_factory() as session:
+                await reconcile_counters(session)
+        except Exception:
+            logger.exception("Counters reconcile failed")
+        await asyncio.sleep(settings.counters_reconcile_interval_hours * 3600)
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    from database import router
+
+    async def _main() -> None:
+        fixed = 0
+        for session_factory in router.sessionmakers:
+            async with session_factory() as session:
+                fixed += await reconcile_counters(session)
+        print(f"Исправлено пользователей: {fixed}")
+
+    asyncio.run(_main())
@@ -1,52 +1,132 @@
+import hashlib
 import logging
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from contextlib import AsyncExitStack
+from typing import Optional
 
+from fastapi import Request
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from auth import peek_telegram_id
+from categories import CATEGORIES
 from config import settings
-from models import Base, Category
+from mix_components import backfill_mix_components
+from models import Base, Category, SchemaMeta
+from sharding import ShardRouter, shard_urls
 
 logger = logging.getLogger(__name__)
 
-engine = create_async_engine(settings.database_url)
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+router = ShardRouter(
+    shard_urls(settings.database_url, settings.db_shards, settings.db_shard_url_template)
+)
+
+# Шард 0: единственная база в обычном режиме и источник глобальных данных
+engine = router.engines[0]
+async_session = router.sessionmakers[0]
 
 
 async def init_db() -> None:
-    """Создаёт таблицы и заполняет начальные данные."""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
-    await init_categories()
-    logger.info("Database initialized")
-
-
-async def init_categories() -> None:
-    """Создаёт категории табаков если их нет."""
-    categories_data = [
-        ("Ягодные", "🍓", "сладкий"),
-        ("Цитрусовые", "🍊", "кислый"),
-        ("Фруктовые", "🍎", "сладкий"),
-        ("Тропические", "🥭", "сладкий"),
-        ("Мятные", "🍃", "свежий"),
-        ("Холодок", "❄️", "свежий"),
-        ("Десертные", "🍬", "сладкий"),
-        ("Напитки", "🥤", "разный"),
-        ("Цветочные", "🌸", "нейтральный"),
-        ("Пряные", "🌶", "терпкий"),
-    ]
-
-    async with async_session() as session:
+    """Создаёт таблицы и заполняет начальные данные во всех шардах."""
+    for shard_engine, session_factory in zip(router.engines, router.sessionmakers):
+        await init_shard(shard_engine, session_factory)
+
+    logger.info("Database initialized (%s shard(s))", router.count)
+
+
+async def init_shard(shard_engine: AsyncEngine, session_factory: async_sessionmaker) -> None:
+    """Создаёт схему и глобальные данные в одном шарде.
+
+    DDL выполняется, только если отпечаток моделей не совпадает с записанным
+    в schema_meta: на холодном старте это один SELECT вместо create_all
+    и инспекции таблиц. Сверка счётчиков сюда не входит — её ведёт фоновая
+    задача reconcile_loop после прогрева.
+    """
+    fingerprint = schema_fingerprint(shard_engine)
+    if await _stored_fingerprint(shard_engine) != fingerprint:
+        async with shard_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_add_missing_columns)
+
+        async with session_factory() as session:
+            await session.merge(SchemaMeta(key=SCHEMA_FINGERPRINT_KEY, value=fingerprint))
+            await session.commit()
+        logger.info("Schema %s applied to %s", fingerprint, shard_engine.url.render_as_string())
+
+    await init_categories(session_factory)
+
+    # Разворачиваем компоненты старых миксов в mix_components
+    async with session_factory() as session:
+        await backfill_mix_components(session)
+
+
+SCHEMA_FINGERPRINT_KEY = "fingerprint"
+
+
+def schema_fingerprint(shard_engine: AsyncEngine) -> str:
+    """Хэш DDL всех моделей: меняется с любой таблицей, колонкой или индексом."""
+    dialect = shard_engine.dialect
+    ddl = []
+    for table in Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            ddl.append(str(CreateIndex(index).compile(dialect=dialect)))
+    return hashlib.sha1("\n".join(ddl).encode()).hexdigest()[:16]
+
+
+async def _stored_fingerprint(shard_engine: AsyncEngine) -> Optional[str]:
+    """Отпечаток, с которым шард сверялся в прошлый раз (None — ни разу)."""
+    async with shard_engine.connect() as conn:
+        try:
+            result = await conn.execute(
+                select(SchemaMeta.value).where(SchemaMeta.key == SCHEMA_FINGERPRINT_KEY)
+            )
+        except DBAPIError:
+            # Пустая база или созданная до появления schema_meta
+            return None
+        return result.scalar_one_or_none()
+
+
+def _add_missing_columns(connection) -> None:
+    """Добавляет в существующие таблицы колонки, появившиеся в моделях.
+
+    create_all не изменяет уже созданные таблицы, поэтому новые колонки
+    докидываются через ALTER TABLE ADD COLUMN (со server_default, если он задан).
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            column_type = column.type.compile(dialect=connection.dialect)
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            connection.exec_driver_sql(ddl)
+            logger.info("Added column %s.%s", table.name, column.name)
+
+
+async def init_categories(session_factory: async_sessionmaker = async_session) -> None:
+    """Создаёт категории табаков если их нет (категории реплицируются во все шарды)."""
+    async with session_factory() as session:
         # Проверяем есть ли уже категории
         result = await session.execute(select(Category).limit(1))
         if result.scalar_one_or_none() is not None:
             return
 
-        # Добавляем все категории
-        for name, emoji, taste_profile in categories_data:
+        # Добавляем все категории с теми же id, что и в статическом реестре
+        for info in CATEGORIES:
             category = Category(
-                name=name,
-                emoji=emoji,
-                taste_profile=taste_profile,
+                id=info.id,
+                name=info.name,
+                emoji=info.emoji,
+                taste_profile=info.taste_profile,
             )
             session.add(category)
 
@@ -54,7 +134,38 @@ async def init_categories() -> None:
         logger.info("Categories initialized")
 
 
-async def get_session():
-    """Dependency для получения сессии БД."""
-    async with async_session() as session:
+async def prime_pool(shard_engine: AsyncEngine, connections: Optional[int] = None) -> int:
+    """Открывает соединения пула заранее: первые запросы не платят за connect.
+
+    По умолчанию — pool_size пула (QueuePool), иначе одно соединение.
+    Соединения держатся одновременно, чтобы открылись разные, и
+    возвращаются в пул. Возвращает число открытых соединений.
+    """
+    if connections is None:
+        pool = shard_engine.sync_engine.pool
+        connections = pool.size() if hasattr(pool, "size") else 1
+    async with AsyncExitStack() as stack:
+        for _ in range(connections):
+            conn = await stack.enter_async_context(shard_engine.connect())
+            await conn.execute(text("SELECT 1"))
+    return connections
+
+
+def _shard_key(request: Request) -> Optional[int]:
+    """telegram_id текущего пользователя для выбора шарда.
+
+    Подпись токена здесь не проверяется — это делает get_current_user
+    до первого запроса к БД.
+    """
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        return peek_telegram_id(authorization[7:])
+
+    value = request.headers.get("X-Telegram-User-Id")
+    return int(value) if value and value.isdigit() else None
+
+
+async def get_session(request: Request):
+    """Dependency для получения сессии БД (в шарде текущего пользователя)."""
+    async with router.session(_shard_key(request)) as session:
         yield session
@@ -0,0 +1,185 @@
+"""Дедлайн запроса: бюджет времени, который расходуют вызовы БД и LLM.
+
+Бюджет задаётся на входе — HTTP-запрос (DeadlineMiddleware) или апдейт
+бота — и хранится в contextvar, поэтому виден любому коду запроса без
+передачи параметром. Вызовы БД (DeadlineSession) и LLM получают таймаут
+из остатка: зависший провайдер или запрос к базе не держит воркер
+дольше бюджета. Генерация, когда тип запроса становится известен,
+переходит на свой бюджет (rebudget), считая от начала запроса.
+
+Исчерпание учитывается по фазам (deadline_exhausted_total); вызывающий
+код переходит на кэшированный или локальный результат, если он есть,
+иначе запрос завершается 504. Фоновые задачи дедлайна не имеют.
+"""
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Awaitable, Iterator, Optional, Sequence, TypeVar
+
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from metrics import deadline_exhausted
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def budget_for(request_type: str) -> float:
+    """Бюджет, с, для типа запроса: генерации (base/profile/surprise) или default."""
+    return {
+        "base": settings.deadline_base,
+        "profile": settings.deadline_profile,
+        "surprise": settings.deadline_surprise,
+    }.get(request_type, settings.deadline_default)
+
+
+@dataclass
+class Deadline:
+    """Бюджет одного запроса."""
+    request_type: str
+    started: float  # time.monotonic() на входе
+    budget: float
+
+    def remaining(self) -> float:
+        return self.started + self.budget - time.monotonic()
+
+
+current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """На фазу phase (db, llm) не осталось бюджета запроса."""
+
+    def __init__(self, phase: str):
+        self.phase = phase
+        super().__init__(f"Бюджет времени запроса исчерпан ({phase})")
+
+
+@contextmanager
+def deadline_scope(request_type: str = "default") -> Iterator[Optional[Deadline]]:
+    """Дедлайн для кода внутри блока; бюджет 0 — без дедлайна."""
+    budget = budget_for(request_type)
+    deadline = Deadline(request_type, time.monotonic(), budget) if budget > 0 else None
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
+
+
+def rebudget(request_type: str) -> None:
+    """Переводит текущий запрос на бюджет request_type (от начала запроса)."""
+    deadline = current_deadline.get()
+    if deadline is not None:
+        deadline.request_type = request_type
+        deadline.budget = budget_for(request_type)
+
+
+def exhausted(phase: str) -> DeadlineExceeded:
+    """Учитывает исчерпание бюджета фазой phase; возвращает исключение для raise."""
+    deadline = current_deadline.get()
+    request_type = deadline.request_type if deadline is not None else "default"
+    deadline_exhausted.labels(request_type, phase).inc()
+    logger.warning("Deadline exceeded: %s (%s)", phase, request_type)
+    return DeadlineExceeded(phase)
+
+
+async def within(
+    phase: str,
+    work: Awaitable[T],
+    reserve: float = 0.0,
+    minimum: float = 0.0,
+) -> T:
+    """Выполняет work не дольше остатка бюджета.
+
+    reserve — сколько оставить коду после фазы (например, на сохранение
+    результата); если на фазу остаётся меньше minimum, она не начинается.
+    Поднимает DeadlineExceeded; без дедлайна work выполняется как есть.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return await work
+
+    timeout = deadline.remaining() - reserve
+    if timeout <= max(minimum, 0.0):
+        if asyncio.iscoroutine(work):
+            work.close()
+        raise exhausted(phase)
+
+    # asyncio.timeout отменяет work в той же задаче, без лишней задачи на вызов
+    scope = asyncio.timeout(timeout)
+    try:
+        async with scope:
+            return await work
+    except TimeoutError:
+        if scope.expired():
+            raise exhausted(phase) from None
+        raise
+
+
+class DeadlineSession(AsyncSession):
+    """Сессия, вызовы которой расходуют бюджет запроса (фаза db).
+
+    Отменённый по таймауту запрос инвалидирует соединение, поэтому после
+    DeadlineExceeded сессию нужно только закрыть — обычно запрос
+    на этом завершается.
+    """
+
+    async def execute(self, *args, **kwargs):
+        return await within("db", super().execute(*args, **kwargs))
+
+    async def scalar(self, *args, **kwargs):
+        return await within("db", super().scalar(*args, **kwargs))
+
+    async def get(self, *args, **kwargs):
+        return await within("db", super().get(*args, **kwargs))
+
+    async def flush(self, *args, **kwargs):
+        return await within("db", super().flush(*args, **kwargs))
+
+    async def commit(self):
+        return await within("db", super().commit())
+
+    async def refresh(self, *args, **kwargs):
+        return await within("db", super().refresh(*args, **kwargs))
+
+
+class DeadlineMiddleware:
+    """Дедлайн на каждый HTTP-запрос; DeadlineExceeded → 504.
+
+    Пути из unbounded_paths (потоковые экспорт и импорт коллекции)
+    выполняются без дедлайна.
+    """
+
+    def __init__(self, app, unbounded_paths: Sequence[str] = ("/api/export", "/api/import")):
+        self.app = app
+        self.unbounded_paths = set(unbounded_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.unbounded_paths:
+            return await self.app(scope, receive, send)
+
+        started = False
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        with deadline_scope():
+            try:
+                await self.app(scope, receive, send_wrapper)
+            except DeadlineExceeded as e:
+                if started:
+                    raise
+                response = JSONResponse(
+                    {"detail": f"Сервис не успел ответить: {e}"}, status_code=504
+                )
+                await response(scope, receive, send)
@@ -1,11 +1,21 @@
+import asyncio
+import hashlib
 import json
+import logging
 import random
+import time
 from dataclasses import dataclass
-from typing import List, Optional
-
-from openai import AsyncOpenAI
+from typing import TYPE_CHECKING, List, Optional
 
+from cache import cache
 from config import settings
+from deadline import DeadlineExceeded, within
+from metrics import llm_cancelled, llm_errors, llm_fallbacks, observe_llm
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
 
 
 # Стили для разнообразия миксов
@@ -44,12 +54,41 @@ class LLMService:
     """Сервис для генерации миксов через OpenAI-совместимый API."""
 
     def __init__(self):
-        self.client = AsyncOpenAI(
-            api_key=settings.llm_api_key,
-            base_url=settings.llm_api_url,
-        )
+        self._client: Optional["AsyncOpenAI"] = None
         self.model = settings.llm_model
 
+    @property
+    def client(self) -> "AsyncOpenAI":
+        """Клиент создаётся при первом обращении.
+
+        Импорт openai (вместе с httpx и pydantic-моделями API) — самая
+        тяжёлая часть импорта приложения, на холодном старте его не ждём.
+        """
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(
+                api_key=settings.llm_api_key,
+                base_url=settings.llm_api_url,
+            )
+        return self._client
+
+    async def connect(self) -> None:
+        """Открывает соединение с API до первой генерации (для /api/ready).
+
+        openai импортируется в потоке, чтобы не блокировать цикл событий.
+        Любой HTTP-ответ, даже 4xx (не у всех совместимых API есть
+        /models), значит, что соединение установлено; сетевые ошибки
+        и таймауты пробрасываются.
+        """
+        await asyncio.to_thread(lambda: self.client)
+        from openai import APIStatusError
+
+        try:
+            await self.client.with_options(max_retries=0, timeout=10.0).models.list()
+        except APIStatusError as e:
+            logger.info("LLM API reachable (GET /models: HTTP %s)", e.status_code)
+
     def _get_system_prompt(self) -> str:
         """Возвращает системный промпт для AI."""
         return """Ты — эксперт по кальянным миксам с 10-летним опытом. Твоя задача — составлять идеальные миксы ТОЛЬКО из табаков, которые есть у пользователя.
@@ -89,6 +128,32 @@ class LLMService:
             lines.append(" ".join(parts))
         return "\n".join(lines)
 
+    def local_mix(self, tobaccos: List[dict], base_tobacco: Optional[str] = None) -> MixRecommendation:
+        """Микс без LLM — когда на запрос к API не хватило бюджета.
+
+        База — выбранный табак (или случайный), к ней до двух табаков
+        других категорий для контраста; пропорции 50/30/20 или 60/40.
+        """
+        base = next((t for t in tobaccos if t["name"] == base_tobacco), None) or random.choice(tobaccos)
+        others = [t for t in tobaccos if t is not base]
+        random.shuffle(others)
+        others.sort(key=lambda t: bool(base.get("category")) and t.get("category") == base.get("category"))
+        picked = [base] + others[:2]
+        portions = (50, 30, 20) if len(picked) == 3 else (60, 40)
+
+        return MixRecommendation(
+            name=f"Быстрый микс: {base['name']}",
+            components=[
+                MixComponent(tobacco=t["name"], portion=portion, role=role)
+                for t, portion, role in zip(picked, portions, ("база", "дополнение", "акцент"))
+            ],
+            description=(
+                "Сервис рекомендаций не ответил вовремя, поэтому микс составлен "
+                "автоматически: база и табаки других категорий для контраста."
+            ),
+            tips="Начните с умеренного жара и прибавьте, если вкус раскрывается слабо.",
+        )
+
     async def generate_mix(
         self,
         tobaccos: List[dict],
@@ -98,8 +163,15 @@ class LLMService:
         liked_mixes: Optional[List[str]] = None,
         disliked_mixes: Optional[List[str]] = None,
         previous_mixes: Optional[List[str]] = None,
+        archived_mixes: Optional[List[str]] = None,
     ) -> MixRecommendation:
-        """Генерирует микс через LLM API."""
+        """Генерирует микс через LLM API.
+
+        Отмена задачи (asyncio.CancelledError) прерывает запрос к API
+        и пробрасывается без обёртки в Exception. Запрос к API ограничен
+        остатком дедлайна запроса; если его не хватает, возвращается
+        local_mix().
+        """
         try:
             # Форматируем коллекцию
             collection_text = self._format_collection(tobaccos)
@@ -124,6 +196,9 @@ class LLMService:
             # Исключаем ранее предложенные миксы
             if previous_mixes:
                 preferences.append(f"НЕ предлагай эти миксы (уже были): {', '.join(previous_mixes[-5:])}")
+            # Давние миксы, убранные retention в архив, — с составом
+            if archived_mixes:
+                preferences.append(f"НЕ повторяй составы давних миксов: {'; '.join(archived_mixes)}")
 
             user_prompt = f"""Моя коллекция табаков:
 {collection_text}
@@ -136,19 +211,50 @@ class LLMService:
             # Для surprise используем более высокую температуру
             temperature = 1.0 if request_type == "surprise" else settings.llm_temperature
 
-            # Запрос к API
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
+            params = {
+                "model": self.model,
+                "messages": [
                     {"role": "system", "content": self._get_system_prompt()},
                     {"role": "user", "content": user_prompt},
                 ],
-                max_tokens=settings.llm_max_tokens,
-                temperature=temperature,
-            )
-
-            # Извлекаем ответ
-            content = response.choices[0].message.content
+                "max_tokens": settings.llm_max_tokens,
+                "temperature": temperature,
+            }
+
+            # Одинаковый промпт — тот же ответ из кэша (если включён)
+            cache_key = None
+            content = None
+            if settings.llm_cache_ttl > 0:
+                cache_key = hashlib.sha256(
+                    json.dumps(params, ensure_ascii=False, sort_keys=True).encode("utf-8")
+                ).hexdigest()
+                cached = await cache.get_bytes("llm", cache_key)
+                if cached is not None:
+                    content = cached.decode("utf-8")
+
+            if content is None:
+                # Запрос к API: не дольше остатка бюджета, с запасом на сохранение
+                started = time.perf_counter()
+                try:
+                    response = await within(
+                        "llm",
+                        self.client.chat.completions.create(**params),
+                        reserve=settings.deadline_save_reserve,
+                        minimum=settings.deadline_llm_min,
+                    )
+                except DeadlineExceeded:
+                    llm_fallbacks.labels(self.model).inc()
+                    return self.local_mix(tobaccos, base_tobacco)
+                except asyncio.CancelledError:
+                    # Отмена (клиент ушёл) — не ошибка API: пробрасываем как есть,
+                    # ниже по стеку ничего не сохраняется
+                    llm_cancelled.labels(self.model).inc()
+                    raise
+                except Exception:
+                    llm_errors.labels(self.model, "api").inc()
+                    raise
+                observe_llm(self.model, time.perf_counter() - started, response.usage)
+                content = response.choices[0].message.content
 
             # Убираем markdown-разметку если есть
             if content.startswith("```"):
@@ -169,16 +275,22 @@ class LLMService:
                 for c in data["components"]
             ]
 
-            return MixRecommendation(
+            recommendation = MixRecommendation(
                 name=data["name"],
                 components=components,
                 description=data["description"],
                 tips=data["tips"],
             )
+            # В кэш попадают только ответы, которые удалось разобрать
+            if cache_key is not None:
+                await cache.set_bytes("llm", cache_key, content.encode("utf-8"), settings.llm_cache_ttl)
+            return recommendation
 
         except json.JSONDecodeError as e:
+            llm_errors.labels(self.model, "parse").inc()
             raise Exception(f"Ошибка парсинга ответа LLM: {e}")
         except KeyError as e:
+            llm_errors.labels(self.model, "parse").inc()
             raise Exception(f"Неполный ответ от LLM, отсутствует поле: {e}")
         except Exception as e:
             raise Exception(f"Ошибка генерации микса: {e}")
@@ -1,26 +1,66 @@
+import asyncio
 import logging
+import zlib
 from contextlib import asynccontextmanager
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 from urllib.parse import unquote
 
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import select, func
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import delete, insert, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
+from auth import AuthError, session_tokens, validate_init_data
+from cache import cache
+from catalog import NODE_CAPACITY, get_catalog, load_catalog
+from categories import get_registry, load_categories
 from config import settings
-from database import init_db, get_session
-from models import User, Category, Tobacco, Mix
+from counters import bump_counters, get_data_version, reconcile_loop
+from database import init_db, get_session, prime_pool, router
+from deadline import DeadlineExceeded, DeadlineMiddleware, rebudget
+from mix_components import detach_tobaccos, mixes_with_tobacco, top_tobaccos, write_mix_components
+from models import User, Tobacco, Mix
+import mutations
 from schemas import (
     UserCreate, UserResponse,
+    AuthRequest, AuthResponse,
     CategoryResponse,
+    CatalogSuggestion,
     TobaccoCreate, TobaccoBulkCreate, TobaccoUpdate, TobaccoResponse, TobaccoBulkResponse,
+    TobaccoSearchResult,
     MixResponse, MixGenerateRequest, MixGenerateResponse, MixComponent,
     MixRateRequest, MixFavoriteRequest,
-    StatsResponse,
+    StatsResponse, TopTobaccoResponse,
+    BootstrapResponse,
+    BatchRequest, BatchResponse, BatchResult,
+    BatchRateOp, BatchFavoriteOp, BatchAddTobaccoOp, BatchUpdateTobaccoOp,
+    ImportProgressResponse,
 )
+from identity import Identity, flush_loop, identity_cache
 from llm_service import llm_service
+from metrics import (
+    CONTENT_TYPE,
+    MetricsMiddleware,
+    collect_cache,
+    instrument_engine,
+    rate_limit_rejected,
+    registry,
+)
+from profiler import ProfilerMiddleware, profile_engine
+from ratelimit import RateLimitMiddleware, rate_limiter
+from retention import archived_mixes, retention_loop
+from search import search_indexes
+from serialization import (
+    MIX_COLUMNS,
+    TOBACCO_COLUMNS,
+    FastJSONResponse,
+    dumps,
+    serialize_mix,
+    serialize_tobacco,
+)
+from transfer import import_jobs, import_stream, stream_export
+from warmup import WarmupMiddleware, readiness, warmup
 
 # Логирование
 logging.basicConfig(
@@ -29,16 +69,88 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Lifecycle управления приложением."""
-    await init_db()
+    """Lifecycle управления приложением.
+
+    Работа с БД вынесена в фоновый прогрев: процесс начинает принимать
+    соединения сразу, /api/health и категории отвечают без базы.
+    /api/ready становится готовым, когда пройдены шаги database
+    (схема и пул соединений), reference (справочники в памяти) и llm
+    (соединение с API), и снова неготовым по SIGTERM на время drain.
+    """
+    readiness.reset(
+        ("database", "reference", "llm"),
+        required=("database", "reference") + (("llm",) if settings.ready_require_llm else ()),
+    )
+    restore_signals = readiness.install_drain_handler(settings.drain_delay, settings.drain_timeout)
+    await cache.start()
+
+    background_tasks = [
+        asyncio.create_task(
+            flush_loop(identity_cache, router, settings.identity_flush_interval)
+        )
+    ]
+
+    async def warm_up() -> None:
+        await init_db()
+        for shard_engine in router.engines:
+            await prime_pool(shard_engine)
+        readiness.mark("database")
+
+        # Категории и каталог статичны — держим их в памяти процесса
+        async with router.session() as session:
+            await load_categories(session)
+            catalog = await load_catalog(session)
+        logger.info("Catalog loaded: %d entries", len(catalog))
+        readiness.mark("reference")
+
+        if settings.mix_retention_days > 0:
+            background_tasks.extend(
+                asyncio.create_task(retention_loop(session_factory, shard))
+                for shard, session_factory in enumerate(router.sessionmakers)
+            )
+        # Ремонт расхождений счётчиков — вне холодного старта
+        if settings.counters_reconcile_interval_hours > 0:
+            background_tasks.extend(
+                asyncio.create_task(reconcile_loop(session_factory))
+                for session_factory in router.sessionmakers
+            )
+        # LLM не задерживает запросы к БД: соединяемся уже после прогрева
+        background_tasks.append(asyncio.create_task(connect_llm()))
+
+    warmup.start(warm_up)
     logger.info("Application started")
     yield
+
+    restore_signals()
+    await warmup.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await cache.close()
+    await router.dispose()
     logger.info("Application stopped")
 
 
+async def connect_llm(max_delay: float = 60.0) -> None:
+    """Соединение с LLM для готовности; при ошибке — повтор с растущей паузой."""
+    delay = 1.0
+    while True:
+        try:
+            await llm_service.connect()
+        except Exception as e:
+            logger.warning("LLM connection failed: %s; retry in %.0f s", e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+        else:
+            readiness.mark("llm")
+            return
+
+
 app = FastAPI(
     title="Hookah Mix Mini App API",
     description="API для Telegram Mini App управления коллекцией табаков и генерации миксов",
@@ -46,6 +158,17 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# Дедлайн — самый внутренний слой: бюджет расходуют БД и LLM, а не
+# ожидание прогрева и лимиты
+app.add_middleware(DeadlineMiddleware)
+
+# Лимиты частоты запросов; CORS добавляется после, чтобы и ответы 429
+# несли CORS-заголовки
+app.add_middleware(RateLimitMiddleware)
+
+# До конца прогрева запросы к БД ждут; health и категории — нет
+app.add_middleware(WarmupMiddleware)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -53,11 +176,122 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
+# Журнал медленных запросов и профиль SQL на каждый запрос
+if settings.sql_profiler_enabled or settings.sql_slow_query_ms > 0:
+    for shard_engine in router.engines:
+        profile_engine(shard_engine)
+if settings.sql_profiler_enabled:
+    app.add_middleware(ProfilerMiddleware)
+
+# Метрики — самый внешний слой: время включает лимиты и CORS
+if settings.metrics_enabled:
+    for shard_engine in router.engines:
+        instrument_engine(shard_engine)
+    app.add_middleware(MetricsMiddleware)
+
+
+@registry.collector
+def collect_runtime_metrics() -> None:
+    collect_cache(cache.stats())
+    rate_limit_rejected.labels().set(rate_limiter.rejected)
+
 
 # ============ HELPERS ============
 
+# Как часто долгий запрос проверяет, что клиент ещё ждёт ответа, с
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """Выполняет work, пока клиент на связи.
+
+    Если клиент закрыл соединение (например, свернул Mini App посреди
+    генерации), work отменяется и поднимается HTTPException 499: код
+    после вызова — сохранение результата — не выполняется, а в метриках
+    такие запросы видны отдельным статусом.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    logger.info("%s %s: client disconnected, work cancelled", request.method, request.url.path)
+    raise HTTPException(status_code=499, detail="Клиент закрыл соединение")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабое сравнение If-None-Match с ETag (список через запятую или *)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == bare
+        for tag in if_none_match.split(",")
+    )
+
+
+async def revalidate(
+    session: AsyncSession,
+    user: Identity,
+    response: Response,
+    if_none_match: Optional[str],
+    scope: str,
+) -> Optional[Response]:
+    """Слабый ETag по версии данных пользователя.
+
+    Возвращает готовый ответ 304, если у клиента актуальная версия —
+    тогда строки не загружаются и не сериализуются. Иначе проставляет
+    ETag в ответ и возвращает None.
+
+    В ETag — telegram_id: user.id уникален только внутри шарда, а ETag
+    служит ключом общего кэша (cached_listing).
+    """
+    version = await get_data_version(session, user.id)
+    return conditional(response, if_none_match, f'W/"{user.telegram_id}.{version}.{scope}"')
+
+
+async def cached_listing(response: Response, render: Callable[[], Awaitable[list]]) -> Response:
+    """Тело списка из общего кэша по ETag, проставленному revalidate.
+
+    ETag содержит telegram_id, версию данных и параметры списка, поэтому
+    запись не нужно инвалидировать: после изменения данных ключ другой.
+    """
+    async def build() -> bytes:
+        return dumps(await render())
+
+    body = await cache.get_or_set(
+        "listing", response.headers["ETag"], settings.listing_cache_ttl, build
+    )
+    return Response(body, media_type="application/json", headers=response.headers)
+
+
+def conditional(
+    response: Response,
+    if_none_match: Optional[str],
+    etag: str,
+) -> Optional[Response]:
+    """Ответ 304 при совпадении ETag, иначе ETag проставляется в response."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
+
+
 async def get_or_create_user(
     session: AsyncSession,
     telegram_id: int,
@@ -84,151 +318,375 @@ async def get_or_create_user(
 
 
 async def get_current_user(
-    x_telegram_user_id: int = Header(..., alias="X-Telegram-User-Id"),
+    authorization: Optional[str] = Header(None),
+    x_telegram_user_id: Optional[int] = Header(None, alias="X-Telegram-User-Id"),
     x_telegram_username: Optional[str] = Header(None, alias="X-Telegram-Username"),
     x_telegram_first_name: Optional[str] = Header(None, alias="X-Telegram-First-Name"),
     session: AsyncSession = Depends(get_session),
-) -> User:
-    """Dependency для получения текущего пользователя из заголовков."""
+) -> Identity:
+    """Dependency для получения текущего пользователя.
+
+    Основной путь — токен сессии из POST /api/auth (Authorization: Bearer),
+    проверяется без обращения к БД. Заголовки X-Telegram-* принимаются
+    только без BOT_TOKEN (режим разработки); пользователь тогда берётся
+    из кэша identity_cache, в БД идём только при промахе.
+    """
+    if authorization and authorization.startswith("Bearer "):
+        try:
+            return session_tokens.verify(authorization[7:])
+        except AuthError as e:
+            raise HTTPException(status_code=401, detail=str(e))
+
+    if settings.bot_token or x_telegram_user_id is None:
+        raise HTTPException(status_code=401, detail="Требуется авторизация")
+
     # Декодируем URL-encoded значения (для поддержки кириллицы)
     username = unquote(x_telegram_username) if x_telegram_username else None
     first_name = unquote(x_telegram_first_name) if x_telegram_first_name else None
-    
-    return await get_or_create_user(
-        session,
-        telegram_id=x_telegram_user_id,
-        username=username,
-        first_name=first_name,
+
+    identity = await identity_cache.get(x_telegram_user_id)
+    if identity is None:
+        user = await get_or_create_user(
+            session,
+            telegram_id=x_telegram_user_id,
+            username=username,
+            first_name=first_name,
+        )
+        identity = Identity.from_user(user)
+        await identity_cache.put(identity)
+
+    # Изменения профиля записываются в БД фоном (write-behind)
+    return await identity_cache.update_profile(
+        identity,
+        username=username if username is not None else identity.username,
+        first_name=first_name if first_name is not None else identity.first_name,
+    )
+
+
+# ============ AUTH ENDPOINTS ============
+
+@app.post("/api/auth", response_model=AuthResponse, tags=["Auth"])
+async def authenticate(data: AuthRequest):
+    """Проверить initData Telegram WebApp и выдать токен сессии."""
+    try:
+        fields = validate_init_data(
+            data.init_data, settings.bot_token, max_age=settings.init_data_max_age
+        )
+    except AuthError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+    tg_user = fields.get("user") or {}
+    if "id" not in tg_user:
+        raise HTTPException(status_code=401, detail="В initData нет пользователя")
+
+    async with router.session(tg_user["id"]) as session:
+        user = await get_or_create_user(
+            session,
+            telegram_id=tg_user["id"],
+            username=tg_user.get("username"),
+            first_name=tg_user.get("first_name"),
+        )
+        identity = await identity_cache.update_profile(
+            Identity.from_user(user),
+            username=tg_user.get("username"),
+            first_name=tg_user.get("first_name"),
+        )
+        await identity_cache.put(identity)
+
+    token, expires_at = session_tokens.issue(identity)
+    return AuthResponse(
+        token=token,
+        expires_at=expires_at,
+        user=UserResponse(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            username=identity.username,
+            first_name=identity.first_name,
+            created_at=user.created_at,
+        ),
     )
 
 
 # ============ USER ENDPOINTS ============
 
 @app.get("/api/user/me", response_model=UserResponse, tags=["User"])
-async def get_me(user: User = Depends(get_current_user)):
+async def get_me(
+    user: Identity = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
     """Получить информацию о текущем пользователе."""
-    return user
+    result = await session.execute(select(User).where(User.id == user.id))
+    return result.scalar_one()
 
 
 @app.get("/api/user/stats", response_model=StatsResponse, tags=["User"])
 async def get_stats(
-    user: User = Depends(get_current_user),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Получить статистику пользователя."""
-    # Количество табаков
-    tobaccos_count = await session.scalar(
-        select(func.count(Tobacco.id)).where(Tobacco.user_id == user.id)
+    not_modified = await revalidate(session, user, response, if_none_match, "stats")
+    if not_modified:
+        return not_modified
+
+    # Счётчики денормализованы в users — читаем одну строку
+    result = await session.execute(
+        select(
+            User.tobaccos_count,
+            User.mixes_count,
+            User.favorites_count,
+            User.likes_count,
+            User.dislikes_count,
+        ).where(User.id == user.id)
     )
+    return StatsResponse(**result.one()._asdict())
+
+
+@app.get("/api/user/top-tobaccos", response_model=List[TopTobaccoResponse], tags=["User"])
+async def get_top_tobaccos(
+    user: Identity = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    limit: int = 10,
+):
+    """Самые используемые в миксах табаки."""
+    return await top_tobaccos(session, user.id, limit=limit)
+
+
+# ============ BOOTSTRAP ============
 
-    # Количество миксов
-    mixes_count = await session.scalar(
-        select(func.count(Mix.id)).where(Mix.user_id == user.id)
+@app.get("/api/bootstrap", response_model=BootstrapResponse, tags=["User"])
+async def bootstrap(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user: Identity = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+    tobaccos_limit: int = 50,
+    mixes_limit: int = 20,
+):
+    """Всё для стартового экрана Mini App одним запросом.
+
+    Строка пользователя (со счётчиками и версией данных) читается первой
+    и служит проверкой ETag; затем первая страница табаков и один
+    объединённый запрос за последними и избранными миксами.
+    """
+    result = await session.execute(
+        select(
+            User.created_at,
+            User.data_version,
+            User.tobaccos_count,
+            User.mixes_count,
+            User.favorites_count,
+            User.likes_count,
+            User.dislikes_count,
+        ).where(User.id == user.id)
+    )
+    row = result.one()
+
+    registry = get_registry()
+    # Профиль и реестр категорий не меняют data_version — учитываем их отдельно
+    extra = zlib.crc32(f"{user.username}|{user.first_name}|{registry.etag}".encode())
+    etag = (
+        f'W/"{user.telegram_id}.{row.data_version}.bootstrap.'
+        f'{tobaccos_limit}.{mixes_limit}.{extra:x}"'
     )
+    not_modified = conditional(response, if_none_match, etag)
+    if not_modified:
+        return not_modified
 
-    # Количество избранных
-    favorites_count = await session.scalar(
-        select(func.count(Mix.id)).where(
-            Mix.user_id == user.id,
-            Mix.is_favorite == True
-        )
+    result = await session.execute(
+        select(*TOBACCO_COLUMNS)
+        .where(Tobacco.user_id == user.id)
+        .order_by(Tobacco.name)
+        .limit(tobaccos_limit)
     )
+    tobaccos = [serialize_tobacco(t) for t in result]
 
-    return StatsResponse(
-        tobaccos_count=tobaccos_count or 0,
-        mixes_count=mixes_count or 0,
-        favorites_count=favorites_count or 0,
+    recent_ids = (
+        select(Mix.id)
+        .where(Mix.user_id == user.id)
+        .order_by(Mix.created_at.desc())
+        .limit(mixes_limit)
+        .scalar_subquery()
+    )
+    is_recent = Mix.id.in_(recent_ids).label("is_recent")
+    result = await session.execute(
+        select(*MIX_COLUMNS, is_recent)
+        .where(Mix.user_id == user.id)
+        .where(or_(Mix.is_favorite == True, Mix.id.in_(recent_ids)))
+        .order_by(Mix.created_at.desc())
+    )
+    mixes, favorites = [], []
+    for mix in result:
+        data = serialize_mix(mix)
+        if mix.is_recent:
+            mixes.append(data)
+        if mix.is_favorite:
+            favorites.append(data)
+
+    return FastJSONResponse(
+        {
+            "user": {
+                "telegram_id": user.telegram_id,
+                "username": user.username,
+                "first_name": user.first_name,
+                "id": user.id,
+                "created_at": row.created_at,
+            },
+            "stats": {
+                "tobaccos_count": row.tobaccos_count,
+                "mixes_count": row.mixes_count,
+                "favorites_count": row.favorites_count,
+                "likes_count": row.likes_count,
+                "dislikes_count": row.dislikes_count,
+            },
+            "categories": [registry.as_dict(c.id) for c in registry.categories],
+            "tobaccos": tobaccos,
+            "mixes": mixes,
+            "favorites": favorites,
+        },
+        headers=response.headers,
     )
 
 
 # ============ CATEGORY ENDPOINTS ============
 
 @app.get("/api/categories", response_model=List[CategoryResponse], tags=["Categories"])
-async def get_categories(session: AsyncSession = Depends(get_session)):
-    """Получить все категории табаков."""
-    result = await session.execute(select(Category).order_by(Category.name))
-    return result.scalars().all()
+async def get_categories(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+):
+    """Получить все категории табаков (из реестра, с долгим кэшированием)."""
+    registry = get_registry()
+    headers = {
+        "Cache-Control": "public, max-age=86400",
+        "ETag": registry.etag,
+    }
+    if etag_matches(if_none_match, registry.etag):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return registry.categories
+
+
+# ============ CATALOG ENDPOINTS ============
+
+@app.get("/api/catalog/suggest", response_model=List[CatalogSuggestion], tags=["Catalog"])
+async def suggest_catalog(
+    q: str = Query(..., min_length=1, max_length=100),
+    kind: Optional[str] = Query(None, pattern="^(brand|flavor)$"),
+    brand_id: Optional[int] = None,
+    limit: int = Query(10, ge=1, le=NODE_CAPACITY),
+):
+    """Автодополнение брендов и вкусов из общего каталога (без обращения к БД)."""
+    suggestions = get_catalog().suggest(q, limit=limit, kind=kind, brand_id=brand_id)
+    return FastJSONResponse(
+        [entry.as_dict() for entry in suggestions],
+        headers={"Cache-Control": "public, max-age=300"},
+    )
 
 
 # ============ TOBACCO ENDPOINTS ============
 
 @app.get("/api/tobaccos", response_model=List[TobaccoResponse], tags=["Tobaccos"])
 async def get_tobaccos(
-    user: User = Depends(get_current_user),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Получить все табаки пользователя."""
-    result = await session.execute(
-        select(Tobacco)
-        .where(Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
-        .order_by(Tobacco.name)
+    not_modified = await revalidate(session, user, response, if_none_match, "tobaccos")
+    if not_modified:
+        return not_modified
+
+    async def render() -> list:
+        result = await session.execute(
+            select(*TOBACCO_COLUMNS)
+            .where(Tobacco.user_id == user.id)
+            .order_by(Tobacco.name)
+        )
+        return [serialize_tobacco(row) for row in result]
+
+    return await cached_listing(response, render)
+
+
+@app.get("/api/tobaccos/search", response_model=List[TobaccoSearchResult], tags=["Tobaccos"])
+async def search_tobaccos(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    user: Identity = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """Поиск по коллекции: опечатки, кириллица/латиница, русские и английские вкусы.
+
+    Индекс строится в памяти и живёт до следующего изменения данных
+    пользователя (data_version), так что повторный поиск — без чтения табаков.
+    """
+    version = await get_data_version(session, user.id)
+    index = search_indexes.get(user.telegram_id, version)
+    if index is None:
+        result = await session.execute(
+            select(*TOBACCO_COLUMNS).where(Tobacco.user_id == user.id)
+        )
+        index = search_indexes.put(
+            user.telegram_id, version, [serialize_tobacco(row) for row in result]
+        )
+
+    return FastJSONResponse(
+        [{**tobacco, "score": score} for tobacco, score in index.search(q, limit)]
     )
-    return result.scalars().all()
 
 
 @app.get("/api/tobaccos/{tobacco_id}", response_model=TobaccoResponse, tags=["Tobaccos"])
 async def get_tobacco(
     tobacco_id: int,
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Получить конкретный табак."""
     result = await session.execute(
         select(Tobacco)
         .where(Tobacco.id == tobacco_id, Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
     )
     tobacco = result.scalar_one_or_none()
 
     if not tobacco:
         raise HTTPException(status_code=404, detail="Табак не найден")
 
-    return tobacco
+    return serialize_tobacco(tobacco)
+
+
+@app.get("/api/tobaccos/{tobacco_id}/mixes", response_model=List[MixResponse], tags=["Tobaccos"])
+async def get_tobacco_mixes(
+    tobacco_id: int,
+    user: Identity = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """Получить миксы, в которых участвует табак."""
+    return await mixes_with_tobacco(session, user.id, tobacco_id)
 
 
 @app.post("/api/tobaccos", response_model=TobaccoResponse, tags=["Tobaccos"])
 async def create_tobacco(
     data: TobaccoCreate,
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Добавить табак в коллекцию."""
-    # Проверяем уникальность названия
-    result = await session.execute(
-        select(Tobacco)
-        .where(Tobacco.user_id == user.id)
-        .where(Tobacco.name.ilike(data.name))
-    )
-    existing = result.scalar_one_or_none()
-
-    if existing:
-        raise HTTPException(status_code=400, detail=f"Табак '{data.name}' уже есть в коллекции")
-
-    tobacco = Tobacco(
-        user_id=user.id,
-        name=data.name,
-        brand=data.brand,
-        category_id=data.category_id,
-        notes=data.notes,
-    )
-    session.add(tobacco)
+    tobacco, deltas = await mutations.add_tobacco(session, user.id, data)
+    await bump_counters(session, user.id, **deltas)
     await session.commit()
     await session.refresh(tobacco)
 
-    # Загружаем категорию
-    result = await session.execute(
-        select(Tobacco)
-        .where(Tobacco.id == tobacco.id)
-        .options(selectinload(Tobacco.category))
-    )
-    return result.scalar_one()
+    return serialize_tobacco(tobacco)
 
 
 @app.post("/api/tobaccos/bulk", response_model=TobaccoBulkResponse, tags=["Tobaccos"])
 async def create_tobaccos_bulk(
     data: TobaccoBulkCreate,
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Массовое добавление табаков."""
@@ -238,7 +696,7 @@ async def create_tobaccos_bulk(
     )
     existing_names = {name.lower() for name in result.scalars().all()}
 
-    added = []
+    rows = []
     skipped = []
     errors = []
 
@@ -247,78 +705,72 @@ async def create_tobaccos_bulk(
             errors.append(f"'{item.name}' — слишком короткое название")
             continue
 
-        if item.name.lower() in existing_names:
-            skipped.append(item.name)
+        try:
+            entry = mutations.link_catalog(item.name, item.brand, item.catalog_id)
+        except HTTPException as e:
+            errors.append(f"'{item.name}' — {e.detail.lower()}")
             continue
+        name = entry.name if entry else item.name
 
-        tobacco = Tobacco(
-            user_id=user.id,
-            name=item.name,
-            brand=item.brand,
-            category_id=item.category_id,
+        if name.lower() in existing_names:
+            skipped.append(name)
+            continue
+
+        rows.append({
+            "user_id": user.id,
+            "name": name,
+            "brand": entry.brand if entry else item.brand,
+            "category_id": item.category_id or (entry.category_id if entry else None),
+            "notes": item.notes,
+            "catalog_id": entry.id if entry else None,
+        })
+        existing_names.add(name.lower())
+
+    # Один многострочный INSERT ... RETURNING вместо INSERT на каждый табак.
+    # Без sort_by_parameter_order (в SQLite он выполняется построчно): id
+    # сопоставляются по названию, оно уникально в пачке
+    added = []
+    added_ids = []
+    if rows:
+        result = await session.execute(
+            insert(Tobacco).returning(Tobacco.id, Tobacco.name),
+            rows,
         )
-        session.add(tobacco)
-        existing_names.add(item.name.lower())
-        added.append(item.name)
+        ids = {name.lower(): tobacco_id for tobacco_id, name in result.all()}
+        added = [row["name"] for row in rows]
+        added_ids = [ids[name.lower()] for name in added]
+        await bump_counters(session, user.id, tobaccos_count=len(added_ids))
 
     await session.commit()
 
-    return TobaccoBulkResponse(added=added, skipped=skipped, errors=errors)
+    return TobaccoBulkResponse(added=added, skipped=skipped, errors=errors, added_ids=added_ids)
 
 
 @app.put("/api/tobaccos/{tobacco_id}", response_model=TobaccoResponse, tags=["Tobaccos"])
 async def update_tobacco(
     tobacco_id: int,
     data: TobaccoUpdate,
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Обновить табак."""
-    result = await session.execute(
-        select(Tobacco).where(Tobacco.id == tobacco_id, Tobacco.user_id == user.id)
-    )
-    tobacco = result.scalar_one_or_none()
-
-    if not tobacco:
-        raise HTTPException(status_code=404, detail="Табак не найден")
-
-    if data.name is not None:
-        tobacco.name = data.name
-    if data.brand is not None:
-        tobacco.brand = data.brand
-    if data.category_id is not None:
-        tobacco.category_id = data.category_id
-    if data.notes is not None:
-        tobacco.notes = data.notes
-
+    tobacco, deltas = await mutations.update_tobacco(session, user.id, tobacco_id, data)
+    await bump_counters(session, user.id, **deltas)
     await session.commit()
     await session.refresh(tobacco)
 
-    # Загружаем категорию
-    result = await session.execute(
-        select(Tobacco)
-        .where(Tobacco.id == tobacco.id)
-        .options(selectinload(Tobacco.category))
-    )
-    return result.scalar_one()
+    return serialize_tobacco(tobacco)
 
 
 @app.delete("/api/tobaccos/{tobacco_id}", tags=["Tobaccos"])
 async def delete_tobacco(
     tobacco_id: int,
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Удалить табак."""
-    result = await session.execute(
-        select(Tobacco).where(Tobacco.id == tobacco_id, Tobacco.user_id == user.id)
-    )
-    tobacco = result.scalar_one_or_none()
-
-    if not tobacco:
-        raise HTTPException(status_code=404, detail="Табак не найден")
-
-    await session.delete(tobacco)
+    _, deltas = await mutations.delete_tobacco(session, user.id, tobacco_id)
+    await bump_counters(session, user.id, **deltas)
     await session.commit()
 
     return {"message": "Табак удалён"}
@@ -326,38 +778,49 @@ async def delete_tobacco(
 
 @app.delete("/api/tobaccos", tags=["Tobaccos"])
 async def delete_all_tobaccos(
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Удалить все табаки пользователя."""
     result = await session.execute(
-        select(Tobacco).where(Tobacco.user_id == user.id)
+        delete(Tobacco)
+        .where(Tobacco.user_id == user.id)
+        .returning(Tobacco.id)
     )
-    tobaccos = result.scalars().all()
-
-    count = len(tobaccos)
-    for tobacco in tobaccos:
-        await session.delete(tobacco)
-
+    deleted_ids = list(result.scalars().all())
+    await detach_tobaccos(session, deleted_ids)
+    await bump_counters(session, user.id, tobaccos_count=-len(deleted_ids))
     await session.commit()
 
-    return {"message": f"Удалено {count} табаков"}
+    count = len(deleted_ids)
+    return {"message": f"Удалено {count} табаков", "count": count, "ids": deleted_ids}
 
 
 # ============ MIX ENDPOINTS ============
 
-@app.post("/api/mixes/generate", response_model=MixGenerateResponse, tags=["Mixes"])
+@app.post(
+    "/api/mixes/generate",
+    response_model=MixGenerateResponse,
+    tags=["Mixes"],
+    dependencies=[Depends(readiness.track_generation)],
+)
 async def generate_mix(
     data: MixGenerateRequest,
-    user: User = Depends(get_current_user),
+    request: Request,
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
-    """Сгенерировать микс через AI."""
+    """Сгенерировать микс через AI.
+
+    Если клиент отключится до ответа LLM, запрос к LLM отменяется,
+    а микс не сохраняется (ответ 499). Бюджет времени — по request_type;
+    если на LLM его не хватило, микс составляется локально.
+    """
+    rebudget(data.request_type)
+
     # Получаем табаки пользователя
     result = await session.execute(
-        select(Tobacco)
-        .where(Tobacco.user_id == user.id)
-        .options(selectinload(Tobacco.category))
+        select(Tobacco).where(Tobacco.user_id == user.id)
     )
     tobaccos = result.scalars().all()
 
@@ -365,14 +828,17 @@ async def generate_mix(
         raise HTTPException(status_code=400, detail="Нужно минимум 2 табака для микса")
 
     # Формируем данные для LLM
-    tobaccos_data = [
-        {
+    # Для табаков из каталога бренд и категория — канонические
+    registry = get_registry()
+    catalog = get_catalog()
+    tobaccos_data = []
+    for t in tobaccos:
+        entry = catalog.get(t.catalog_id)
+        tobaccos_data.append({
             "name": t.name,
-            "brand": t.brand,
-            "category": t.category.name if t.category else None,
-        }
-        for t in tobaccos
-    ]
+            "brand": entry.brand if entry else t.brand,
+            "category": registry.name_for(t.category_id or (entry.category_id if entry else None)),
+        })
 
     # Получаем историю оценок
     result = await session.execute(
@@ -394,9 +860,12 @@ async def generate_mix(
     recent_mixes = result.scalars().all()
     previous_names = [m.name for m in recent_mixes]
 
+    # Давние миксы из архива retention — по сигнатурам состава
+    archived = await archived_mixes(session, user.id)
+
     try:
-        # Генерируем микс
-        recommendation = await llm_service.generate_mix(
+        # Генерируем микс (с отменой, если клиент ушёл)
+        recommendation = await cancel_on_disconnect(request, llm_service.generate_mix(
             tobaccos=tobaccos_data,
             request_type=data.request_type,
             base_tobacco=data.base_tobacco,
@@ -404,7 +873,8 @@ async def generate_mix(
             liked_mixes=liked if liked else None,
             disliked_mixes=disliked if disliked else None,
             previous_mixes=previous_names if previous_names else None,
-        )
+            archived_mixes=archived if archived else None,
+        ))
 
         # Сохраняем микс в БД
         components_dict = {
@@ -421,6 +891,12 @@ async def generate_mix(
             request_type=data.request_type,
         )
         session.add(mix)
+        await session.flush()
+        await write_mix_components(
+            session, mix.id, components_dict,
+            {t.name.lower(): t.id for t in tobaccos},
+        )
+        await bump_counters(session, user.id, mixes_count=1)
         await session.commit()
         await session.refresh(mix)
 
@@ -439,45 +915,67 @@ async def generate_mix(
             tips=recommendation.tips,
         )
 
+    except (HTTPException, DeadlineExceeded):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/mixes", response_model=List[MixResponse], tags=["Mixes"])
 async def get_mixes(
-    user: User = Depends(get_current_user),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
     limit: int = 20,
 ):
     """Получить историю миксов."""
-    result = await session.execute(
-        select(Mix)
-        .where(Mix.user_id == user.id)
-        .order_by(Mix.created_at.desc())
-        .limit(limit)
+    not_modified = await revalidate(
+        session, user, response, if_none_match, f"mixes.{limit}"
     )
-    return result.scalars().all()
+    if not_modified:
+        return not_modified
+
+    async def render() -> list:
+        result = await session.execute(
+            select(*MIX_COLUMNS)
+            .where(Mix.user_id == user.id)
+            .order_by(Mix.created_at.desc())
+            .limit(limit)
+        )
+        return [serialize_mix(row) for row in result]
+
+    return await cached_listing(response, render)
 
 
 @app.get("/api/mixes/favorites", response_model=List[MixResponse], tags=["Mixes"])
 async def get_favorites(
-    user: User = Depends(get_current_user),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Получить избранные миксы."""
-    result = await session.execute(
-        select(Mix)
-        .where(Mix.user_id == user.id)
-        .where(Mix.is_favorite == True)
-        .order_by(Mix.created_at.desc())
-    )
-    return result.scalars().all()
+    not_modified = await revalidate(session, user, response, if_none_match, "favorites")
+    if not_modified:
+        return not_modified
+
+    async def render() -> list:
+        result = await session.execute(
+            select(*MIX_COLUMNS)
+            .where(Mix.user_id == user.id)
+            .where(Mix.is_favorite == True)
+            .order_by(Mix.created_at.desc())
+        )
+        return [serialize_mix(row) for row in result]
+
+    return await cached_listing(response, render)
 
 
 @app.get("/api/mixes/{mix_id}", response_model=MixResponse, tags=["Mixes"])
 async def get_mix(
     mix_id: int,
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Получить конкретный микс."""
@@ -496,19 +994,12 @@ async def get_mix(
 async def rate_mix(
     mix_id: int,
     data: MixRateRequest,
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Оценить микс."""
-    result = await session.execute(
-        select(Mix).where(Mix.id == mix_id, Mix.user_id == user.id)
-    )
-    mix = result.scalar_one_or_none()
-
-    if not mix:
-        raise HTTPException(status_code=404, detail="Микс не найден")
-
-    mix.rating = data.rating
+    mix, deltas = await mutations.rate_mix(session, user.id, mix_id, data.rating)
+    await bump_counters(session, user.id, **deltas)
     await session.commit()
     await session.refresh(mix)
 
@@ -519,19 +1010,12 @@ async def rate_mix(
 async def toggle_favorite(
     mix_id: int,
     data: MixFavoriteRequest,
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Добавить/убрать из избранного."""
-    result = await session.execute(
-        select(Mix).where(Mix.id == mix_id, Mix.user_id == user.id)
-    )
-    mix = result.scalar_one_or_none()
-
-    if not mix:
-        raise HTTPException(status_code=404, detail="Микс не найден")
-
-    mix.is_favorite = data.is_favorite
+    mix, deltas = await mutations.set_favorite(session, user.id, mix_id, data.is_favorite)
+    await bump_counters(session, user.id, **deltas)
     await session.commit()
     await session.refresh(mix)
 
@@ -540,34 +1024,173 @@ async def toggle_favorite(
 
 @app.delete("/api/mixes/favorites", tags=["Mixes"])
 async def clear_favorites(
-    user: User = Depends(get_current_user),
+    user: Identity = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Очистить избранное."""
     result = await session.execute(
-        select(Mix)
+        update(Mix)
         .where(Mix.user_id == user.id)
         .where(Mix.is_favorite == True)
+        .values(is_favorite=False)
+        .returning(Mix.id)
     )
-    mixes = result.scalars().all()
+    cleared_ids = list(result.scalars().all())
+    await bump_counters(session, user.id, favorites_count=-len(cleared_ids))
+    await session.commit()
+
+    count = len(cleared_ids)
+    return {"message": f"Убрано из избранного: {count} миксов", "count": count, "ids": cleared_ids}
+
+
+# ============ BATCH ENDPOINT ============
+
+async def _apply_operation(
+    session: AsyncSession, user_id: int, op
+) -> Tuple[dict, Dict[str, int]]:
+    """Выполняет одну операцию пачки: (результат, дельты счётчиков)."""
+    if isinstance(op, BatchRateOp):
+        mix, deltas = await mutations.rate_mix(session, user_id, op.mix_id, op.rating)
+        return serialize_mix(mix), deltas
+    if isinstance(op, BatchFavoriteOp):
+        mix, deltas = await mutations.set_favorite(session, user_id, op.mix_id, op.is_favorite)
+        return serialize_mix(mix), deltas
+    if isinstance(op, BatchAddTobaccoOp):
+        tobacco, deltas = await mutations.add_tobacco(session, user_id, op)
+        return serialize_tobacco(tobacco), deltas
+    if isinstance(op, BatchUpdateTobaccoOp):
+        tobacco, deltas = await mutations.update_tobacco(session, user_id, op.tobacco_id, op)
+        return serialize_tobacco(tobacco), deltas
+
+    deleted_id, deltas = await mutations.delete_tobacco(session, user_id, op.tobacco_id)
+    return {"id": deleted_id}, deltas
+
+
+@app.post("/api/batch", response_model=BatchResponse, tags=["Batch"])
+async def apply_batch(
+    data: BatchRequest,
+    user: Identity = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """Применить пачку операций одной транзакцией.
+
+    Операции выполняются по порядку, каждая в своей точке сохранения:
+    ошибка одной (нет микса, дубликат табака) откатывает только её.
+    С atomic=True первая ошибка откатывает всю пачку. Счётчики
+    сдвигаются одним UPDATE в конце.
+    """
+    # Транзакция открывается записью: pysqlite начинает её только перед DML,
+    # а SAVEPOINT вне транзакции сам коммитится на RELEASE
+    await bump_counters(session, user.id)
+
+    results: List[BatchResult] = []
+    totals: Dict[str, int] = {}
+    for index, op in enumerate(data.operations):
+        try:
+            async with session.begin_nested():
+                result, deltas = await _apply_operation(session, user.id, op)
+        except HTTPException as e:
+            results.append(
+                BatchResult(index=index, op=op.op, status=e.status_code, detail=e.detail)
+            )
+            if data.atomic:
+                await session.rollback()
+                cancelled = [
+                    BatchResult(index=i, op=o.op, status=424, detail="Пачка отменена")
+                    for i, o in enumerate(data.operations)
+                    if i != index
+                ]
+                results = sorted(cancelled + results[-1:], key=lambda r: r.index)
+                return BatchResponse(applied=0, results=results)
+            continue
 
-    count = len(mixes)
-    for mix in mixes:
-        mix.is_favorite = False
+        results.append(BatchResult(index=index, op=op.op, status=200, result=result))
+        for name, delta in deltas.items():
+            totals[name] = totals.get(name, 0) + delta
 
+    if any(totals.values()):
+        await bump_counters(session, user.id, **totals)
     await session.commit()
 
-    return {"message": f"Убрано из избранного: {count} миксов"}
+    applied = sum(1 for r in results if r.status == 200)
+    return BatchResponse(applied=applied, results=results)
+
+
+# ============ EXPORT / IMPORT ============
+
+@app.get("/api/export", tags=["Export"])
+async def export_collection(
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    kind: str = Query("all", pattern="^(all|tobaccos|mixes)$"),
+    user: Identity = Depends(get_current_user),
+):
+    """Выгрузить коллекцию и историю миксов потоком (NDJSON или CSV)."""
+    if fmt == "csv" and kind == "all":
+        raise HTTPException(status_code=400, detail="CSV выгружается отдельно: kind=tobaccos или kind=mixes")
+
+    kinds = ["tobaccos", "mixes"] if kind == "all" else [kind]
+    media_type = "text/csv; charset=utf-8" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_export(user.telegram_id, user.id, kinds, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="hookah-{kind}.{fmt}"'},
+    )
+
+
+@app.post("/api/import", response_model=ImportProgressResponse, tags=["Import"])
+async def import_collection(
+    request: Request,
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+    user: Identity = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """Загрузить табаки и миксы из NDJSON или CSV (тело читается потоком).
+
+    Записи пишутся пачками по import_batch_size, ход виден в
+    GET /api/import/progress. Формат — из ?format= или Content-Type.
+    """
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+
+    progress = import_jobs.start(user.telegram_id, fmt)
+    return await import_stream(session, user.id, request.stream(), fmt, progress)
+
+
+@app.get("/api/import/progress", response_model=ImportProgressResponse, tags=["Import"])
+async def get_import_progress(user: Identity = Depends(get_current_user)):
+    """Ход текущего или последнего импорта."""
+    progress = import_jobs.get(user.telegram_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Импорт не запускался")
+    return progress
 
 
 # ============ HEALTH CHECK ============
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в формате Prometheus."""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
 @app.get("/api/health", tags=["Health"])
 async def health_check():
-    """Проверка работоспособности API."""
+    """Проверка работоспособности API (живость процесса, без обращения к БД)."""
     return {"status": "ok"}
 
 
+@app.get("/api/ready", tags=["Health"])
+async def readiness_check():
+    """Готовность принимать трафик: 200 после прогрева, 503 во время прогрева и drain."""
+    return JSONResponse(
+        readiness.status(),
+        status_code=200 if readiness.ready else 503,
+        headers={"Cache-Control": "no-store"},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     import os
@@ -0,0 +1,150 @@
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from catalog import CatalogEntry, get_catalog
+from counters import rating_deltas
+from mix_components import detach_tobaccos
+from models import Mix, Tobacco
+from schemas import TobaccoCreate, TobaccoUpdate
+
+# Изменения коллекции и миксов без коммита и без сдвига счётчиков.
+# Каждая функция возвращает объект и дельты для bump_counters — их
+# применяет вызывающий код: эндпоинт сразу, /api/batch одним UPDATE на пачку.
+
+Deltas = Dict[str, int]
+
+
+def link_catalog(
+    name: str, brand: Optional[str], catalog_id: Optional[int]
+) -> Optional[CatalogEntry]:
+    """Вкус каталога для табака: по явному catalog_id или точному названию.
+
+    Связанный табак хранит каноническое название и бренд из каталога —
+    их же видит промпт генерации.
+    """
+    catalog = get_catalog()
+    if catalog_id is None:
+        return catalog.match(name, brand)
+
+    entry = catalog.get(catalog_id)
+    if entry is None or entry.kind != "flavor":
+        raise HTTPException(status_code=400, detail="Вкус не найден в каталоге")
+    return entry
+
+
+async def add_tobacco(
+    session: AsyncSession, user_id: int, data: TobaccoCreate
+) -> Tuple[Tobacco, Deltas]:
+    """Добавляет табак, проверяя уникальность названия."""
+    name, brand, category_id = data.name, data.brand, data.category_id
+    entry = link_catalog(name, brand, data.catalog_id)
+    if entry:
+        name, brand = entry.name, entry.brand
+        category_id = category_id or entry.category_id
+
+    result = await session.execute(
+        select(Tobacco.id)
+        .where(Tobacco.user_id == user_id)
+        .where(Tobacco.name.ilike(name))
+    )
+    if result.first():
+        raise HTTPException(status_code=400, detail=f"Табак '{name}' уже есть в коллекции")
+
+    tobacco = Tobacco(
+        user_id=user_id,
+        name=name,
+        brand=brand,
+        category_id=category_id,
+        notes=data.notes,
+        catalog_id=entry.id if entry else None,
+    )
+    session.add(tobacco)
+    await session.flush()
+    return tobacco, {"tobaccos_count": 1}
+
+
+async def update_tobacco(
+    session: AsyncSession, user_id: int, tobacco_id: int, data: TobaccoUpdate
+) -> Tuple[Tobacco, Deltas]:
+    """Обновляет переданные поля табака."""
+    result = await session.execute(
+        select(Tobacco).where(Tobacco.id == tobacco_id, Tobacco.user_id == user_id)
+    )
+    tobacco = result.scalar_one_or_none()
+
+    if not tobacco:
+        raise HTTPException(status_code=404, detail="Табак не найден")
+
+    if data.name is not None:
+        tobacco.name = data.name
+    if data.brand is not None:
+        tobacco.brand = data.brand
+    if data.category_id is not None:
+        tobacco.category_id = data.category_id
+    if data.notes is not None:
+        tobacco.notes = data.notes
+
+    # Смена названия или бренда перепроверяет связь с каталогом
+    if data.catalog_id is not None or data.name is not None or data.brand is not None:
+        entry = link_catalog(tobacco.name, tobacco.brand, data.catalog_id)
+        tobacco.catalog_id = entry.id if entry else None
+        if entry:
+            tobacco.name, tobacco.brand = entry.name, entry.brand
+            if tobacco.category_id is None:
+                tobacco.category_id = entry.category_id
+
+    await session.flush()
+    return tobacco, {}
+
+
+async def delete_tobacco(
+    session: AsyncSession, user_id: int, tobacco_id: int
+) -> Tuple[int, Deltas]:
+    """Удаляет табак и отвязывает его от компонентов миксов."""
+    result = await session.execute(
+        delete(Tobacco)
+        .where(Tobacco.id == tobacco_id, Tobacco.user_id == user_id)
+        .returning(Tobacco.id)
+    )
+    deleted_id = result.scalar_one_or_none()
+    if deleted_id is None:
+        raise HTTPException(status_code=404, detail="Табак не найден")
+
+    await detach_tobaccos(session, [deleted_id])
+    return deleted_id, {"tobaccos_count": -1}
+
+
+async def _get_mix(session: AsyncSession, user_id: int, mix_id: int) -> Mix:
+    result = await session.execute(
+        select(Mix).where(Mix.id == mix_id, Mix.user_id == user_id)
+    )
+    mix = result.scalar_one_or_none()
+
+    if not mix:
+        raise HTTPException(status_code=404, detail="Микс не найден")
+    return mix
+
+
+async def rate_mix(
+    session: AsyncSession, user_id: int, mix_id: int, rating: int
+) -> Tuple[Mix, Deltas]:
+    """Ставит оценку миксу."""
+    mix = await _get_mix(session, user_id, mix_id)
+    deltas = rating_deltas(mix.rating, rating)
+    mix.rating = rating
+    await session.flush()
+    return mix, deltas
+
+
+async def set_favorite(
+    session: AsyncSession, user_id: int, mix_id: int, is_favorite: bool
+) -> Tuple[Mix, Deltas]:
+    """Добавляет микс в избранное или убирает из него."""
+    mix = await _get_mix(session, user_id, mix_id)
+    deltas = {"favorites_count": int(is_favorite) - int(mix.is_favorite)}
+    mix.is_favorite = is_favorite
+    await session.flush()
+    return mix, deltas
@@ -0,0 +1,192 @@
+"""Профилировщик SQL: запросы на HTTP-запрос, повторы (N+1), медленные запросы.
+
+Слушает события engine (before/after_cursor_execute) и пишет каждый
+запрос во все активные профили текущего контекста: профиль запроса из
+ProfilerMiddleware и, например, вложенный assert_max_queries.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StatementStats:
+    count: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class Profile:
+    """Запросы к БД в рамках одного HTTP-запроса (или блока кода)."""
+    label: str
+    queries: int = 0
+    seconds: float = 0.0
+    statements: Dict[str, StatementStats] = field(default_factory=dict)
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.queries += 1
+        self.seconds += elapsed
+        stats = self.statements.get(statement)
+        if stats is None:
+            stats = self.statements[statement] = StatementStats()
+        stats.count += 1
+        stats.seconds += elapsed
+
+    def repeated(self, threshold: int) -> List[Tuple[str, StatementStats]]:
+        """Одинаковые запросы, выполненные не меньше threshold раз — кандидаты в N+1."""
+        return sorted(
+            ((statement, stats) for statement, stats in self.statements.items() if stats.count >= threshold),
+            key=lambda item: item[1].count,
+            reverse=True,
+        )
+
+    def summary(self) -> str:
+        lines = [f"{self.label}: {self.queries} queries, {self.seconds * 1000:.1f} ms"]
+        for statement, stats in sorted(
+            self.statements.items(), key=lambda item: item[1].seconds, reverse=True
+        ):
+            lines.append(f"  {stats.count}× {stats.seconds * 1000:.1f} ms  {_shorten(statement)}")
+        return "\n".join(lines)
+
+
+current_profiles: ContextVar[Tuple[Profile, ...]] = ContextVar("current_profiles", default=())
+
+
+def _shorten(statement: str, limit: int = 300) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "…"
+
+
+@contextmanager
+def profiling(label: str) -> Iterator[Profile]:
+    """Профиль запросов, выполненных внутри блока (в том числе вложенного)."""
+    profile = Profile(label)
+    token = current_profiles.set(current_profiles.get() + (profile,))
+    try:
+        yield profile
+    finally:
+        current_profiles.reset(token)
+
+
+@contextmanager
+def assert_max_queries(limit: int, label: str = "block") -> Iterator[Profile]:
+    """Падает с AssertionError, если блок выполнил больше limit SQL-запросов.
+
+        with assert_max_queries(3):
+            await client.get("/api/bootstrap", headers=headers)
+    """
+    with profiling(label) as profile:
+        yield profile
+    if profile.queries > limit:
+        raise AssertionError(f"Ожидалось не больше {limit} запросов\n{profile.summary()}")
+
+
+def report(profile: Profile) -> None:
+    """Предупреждение о повторяющихся запросах по итогам профиля."""
+    for statement, stats in profile.repeated(settings.sql_repeat_threshold):
+        logger.warning(
+            "Possible N+1 in %s: %d× (%.1f ms) %s",
+            profile.label, stats.count, stats.seconds * 1000, _shorten(statement),
+        )
+
+
+# ============ СОБЫТИЯ ENGINE ============
+
+def _explain(conn, statement: str, parameters) -> List[str]:
+    """EXPLAIN QUERY PLAN отдельным курсором того же соединения (только SQLite).
+
+    Выполняется мимо событий SQLAlchemy, чтобы не попасть в профили.
+    """
+    if conn.dialect.name != "sqlite":
+        return []
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [str(row[-1]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def _log_slow(conn, statement: str, parameters, elapsed: float, executemany: bool) -> None:
+    plan: List[str] = []
+    if settings.sql_explain_slow and not executemany:
+        try:
+            plan = _explain(conn, statement, parameters)
+        except Exception as e:
+            plan = [f"EXPLAIN failed: {e}"]
+    profiles = current_profiles.get()
+    logger.warning(
+        "Slow query %.1f ms%s: %s | params=%r%s",
+        elapsed * 1000,
+        f" in {profiles[-1].label}" if profiles else "",
+        _shorten(statement, 1000),
+        parameters if not executemany else f"{len(parameters)} rows",
+        "".join(f"\n    plan: {line}" for line in plan),
+    )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["profiler_started"].pop()
+    for profile in current_profiles.get():
+        profile.record(statement, elapsed)
+    if 0 < settings.sql_slow_query_ms <= elapsed * 1000:
+        _log_slow(conn, statement, parameters, elapsed, executemany)
+
+
+def _handle_error(context) -> None:
+    started = context.connection.info.get("profiler_started") if context.connection else None
+    if started:
+        started.pop()
+
+
+def profile_engine(engine: AsyncEngine) -> None:
+    """Подписывает профилировщик на события engine (один раз на engine)."""
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+# ============ ASGI MIDDLEWARE ============
+
+class ProfilerMiddleware:
+    """Профиль SQL каждого HTTP-запроса: Server-Timing и предупреждения о N+1."""
+
+    def __init__(self, app, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.skip_paths:
+            return await self.app(scope, receive, send)
+
+        with profiling(f"{scope['method']} {scope.get('path', '')}") as profile:
+            async def send_wrapper(message):
+                # Заголовки уходят до тела: для потоковых ответов это запросы
+                # до начала стриминга
+                if message["type"] == "http.response.start":
+                    timing = f'db;dur={profile.seconds * 1000:.1f};desc="{profile.queries} queries"'
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", timing.encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+        report(profile)
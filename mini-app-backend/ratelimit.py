@@ -0,0 +1,283 @@
+import json
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from auth import AuthError, session_tokens, validate_init_data
+from config import settings
+from models import RateBucket
+
+
+@dataclass(frozen=True)
+class Limit:
+    """Бюджет token bucket: ёмкость (всплеск) и пополнение в токенах/сек."""
+    capacity: float
+    rate: float
+
+    @classmethod
+    def per_minute(cls, burst: float, per_minute: float) -> "Limit":
+        return cls(capacity=float(burst), rate=per_minute / 60.0)
+
+    def refill(self, tokens: float, elapsed: float) -> float:
+        return min(self.capacity, tokens + max(elapsed, 0.0) * self.rate)
+
+
+class MemoryBuckets:
+    """Вёдра в памяти процесса: LRU не больше maxsize ключей.
+
+    Ведро, которое успело наполниться, равно отсутствующему, поэтому
+    простаивающие вёдра выбрасываются с головы LRU при каждом обращении.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        # key → (токены, время обновления, момент, когда ведро снова полное)
+        self._items: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        """Списывает cost токенов. Возвращает 0 или сколько секунд ждать."""
+        now = time.monotonic()
+        while self._items:
+            oldest = next(iter(self._items.values()))
+            if oldest[2] > now:
+                break
+            self._items.popitem(last=False)
+
+        tokens, updated, _ = self._items.pop(key, (limit.capacity, now, now))
+        tokens = limit.refill(tokens, now - updated)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / limit.rate
+
+        self._items[key] = (tokens, now, now + (limit.capacity - tokens) / limit.rate)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return wait
+
+
+class DatabaseBuckets:
+    """Вёдра в таблице rate_buckets — общие для всех процессов с одной БД.
+
+    Списание — один условный UPDATE; строки простаивающих вёдер
+    периодически удаляются.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, session_factory: async_sessionmaker, idle_ttl: float):
+        self.session_factory = session_factory
+        self.idle_ttl = idle_ttl
+        self._calls = 0
+
+    async def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        now = time.time()
+        refill = RateBucket.tokens + (now - RateBucket.updated_at) * limit.rate
+        refilled = case((refill > limit.capacity, limit.capacity), else_=refill)
+
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(RateBucket)
+                .where(RateBucket.key == key, refilled >= cost)
+                .values(tokens=refilled - cost, updated_at=now)
+                .returning(RateBucket.key)
+            )
+            taken = result.first() is not None
+            wait = 0.0
+            if not taken:
+                row = (await session.execute(
+                    select(RateBucket.tokens, RateBucket.updated_at).where(RateBucket.key == key)
+                )).first()
+                if row is None:
+                    await session.execute(
+                        sqlite_insert(RateBucket)
+                        .values(key=key, tokens=limit.capacity - cost, updated_at=now)
+                        .on_conflict_do_nothing()
+                    )
+                else:
+                    tokens = limit.refill(row.tokens, now - row.updated_at)
+                    wait = max((cost - tokens) / limit.rate, 0.0)
+
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                await session.execute(
+                    delete(RateBucket).where(RateBucket.updated_at < now - self.idle_ttl)
+                )
+            await session.commit()
+        return wait
+
+
+class RateLimiter:
+    """Лимиты по пользователю и виду запроса (scope) поверх хранилища вёдер."""
+
+    def __init__(self, limits: Dict[str, Limit], store, enabled: bool = True):
+        self.limits = limits
+        self.store = store
+        self.enabled = enabled
+        self.rejected = 0
+
+    async def check(self, scope: str, key, cost: float = 1.0) -> float:
+        """0 — запрос разрешён, иначе секунды до следующей попытки."""
+        if not self.enabled:
+            return 0.0
+        wait = await self.store.take(f"{scope}:{key}", self.limits[scope], cost)
+        if wait:
+            self.rejected += 1
+        return wait
+
+
+def create_limiter() -> RateLimiter:
+    limits = {
+        "generate": Limit.per_minute(
+            settings.rate_limit_generate_burst, settings.rate_limit_generate_per_minute
+        ),
+        "api": Limit.per_minute(settings.rate_limit_read_burst, settings.rate_limit_read_per_minute),
+    }
+    if settings.rate_limit_store == "database":
+        from database import router
+
+        idle_ttl = max(limit.capacity / limit.rate for limit in limits.values())
+        store = DatabaseBuckets(router.sessionmakers[0], idle_ttl)
+    else:
+        store = MemoryBuckets(settings.rate_limit_max_buckets)
+    return RateLimiter(limits, store, enabled=settings.rate_limit_enabled)
+
+
+rate_limiter = create_limiter()
+
+
+# ============ ASGI MIDDLEWARE ============
+
+# Дорогие запросы — свой, маленький бюджет
+GENERATION_ROUTES = {("POST", "/api/mixes/generate")}
+EXEMPT_PATHS = {"/api/health", "/api/ready"}
+# Вход ключуется пользователем из initData: до токена адрес клиента за
+# прокси у всех один, и общий бюджет на всех блокировал бы входы
+AUTH_PATH = "/api/auth"
+AUTH_MAX_BODY = 16 * 1024
+
+
+def client_key(scope: dict, headers: Dict[str, str]) -> str:
+    """Ключ лимита: пользователь из токена сессии, иначе адрес клиента.
+
+    Подпись токена проверяется (из кэша SessionTokens), чтобы чужой
+    telegram_id в поддельном токене не расходовал чужой бюджет.
+    """
+    authorization = headers.get("authorization", "")
+    if authorization.startswith("Bearer "):
+        try:
+            return f"tg{session_tokens.verify(authorization[7:]).telegram_id}"
+        except AuthError:
+            pass
+    elif not settings.bot_token:
+        value = headers.get("x-telegram-user-id", "")
+        if value.isdigit():
+            return f"tg{value}"
+
+    client = scope.get("client")
+    return f"ip{client[0]}" if client else "ip"
+
+
+def init_data_key(body: bytes) -> Optional[str]:
+    """Ключ лимита для POST /api/auth: пользователь из проверенной initData.
+
+    Подпись проверяется, иначе случайные id в поддельной initData давали бы
+    каждому запросу свой бюджет; такие запросы остаются на ключе адреса.
+    """
+    try:
+        init_data = json.loads(body)["init_data"]
+        fields = validate_init_data(
+            init_data, settings.bot_token, max_age=settings.init_data_max_age
+        )
+        return f"tg{int(fields['user']['id'])}"
+    except (ValueError, KeyError, TypeError, AuthError):
+        return None
+
+
+async def read_body(receive, limit: int) -> Tuple[bytes, bool]:
+    """Читает тело запроса, пока оно не кончится или не превысит limit.
+
+    Возвращает (прочитанное, more_body): при more_body остаток ещё в receive.
+    """
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return body, False
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not more_body or len(body) > limit:
+            return body, more_body
+
+
+def replay_body(body: bytes, more_body: bool, receive) -> Callable[[], Awaitable[dict]]:
+    """receive для приложения: сначала уже прочитанное тело, затем исходный поток."""
+    replayed = False
+
+    async def replay() -> dict:
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": more_body}
+        return await receive()
+
+    return replay
+
+
+class RateLimitMiddleware:
+    """Token bucket на пользователя: 429 с Retry-After при исчерпании бюджета."""
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or scope["method"] == "OPTIONS"
+            or not path.startswith("/api/")
+            or path in EXEMPT_PATHS
+        ):
+            return await self.app(scope, receive, send)
+
+        limit_scope = "generate" if (scope["method"], path) in GENERATION_ROUTES else "api"
+        headers = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+        }
+        key = client_key(scope, headers)
+        if path == AUTH_PATH and scope["method"] == "POST" and key.startswith("ip"):
+            body, more_body = await read_body(receive, AUTH_MAX_BODY)
+            receive = replay_body(body, more_body, receive)
+            key = init_data_key(body) or key
+
+        wait = await self.limiter.check(limit_scope, key)
+        if not wait:
+            return await self.app(scope, receive, send)
+
+        retry_after = max(math.ceil(wait), 1)
+        body = json.dumps(
+            {"detail": f"Слишком много запросов, попробуйте через {retry_after} с"},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
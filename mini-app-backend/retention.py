@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from counters import bump_counters
+from models import Mix, MixArchive, MixIngredient
+from metrics import (
+    retention_bytes_reclaimed,
+    retention_freelist_bytes,
+    retention_mixes_removed,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionReport:
+    """Итог прогона retention."""
+    mode: str
+    cutoff: datetime
+    batches: int = 0
+    mixes_removed: int = 0
+    bytes_reclaimed: int = 0        # оценка объёма удалённых данных
+    freelist_bytes: int = 0         # свободные страницы SQLite после прогона
+
+
+def mix_signature(name: str, components: dict) -> str:
+    """Сигнатура микса для защиты от повторов: название и набор табаков."""
+    tobaccos = ",".join(sorted(n.strip().lower() for n in (components or {})))
+    return f"{name.strip().lower()}|{tobaccos}"
+
+
+async def archived_mixes(session: AsyncSession, user_id: int, limit: int = 10) -> List[str]:
+    """Последние архивные миксы пользователя для защиты от повторов.
+
+    Формат — «Название (табак1, табак2)»: по сигнатуре LLM видит и состав,
+    чтобы не повторить его под другим названием.
+    """
+    result = await session.execute(
+        select(MixArchive.name, MixArchive.signature)
+        .where(MixArchive.user_id == user_id)
+        .order_by(MixArchive.created_at.desc())
+        .limit(limit)
+    )
+    return [
+        f"{name} ({signature.rsplit('|', 1)[-1].replace(',', ', ')})"
+        for name, signature in result.all()
+    ]
+
+
+def _expired_filter(cutoff: datetime):
+    """Миксы старше cutoff, без оценки и не в избранном."""
+    return (
+        Mix.created_at < cutoff,
+        Mix.rating.is_(None),
+        Mix.is_favorite == False,
+    )
+
+
+async def _process_batch(
+    session: AsyncSession, cutoff: datetime, batch_size: int, mode: str, report: RetentionReport
+) -> int:
+    """Обрабатывает одну пачку миксов в отдельной короткой транзакции."""
+    text_size = (
+        func.length(Mix.name)
+        + func.coalesce(func.length(Mix.description), 0)
+        + func.coalesce(func.length(Mix.tips), 0)
+    )
+    result = await session.execute(
+        select(
+            Mix.id, Mix.user_id, Mix.name, Mix.components,
+            Mix.request_type, Mix.created_at, text_size,
+        )
+        .where(*_expired_filter(cutoff))
+        .order_by(Mix.id)
+        .limit(batch_size)
+    )
+    rows = result.all()
+    if not rows:
+        return 0
+
+    mix_ids = [row.id for row in rows]
+    archive_rows = []
+    per_user = Counter()
+    reclaimed = 0
+
+    for mix_id, user_id, name, components, request_type, created_at, size in rows:
+        per_user[user_id] += 1
+        reclaimed += size + len(json.dumps(components or {}, ensure_ascii=False))
+        if mode == "archive":
+            signature = mix_signature(name, components)
+            reclaimed -= len(name) + len(signature)
+            archive_rows.append({
+                "id": mix_id,
+                "user_id": user_id,
+                "name": name,
+                "signature": signature,
+                "request_type": request_type,
+                "created_at": created_at,
+            })
+
+    if archive_rows:
+        await session.execute(insert(MixArchive), archive_rows)
+
+    await session.execute(
+        delete(MixIngredient)
+        .where(MixIngredient.mix_id.in_(mix_ids))
+        .execution_options(synchronize_session=False)
+    )
+    await session.execute(
+        delete(Mix)
+        .where(Mix.id.in_(mix_ids))
+        .execution_options(synchronize_session=False)
+    )
+    for user_id, count in per_user.items():
+        await bump_counters(session, user_id, mixes_count=-count)
+
+    await session.commit()
+
+    report.batches += 1
+    report.mixes_removed += len(mix_ids)
+    report.bytes_reclaimed += max(reclaimed, 0)
+    return len(mix_ids)
+
+
+async def _freelist_bytes(session: AsyncSession) -> int:
+    """Размер свободных страниц SQLite (освобождается VACUUM)."""
+    if session.bind.dialect.name != "sqlite":
+        return 0
+    freelist = await session.scalar(text("PRAGMA freelist_count"))
+    page_size = await session.scalar(text("PRAGMA page_size"))
+    return (freelist or 0) * (page_size or 0)
+
+
+async def apply_retention(
+    session: AsyncSession,
+    days: int,
+    mode: str = "archive",
+    batch_size: int = 200,
+    pause: float = 0.05,
+) -> RetentionReport:
+    """Архивирует или удаляет старые миксы без оценки и не в избранном.
+
+    Работает пачками по ``batch_size`` с коммитом после каждой и паузой
+    ``pause`` секунд между ними, чтобы не держать блокировку записи долго.
+    """
+    if mode not in ("archive", "delete"):
+        raise ValueError(f"Неизвестный режим retention: {mode}")
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    report = RetentionReport(mode=mode, cutoff=cutoff)
+
+    while await _process_batch(session, cutoff, batch_size, mode, report) == batch_size:
+        await asyncio.sleep(pause)
+
+    report.freelist_bytes = await _freelist_bytes(session)
+
+    if report.mixes_removed:
+        logger.info(
+            "Retention (%s): removed %s mixes in %s batches, ~%s bytes reclaimed",
+            mode, report.mixes_removed, report.batches, report.bytes_reclaimed,
+        )
+    return report
+
+
+def observe_retention(shard: int, report: RetentionReport) -> None:
+    """Переносит итог прогона в метрики: убранные миксы и освобождённое место."""
+    retention_mixes_removed.labels(shard, report.mode).inc(report.mixes_removed)
+    retention_bytes_reclaimed.labels(shard, report.mode).inc(report.bytes_reclaimed)
+    retention_freelist_bytes.labels(shard).set(report.freelist_bytes)
+
+
+async def retention_loop(session_factory, shard: int = 0) -> None:
+    """Фоновая задача: периодически применяет политику retention из настроек."""
+    while True:
+        try:
+            async with session_factory() as session:
+                report = await apply_retention(
+                    session,
+                    days=settings.mix_retention_days,
+                    mode=settings.mix_retention_mode,
+                    batch_size=settings.mix_retention_batch_size,
+                )
+            observe_retention(shard, report)
+        except Exception:
+            logger.exception("Retention run failed")
+        await asyncio.sleep(settings.mix_retention_interval_hours * 3600)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import router
+
+    parser = argparse.ArgumentParser(description="Архивация старых миксов без оценки")
+    parser.add_argument("--days", type=int, default=settings.mix_retention_days or 90)
+    parser.add_argument("--mode", choices=("archive", "delete"), default=settings.mix_retention_mode)
+    parser.add_argument("--batch-size", type=int, default=settings.mix_retention_batch_size)
+    args = parser.parse_args()
+
+    async def _main() -> None:
+        for index, session_factory in enumerate(router.sessionmakers):
+            async with session_factory() as session:
+                report = await apply_retention(session, args.days, args.mode, args.batch_size)
+            print(
+                f"Шард {index}: удалено миксов: {report.mixes_removed} ({report.batches} пачек), "
+                f"освобождено ~{report.bytes_reclaimed} байт, "
+                f"свободно в файле БД: {report.freelist_bytes} байт"
+            )
+
+    asyncio.run(_main())
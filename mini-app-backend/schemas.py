@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import Annotated, List, Literal, Optional, Dict, Any, Union
 from pydantic import BaseModel, Field
 
 
@@ -23,6 +23,18 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+# ============ AUTH SCHEMAS ============
+
+class AuthRequest(BaseModel):
+    init_data: str
+
+
+class AuthResponse(BaseModel):
+    token: str
+    expires_at: int
+    user: UserResponse
+
+
 # ============ CATEGORY SCHEMAS ============
 
 class CategoryResponse(BaseModel):
@@ -35,6 +47,17 @@ class CategoryResponse(BaseModel):
         from_attributes = True
 
 
+# ============ CATALOG SCHEMAS ============
+
+class CatalogSuggestion(BaseModel):
+    id: int
+    kind: Literal["brand", "flavor"]
+    name: str
+    brand_id: Optional[int] = None
+    brand: Optional[str] = None
+    category_id: Optional[int] = None
+
+
 # ============ TOBACCO SCHEMAS ============
 
 class TobaccoBase(BaseModel):
@@ -42,6 +65,7 @@ class TobaccoBase(BaseModel):
     brand: Optional[str] = None
     category_id: Optional[int] = None
     notes: Optional[str] = None
+    catalog_id: Optional[int] = None
 
 
 class TobaccoCreate(TobaccoBase):
@@ -57,6 +81,7 @@ class TobaccoUpdate(BaseModel):
     brand: Optional[str] = None
     category_id: Optional[int] = None
     notes: Optional[str] = None
+    catalog_id: Optional[int] = None
 
 
 class TobaccoResponse(TobaccoBase):
@@ -69,10 +94,15 @@ class TobaccoResponse(TobaccoBase):
         from_attributes = True
 
 
+class TobaccoSearchResult(TobaccoResponse):
+    score: float
+
+
 class TobaccoBulkResponse(BaseModel):
     added: List[str]
     skipped: List[str]
     errors: List[str]
+    added_ids: List[int] = []
 
 
 # ============ MIX SCHEMAS ============
@@ -128,9 +158,108 @@ class MixFavoriteRequest(BaseModel):
     is_favorite: bool
 
 
+# ============ BATCH SCHEMAS ============
+# Операции пачки наследуют схемы одиночных запросов и их валидацию
+
+class BatchRateOp(MixRateRequest):
+    op: Literal["rate"]
+    mix_id: int
+
+
+class BatchFavoriteOp(MixFavoriteRequest):
+    op: Literal["favorite"]
+    mix_id: int
+
+
+class BatchAddTobaccoOp(TobaccoCreate):
+    op: Literal["add_tobacco"]
+
+
+class BatchUpdateTobaccoOp(TobaccoUpdate):
+    op: Literal["update_tobacco"]
+    tobacco_id: int
+
+
+class BatchDeleteTobaccoOp(BaseModel):
+    op: Literal["delete_tobacco"]
+    tobacco_id: int
+
+
+BatchOperation = Annotated[
+    Union[
+        BatchRateOp,
+        BatchFavoriteOp,
+        BatchAddTobaccoOp,
+        BatchUpdateTobaccoOp,
+        BatchDeleteTobaccoOp,
+    ],
+    Field(discriminator="op"),
+]
+
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=100)
+    # atomic=True: при первой ошибке откатывается вся пачка
+    atomic: bool = False
+
+
+class BatchResult(BaseModel):
+    index: int
+    op: str
+    status: int
+    result: Optional[Dict[str, Any]] = None
+    detail: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    applied: int
+    results: List[BatchResult]
+
+
 # ============ STATS SCHEMAS ============
 
+class TopTobaccoResponse(BaseModel):
+    name: str
+    tobacco_id: Optional[int] = None
+    uses: int
+    avg_portion: float
+
+
 class StatsResponse(BaseModel):
     tobaccos_count: int
     mixes_count: int
     favorites_count: int
+    likes_count: int = 0
+    dislikes_count: int = 0
+
+
+# ============ BOOTSTRAP SCHEMAS ============
+
+class BootstrapResponse(BaseModel):
+    user: UserResponse
+    stats: StatsResponse
+    categories: List[CategoryResponse]
+    tobaccos: List[TobaccoResponse]  # первая страница, полное число — stats.tobaccos_count
+    mixes: List[MixResponse]
+    favorites: List[MixResponse]
+
+
+# ============ IMPORT SCHEMAS ============
+
+class ImportProgressResponse(BaseModel):
+    format: Literal["ndjson", "csv"]
+    status: Literal["running", "done", "failed"]
+    lines: int
+    bytes_read: int
+    batches: int
+    tobaccos_added: int
+    mixes_added: int
+    skipped: int
+    error_count: int
+    errors: List[str]  # первые ошибки с номерами строк
+    detail: Optional[str] = None
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,103 @@
+import json
+from datetime import datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from categories import get_registry
+from models import Mix, Tobacco
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+
+# Колонки для списков: строки читаются кортежами, без ORM-объектов
+TOBACCO_COLUMNS = (
+    Tobacco.id,
+    Tobacco.user_id,
+    Tobacco.name,
+    Tobacco.brand,
+    Tobacco.category_id,
+    Tobacco.notes,
+    Tobacco.catalog_id,
+    Tobacco.created_at,
+)
+
+MIX_COLUMNS = (
+    Mix.id,
+    Mix.user_id,
+    Mix.name,
+    Mix.components,
+    Mix.description,
+    Mix.tips,
+    Mix.request_type,
+    Mix.rating,
+    Mix.is_favorite,
+    Mix.created_at,
+)
+
+
+def serialize_tobacco(tobacco) -> dict:
+    """Табак в формате TobaccoResponse (ORM-объект или строка TOBACCO_COLUMNS).
+
+    Порядок ключей совпадает с порядком полей схемы; категория берётся
+    из реестра, без JOIN.
+    """
+    return {
+        "name": tobacco.name,
+        "brand": tobacco.brand,
+        "category_id": tobacco.category_id,
+        "notes": tobacco.notes,
+        "catalog_id": tobacco.catalog_id,
+        "id": tobacco.id,
+        "user_id": tobacco.user_id,
+        "created_at": tobacco.created_at,
+        "category": get_registry().as_dict(tobacco.category_id),
+    }
+
+
+def serialize_mix(mix) -> dict:
+    """Микс в формате MixResponse (ORM-объект или строка MIX_COLUMNS)."""
+    return {
+        "name": mix.name,
+        "components": mix.components,
+        "description": mix.description,
+        "tips": mix.tips,
+        "request_type": mix.request_type,
+        "id": mix.id,
+        "user_id": mix.user_id,
+        "rating": mix.rating,
+        "is_favorite": bool(mix.is_favorite),
+        "created_at": mix.created_at,
+    }
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON в байтах: orjson, если установлен, иначе стандартный json."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Ответ для списков, собранных из кортежей колонок.
+
+    Возвращается из эндпоинта напрямую, поэтому FastAPI не валидирует
+    каждую строку через response_model; схема остаётся только в OpenAPI.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
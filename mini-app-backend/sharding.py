@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Table, delete, false, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import settings
+from deadline import DeadlineSession
+from models import Mix, MixArchive, MixIngredient, Tobacco, User
+
+logger = logging.getLogger(__name__)
+
+
+def shard_index(telegram_id: int, shards: int) -> int:
+    """Номер шарда пользователя по хэшу telegram_id."""
+    if shards <= 1:
+        return 0
+    return zlib.crc32(str(telegram_id).encode()) % shards
+
+
+def shard_urls(database_url: str, shards: int, url_template: str) -> List[str]:
+    """URL баз данных шардов. При shards <= 1 — одна общая база."""
+    if shards <= 1:
+        return [database_url]
+    return [url_template.format(shard=i) for i in range(shards)]
+
+
+def layout_epoch(urls: List[str]) -> str:
+    """Метка схемы шардов: меняется вместе с DB_SHARDS и шаблоном URL.
+
+    users.id действителен только в своей схеме: после ребалансировки
+    записи с прежней меткой (токены сессии, кэш пользователей) не
+    принимаются.
+    """
+    return hashlib.sha256("\n".join(urls).encode()).hexdigest()[:12]
+
+
+def current_epoch() -> str:
+    """Метка схемы шардов из настроек процесса."""
+    return layout_epoch(
+        shard_urls(settings.database_url, settings.db_shards, settings.db_shard_url_template)
+    )
+
+
+class ShardRouter:
+    """Маршрутизатор сессий по шардам SQLite.
+
+    Каждый шард — отдельный файл со своим engine. Пользовательские данные
+    живут в шарде пользователя, глобальные таблицы (categories) реплицированы
+    во все шарды, поэтому запросы без пользователя идут в шард 0.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.urls = urls
+        self.engines = [create_async_engine(url) for url in urls]
+        self.sessionmakers = [
+            async_sessionmaker(engine, class_=DeadlineSession, expire_on_commit=False)
+            for engine in self.engines
+        ]
+
+    @property
+    def count(self) -> int:
+        return len(self.engines)
+
+    def shard_for(self, telegram_id: Optional[int]) -> int:
+        """Номер шарда для пользователя (0 — если пользователь неизвестен)."""
+        if telegram_id is None:
+            return 0
+        return shard_index(telegram_id, self.count)
+
+    def session(self, telegram_id: Optional[int] = None) -> AsyncSession:
+        """Новая сессия в шарде пользователя."""
+        return self.sessionmakers[self.shard_for(telegram_id)]()
+
+    async def dispose(self) -> None:
+        for engine in self.engines:
+            await engine.dispose()
+
+
+# ============ РЕБАЛАНСИРОВКА ============
+
+def _row_key(values: Iterable) -> str:
+    return json.dumps(list(values), ensure_ascii=False, sort_keys=True, default=str)
+
+
+async def _copy_rows(
+    src: AsyncSession,
+    dst: AsyncSession,
+    table: Table,
+    where,
+    remap: Optional[Dict[str, Dict[int, int]]] = None,
+) -> Dict[int, int]:
+    """Копирует строки таблицы в другой шард с новыми id.
+
+    ``remap`` — {колонка: {старый id: новый id}} для внешних ключей.
+    Возвращает соответствие старых id новым.
+
+    Новые id сопоставляются со строками по содержимому: упорядоченный
+    RETURNING (sort_by_parameter_order) SQLite выполняет построчно.
+    Полностью одинаковые строки взаимозаменяемы, им id раздаются в любом
+    порядке.
+    """
+    rows = (await src.execute(select(table).where(where).order_by(table.c.id))).mappings().all()
+    if not rows:
+        return {}
+
+    values = []
+    for row in rows:
+        item = {key: value for key, value in row.items() if key != "id"}
+        for column, mapping in (remap or {}).items():
+            if item.get(column) is not None:
+                item[column] = mapping.get(item[column])
+        values.append(item)
+
+    columns = [column for column in table.c if column.key != "id"]
+    result = await dst.execute(insert(table).returning(table.c.id, *columns), values)
+    new_ids: Dict[str, List[int]] = {}
+    for new_id, *row_values in result.all():
+        new_ids.setdefault(_row_key(row_values), []).append(new_id)
+
+    return {
+        row["id"]: new_ids[_row_key(item[column.key] for column in columns)].pop()
+        for row, item in zip(rows, values)
+    }
+
+
+async def move_user(src: AsyncSession, dst: AsyncSession, telegram_id: int) -> bool:
+    """Переносит пользователя со всеми данными из одного шарда в другой.
+
+    Копия фиксируется одной транзакцией в целевом шарде, затем данные
+    удаляются из исходного. Если пользователь уже есть в целевом шарде
+    (прерванный прошлый запуск), только дочищается исходный.
+    """
+    user_id = await src.scalar(select(User.id).where(User.telegram_id == telegram_id))
+    if user_id is None:
+        return False
+
+    exists = await dst.scalar(select(User.id).where(User.telegram_id == telegram_id))
+    if exists is None:
+        users = await _copy_rows(src, dst, User.__table__, User.id == user_id)
+        user_map = {"user_id": users}
+        tobaccos = await _copy_rows(src, dst, Tobacco.__table__, Tobacco.user_id == user_id, user_map)
+        mixes = await _copy_rows(src, dst, Mix.__table__, Mix.user_id == user_id, user_map)
+        await _copy_rows(
+            src, dst, MixIngredient.__table__,
+            MixIngredient.mix_id.in_(list(mixes)) if mixes else false(),
+            {"mix_id": mixes, "tobacco_id": tobaccos},
+        )
+        await _copy_rows(src, dst, MixArchive.__table__, MixArchive.user_id == user_id, user_map)
+        await dst.commit()
+    else:
+        logger.warning("User %s already present in target shard, cleaning up source", telegram_id)
+
+    mix_ids = select(Mix.id).where(Mix.user_id == user_id)
+    await src.execute(delete(MixIngredient).where(MixIngredient.mix_id.in_(mix_ids)))
+    await src.execute(delete(MixArchive).where(MixArchive.user_id == user_id))
+    await src.execute(delete(Mix).where(Mix.user_id == user_id))
+    await src.execute(delete(Tobacco).where(Tobacco.user_id == user_id))
+    await src.execute(delete(User).where(User.id == user_id))
+    await src.commit()
+    return True
+
+
+async def rebalance(source: ShardRouter, target: ShardRouter, batch_size: int = 100) -> int:
+    """Переносит пользователей из схемы шардов ``source`` в ``target``.
+
+    Шарды с совпадающими URL считаются одним и тем же файлом: пользователи,
+    чей файл не меняется, не трогаются. Возвращает количество перенесённых.
+    Запускать при остановленных API и боте.
+    """
+    target_index = {url: i for i, url in enumerate(target.urls)}
+    moved = 0
+
+    for src_index, src_factory in enumerate(source.sessionmakers):
+        src_url = source.urls[src_index]
+        last_id = 0
+        while True:
+            async with src_factory() as src:
+                result = await src.execute(
+                    select(User.id, User.telegram_id)
+                    .where(User.id > last_id)
+                    .order_by(User.id)
+                    .limit(batch_size)
+                )
+                users = result.all()
+                if not users:
+                    break
+                last_id = users[-1][0]
+
+                for _, telegram_id in users:
+                    dst_index = target.shard_for(telegram_id)
+                    if target_index.get(src_url) == dst_index:
+                        continue
+                    async with target.sessionmakers[dst_index]() as dst:
+                        if await move_user(src, dst, telegram_id):
+                            moved += 1
+
+        logger.info("Shard %s processed, moved so far: %s", src_index, moved)
+
+    return moved
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    from catalog import replicate_catalog
+    from database import init_shard, router
+
+    parser = argparse.ArgumentParser(description="Перенос пользователей между схемами шардирования")
+    parser.add_argument("--to", type=int, required=True, help="новое количество шардов")
+    parser.add_argument("--template", default=settings.db_shard_url_template)
+    args = parser.parse_args()
+
+    async def _main() -> None:
+        target = ShardRouter(shard_urls(settings.database_url, args.to, args.template))
+        for url, engine, factory in zip(target.urls, target.engines, target.sessionmakers):
+            await init_shard(engine, factory)
+            # Каталог общий: новые шарды получают его копию с теми же id
+            if url != router.urls[0]:
+                async with router.sessionmakers[0]() as src, factory() as dst:
+                    await replicate_catalog(src, dst)
+        moved = await rebalance(router, target)
+        await target.dispose()
+        print(f"Перенесено пользователей: {moved}")
+        print(f"Не забудьте выставить DB_SHARDS={args.to}")
+
+    asyncio.run(_main())
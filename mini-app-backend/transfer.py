@@ -0,0 +1,460 @@
+import codecs
+import csv
+import io
+import json
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from categories import get_registry
+from config import settings
+from counters import bump_counters, rating_deltas
+from database import router
+from mix_components import build_ingredient_rows
+from models import Mix, MixIngredient, Tobacco
+from mutations import link_catalog
+from schemas import TobaccoCreate
+from serialization import MIX_COLUMNS, TOBACCO_COLUMNS, dumps, serialize_mix, serialize_tobacco
+
+logger = logging.getLogger(__name__)
+
+EXPORT_KINDS = {
+    "tobaccos": ("tobacco", TOBACCO_COLUMNS, Tobacco, serialize_tobacco),
+    "mixes": ("mix", MIX_COLUMNS, Mix, serialize_mix),
+}
+
+TOBACCO_CSV_FIELDS = ("name", "brand", "category", "notes", "catalog_id", "created_at")
+MIX_CSV_FIELDS = (
+    "name", "components", "description", "tips",
+    "request_type", "rating", "is_favorite", "created_at",
+)
+
+# Сколько сообщений об ошибках хранить в прогрессе импорта
+MAX_ERROR_SAMPLES = 20
+
+
+# ============ ЭКСПОРТ ============
+
+def _csv_row(record_type: str, row) -> list:
+    if record_type == "tobacco":
+        return [
+            row.name,
+            row.brand or "",
+            get_registry().name_for(row.category_id) or "",
+            row.notes or "",
+            row.catalog_id or "",
+            row.created_at.isoformat(),
+        ]
+    return [
+        row.name,
+        json.dumps(row.components, ensure_ascii=False),
+        row.description or "",
+        row.tips or "",
+        row.request_type,
+        "" if row.rating is None else row.rating,
+        int(bool(row.is_favorite)),
+        row.created_at.isoformat(),
+    ]
+
+
+async def stream_export(
+    telegram_id: int, user_id: int, kinds: List[str], fmt: str
+) -> AsyncIterator[bytes]:
+    """Выгрузка коллекции порциями серверного курсора.
+
+    В памяти одновременно только одна порция (export_batch_size строк).
+    NDJSON: по записи на строку с полем "type"; CSV: одна таблица с заголовком.
+    Сессия своя: генератор работает уже после выхода из эндпоинта.
+    """
+    async with router.session(telegram_id) as session:
+        for kind in kinds:
+            record_type, columns, model, serialize = EXPORT_KINDS[kind]
+            if fmt == "csv":
+                header = TOBACCO_CSV_FIELDS if record_type == "tobacco" else MIX_CSV_FIELDS
+                yield (",".join(header) + "\r\n").encode("utf-8")
+
+            result = await session.stream(
+                select(*columns)
+                .where(model.user_id == user_id)
+                .order_by(model.id)
+                .execution_options(yield_per=settings.export_batch_size)
+            )
+            async for partition in result.partitions():
+                if fmt == "csv":
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    writer.writerows(_csv_row(record_type, row) for row in partition)
+                    yield buffer.getvalue().encode("utf-8")
+                else:
+                    yield b"".join(
+                        dumps({"type": record_type, **serialize(row)}) + b"\n"
+                        for row in partition
+                    )
+
+
+# ============ ПРОГРЕСС ИМПОРТА ============
+
+@dataclass
+class ImportProgress:
+    """Состояние импорта одного пользователя (для GET /api/import/progress)."""
+    format: str
+    status: str = "running"  # running/done/failed
+    lines: int = 0
+    bytes_read: int = 0
+    batches: int = 0
+    tobaccos_added: int = 0
+    mixes_added: int = 0
+    skipped: int = 0
+    error_count: int = 0
+    errors: List[str] = field(default_factory=list)
+    detail: Optional[str] = None
+    started_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+    def error(self, line: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_ERROR_SAMPLES:
+            self.errors.append(f"Строка {line}: {message}")
+
+    def finish(self, status: str, detail: Optional[str] = None) -> None:
+        self.status = status
+        self.detail = detail
+        self.finished_at = datetime.utcnow()
+
+
+class ImportJobs:
+    """Прогресс последних импортов по telegram_id (LRU, в памяти процесса).
+
+    Ключ — telegram_id: users.id уникален только внутри шарда.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[int, ImportProgress]" = OrderedDict()
+
+    def get(self, telegram_id: int) -> Optional[ImportProgress]:
+        return self._items.get(telegram_id)
+
+    def start(self, telegram_id: int, fmt: str) -> ImportProgress:
+        current = self._items.get(telegram_id)
+        if current is not None and current.status == "running":
+            raise HTTPException(status_code=409, detail="Импорт уже выполняется")
+
+        progress = ImportProgress(format=fmt)
+        self._items[telegram_id] = progress
+        self._items.move_to_end(telegram_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return progress
+
+
+import_jobs = ImportJobs()
+
+
+# ============ РАЗБОР ПОТОКА ============
+
+async def iter_lines(chunks: AsyncIterator[bytes], progress: ImportProgress) -> AsyncIterator[str]:
+    """Строки из потока байтов; в буфере не больше одной строки."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    max_line = settings.import_max_line_bytes
+    buffer = ""
+    async for chunk in chunks:
+        progress.bytes_read += len(chunk)
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+        if len(buffer) > max_line:
+            raise HTTPException(status_code=413, detail=f"Строка длиннее {max_line} байт")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_records(
+    lines: AsyncIterator[str], fmt: str, progress: ImportProgress
+) -> AsyncIterator[Tuple[int, dict]]:
+    """(номер строки, запись) из NDJSON или CSV; битые строки — в ошибки прогресса.
+
+    CSV-запись может занимать несколько строк (перевод строки в кавычках):
+    строки склеиваются, пока число кавычек нечётное.
+    """
+    header: Optional[List[str]] = None
+    pending = ""
+    start = 0
+    async for line in lines:
+        progress.lines += 1
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                yield progress.lines, record
+            else:
+                progress.error(progress.lines, "ожидался JSON-объект")
+            continue
+
+        if not pending:
+            start = progress.lines
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            if len(pending) > settings.import_max_line_bytes:
+                raise HTTPException(status_code=413, detail="Незакрытые кавычки в CSV")
+            continue
+        text, pending = pending, ""
+        if not text.strip():
+            continue
+
+        row = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip().lower() for name in row]
+            continue
+        yield start, dict(zip(header, row))
+
+
+# ============ ИМПОРТ ============
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "да")
+    return bool(value)
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=None)
+
+
+def _components_key(components) -> str:
+    return json.dumps(components, ensure_ascii=False, sort_keys=True)
+
+
+class CollectionImporter:
+    """Копит записи и пишет их пачками, по транзакции на пачку.
+
+    В памяти — текущая пачка и названия табаков пользователя (для дублей
+    и привязки компонентов миксов), но не весь файл.
+    """
+
+    def __init__(self, session: AsyncSession, user_id: int, progress: ImportProgress):
+        self.session = session
+        self.user_id = user_id
+        self.progress = progress
+        self.batch_size = settings.import_batch_size
+        self.tobacco_ids: Dict[str, Optional[int]] = {}
+        self.mix_keys: Optional[Set[Tuple[str, datetime]]] = None
+        self.tobaccos: List[dict] = []
+        self.mixes: List[dict] = []
+
+    async def prepare(self) -> None:
+        result = await self.session.execute(
+            select(Tobacco.id, Tobacco.name).where(Tobacco.user_id == self.user_id)
+        )
+        self.tobacco_ids = {name.lower(): tobacco_id for tobacco_id, name in result.all()}
+
+    async def add(self, line: int, record: dict) -> None:
+        record_type = record.get("type") or ("mix" if "components" in record else "tobacco")
+        if record_type == "tobacco":
+            self._add_tobacco(line, record)
+        elif record_type == "mix":
+            await self._add_mix(line, record)
+        else:
+            self.progress.error(line, f"неизвестный тип записи '{record_type}'")
+
+        if len(self.tobaccos) + len(self.mixes) >= self.batch_size:
+            await self.flush()
+
+    def _add_tobacco(self, line: int, record: dict) -> None:
+        category = record.get("category")
+        category_id = record.get("category_id")
+        if isinstance(category, dict):
+            category_id = category.get("id")
+        elif category and not category_id:
+            info = get_registry().by_name(str(category))
+            category_id = info.id if info else None
+
+        try:
+            data = TobaccoCreate(
+                name=str(record.get("name") or "").strip(),
+                brand=record.get("brand") or None,
+                category_id=int(category_id) if category_id else None,
+                notes=record.get("notes") or None,
+                catalog_id=int(record["catalog_id"]) if record.get("catalog_id") else None,
+            )
+            entry = link_catalog(data.name, data.brand, data.catalog_id)
+        except (ValidationError, ValueError):
+            self.progress.error(line, "некорректный табак")
+            return
+        except HTTPException as e:
+            self.progress.error(line, e.detail)
+            return
+
+        name = entry.name if entry else data.name
+        category_id = data.category_id if get_registry().get(data.category_id) else None
+        if entry:
+            category_id = category_id or entry.category_id
+        if name.lower() in self.tobacco_ids:
+            self.progress.skipped += 1
+            return
+        self.tobacco_ids[name.lower()] = None  # id станет известен после INSERT
+
+        self.tobaccos.append({
+            "user_id": self.user_id,
+            "name": name,
+            "brand": entry.brand if entry else data.brand,
+            "category_id": category_id,
+            "notes": data.notes,
+            "catalog_id": entry.id if entry else None,
+            "created_at": _parse_datetime(record.get("created_at")) or datetime.utcnow(),
+        })
+
+    async def _add_mix(self, line: int, record: dict) -> None:
+        components = record.get("components")
+        if isinstance(components, str):
+            try:
+                components = json.loads(components)
+            except ValueError:
+                components = None
+        name = str(record.get("name") or "").strip()
+        request_type = record.get("request_type") or "surprise"
+        rating = record.get("rating")
+        if isinstance(rating, str):
+            rating = int(rating) if rating.strip().lstrip("-").isdigit() else rating or None
+        if (
+            not name
+            or not isinstance(components, dict)
+            or request_type not in ("base", "profile", "surprise")
+            or rating not in (None, -1, 0, 1)
+        ):
+            self.progress.error(line, "некорректный микс")
+            return
+
+        created_at = _parse_datetime(record.get("created_at"))
+        if created_at is not None:
+            # Повторный импорт той же выгрузки не дублирует историю
+            if self.mix_keys is None:
+                result = await self.session.execute(
+                    select(Mix.name, Mix.created_at).where(Mix.user_id == self.user_id)
+                )
+                self.mix_keys = set(result.all())
+            if (name, created_at) in self.mix_keys:
+                self.progress.skipped += 1
+                return
+            self.mix_keys.add((name, created_at))
+
+        self.mixes.append({
+            "user_id": self.user_id,
+            "name": name,
+            "components": components,
+            "description": record.get("description") or None,
+            "tips": record.get("tips") or None,
+            "request_type": request_type,
+            "rating": rating,
+            "is_favorite": _parse_bool(record.get("is_favorite")),
+            "created_at": created_at or datetime.utcnow(),
+        })
+
+    async def flush(self) -> None:
+        """Пишет накопленную пачку и счётчики одной транзакцией."""
+        if not self.tobaccos and not self.mixes:
+            return
+
+        deltas = {"tobaccos_count": 0, "mixes_count": 0, "favorites_count": 0}
+        if self.tobaccos:
+            # Без sort_by_parameter_order: id сопоставляются по названию, а
+            # упорядоченный RETURNING в SQLite выполняется построчно
+            result = await self.session.execute(
+                insert(Tobacco).returning(Tobacco.id, Tobacco.name),
+                self.tobaccos,
+            )
+            for tobacco_id, name in result.all():
+                self.tobacco_ids[name.lower()] = tobacco_id
+            deltas["tobaccos_count"] = len(self.tobaccos)
+
+        if self.mixes:
+            # id нужен только для строк состава: миксы сопоставляются по
+            # компонентам, у миксов с одинаковым составом одинаковы и строки
+            result = await self.session.execute(
+                insert(Mix).returning(Mix.id, Mix.components),
+                self.mixes,
+            )
+            mix_ids: Dict[str, List[int]] = {}
+            for mix_id, components in result.all():
+                mix_ids.setdefault(_components_key(components), []).append(mix_id)
+            ingredient_rows = []
+            for mix in self.mixes:
+                mix_id = mix_ids[_components_key(mix["components"])].pop()
+                ingredient_rows.extend(
+                    build_ingredient_rows(mix_id, mix["components"], self.tobacco_ids)
+                )
+                for name, delta in rating_deltas(None, mix["rating"]).items():
+                    deltas[name] = deltas.get(name, 0) + delta
+                deltas["favorites_count"] += int(mix["is_favorite"])
+            if ingredient_rows:
+                await self.session.execute(insert(MixIngredient), ingredient_rows)
+            deltas["mixes_count"] = len(self.mixes)
+
+        await bump_counters(self.session, self.user_id, **deltas)
+        await self.session.commit()
+
+        self.progress.batches += 1
+        self.progress.tobaccos_added += len(self.tobaccos)
+        self.progress.mixes_added += len(self.mixes)
+        self.tobaccos, self.mixes = [], []
+
+
+async def import_stream(
+    session: AsyncSession,
+    user_id: int,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    progress: ImportProgress,
+) -> ImportProgress:
+    """Импорт из потока: разбор построчно, запись пачками.
+
+    Уже записанные пачки остаются при ошибке посреди файла —
+    прогресс показывает, сколько успело загрузиться.
+    """
+    importer = CollectionImporter(session, user_id, progress)
+    try:
+        await importer.prepare()
+        async for line, record in iter_records(iter_lines(chunks, progress), fmt, progress):
+            await importer.add(line, record)
+        await importer.flush()
+    except HTTPException as e:
+        await session.rollback()
+        progress.finish("failed", e.detail)
+        raise
+    except Exception:
+        await session.rollback()
+        progress.finish("failed", "Внутренняя ошибка импорта")
+        raise
+    except BaseException:
+        # Отмена (клиент оборвал загрузку) или остановка процесса: статус
+        # не должен остаться running, иначе следующий импорт получит 409.
+        # Откат незаписанной пачки — при закрытии сессии
+        progress.finish("failed", "Импорт прерван")
+        raise
+
+    progress.finish("done")
+    logger.info(
+        "Import for user %s: %s tobaccos, %s mixes, %s skipped, %s errors",
+        user_id, progress.tobaccos_added, progress.mixes_added,
+        progress.skipped, progress.error_count,
+    )
+    return progress
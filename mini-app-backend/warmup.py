@@ -0,0 +1,197 @@
+"""Прогрев приложения после старта процесса и готовность к трафику.
+
+uvicorn принимает соединения только после startup-части lifespan, поэтому
+всё, что требует БД (схема, справочники, каталог), выполняется фоновой
+задачей. Пока она идёт, /api/health и статические справочники отвечают
+сразу, а остальные запросы ждут её в WarmupMiddleware.
+
+/api/health — живость процесса, /api/ready — готовность принимать
+трафик: балансировщик направляет запросы только на прогретые инстансы
+и перестаёт слать их на инстанс, который останавливается (drain).
+"""
+import asyncio
+import logging
+import signal
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Sequence, Set
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Фоновая задача прогрева одного запуска приложения."""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.ready = True  # без lifespan (скрипты) прогревать нечего
+        self.seconds: Optional[float] = None
+        self.error: Optional[BaseException] = None
+
+    def start(self, warm: Callable[[], Awaitable[None]]) -> None:
+        self.ready = False
+        self.seconds = None
+        self.error = None
+        self._task = asyncio.create_task(self._run(warm))
+
+    async def _run(self, warm: Callable[[], Awaitable[None]]) -> None:
+        started = time.perf_counter()
+        try:
+            await warm()
+        except Exception as e:
+            self.error = e
+            logger.exception("Warm-up failed")
+            raise
+        self.seconds = time.perf_counter() - started
+        self.ready = True
+        logger.info("Warm-up finished in %.2f s", self.seconds)
+
+    async def wait(self) -> None:
+        """Дожидается прогрева; если он упал — поднимает его исключение."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+warmup = Warmup()
+
+
+class Readiness:
+    """Шаги прогрева, без которых инстанс не готов, и drain при остановке."""
+
+    def __init__(self):
+        self.checks: Dict[str, bool] = {}
+        self.required: Set[str] = set()
+        self.draining = False
+        self.generations = 0
+        self._drain_task: Optional[asyncio.Task] = None
+
+    def reset(self, checks: Iterable[str], required: Iterable[str]) -> None:
+        """Новый запуск: все шаги не пройдены, drain не идёт."""
+        self.checks = {name: False for name in checks}
+        self.required = set(required)
+        self.draining = False
+        self._drain_task = None
+
+    def mark(self, name: str) -> None:
+        self.checks[name] = True
+        logger.info("Readiness check passed: %s", name)
+
+    @property
+    def ready(self) -> bool:
+        return (
+            not self.draining
+            and warmup.ready
+            and all(self.checks.get(name, False) for name in self.required)
+        )
+
+    def status(self) -> dict:
+        if self.draining:
+            state = "draining"
+        elif warmup.error is not None:
+            state = "failed"
+        elif self.ready:
+            state = "ready"
+        else:
+            state = "warming_up"
+        return {
+            "status": state,
+            "checks": dict(self.checks),
+            "generations_in_flight": self.generations,
+            "warmup_seconds": round(warmup.seconds, 3) if warmup.seconds is not None else None,
+        }
+
+    async def track_generation(self):
+        """Dependency генерации: drain дожидается таких запросов."""
+        self.generations += 1
+        try:
+            yield
+        finally:
+            self.generations -= 1
+
+    async def wait_generations(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while self.generations and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.generations:
+            logger.warning("Drain timeout: %d generation(s) still running", self.generations)
+
+    def install_drain_handler(self, delay: float, timeout: float) -> Callable[[], None]:
+        """Перехватывает SIGTERM сервера: сначала drain, потом остановка.
+
+        uvicorn по сигналу сразу закрывает сокет, и балансировщик не успел
+        бы увидеть /api/ready = 503. Поэтому готовность снимается сразу,
+        запросы ещё delay секунд принимаются, затем ждём генерации (не
+        дольше timeout) и только после этого вызываем обработчик uvicorn.
+        Повторный SIGTERM передаётся ему без ожидания.
+
+        Обработчик uvicorn ставится через signal.signal только с 0.29
+        (раньше — loop.add_signal_handler, невидимый для getsignal),
+        поэтому в requirements.txt uvicorn>=0.29.
+
+        Возвращает функцию, восстанавливающую прежний обработчик.
+        """
+        previous = signal.getsignal(signal.SIGTERM)
+        if not callable(previous):
+            # Не под uvicorn (или uvicorn < 0.29): перехватить нечего
+            return lambda: None
+        loop = asyncio.get_running_loop()
+
+        async def drain() -> None:
+            await asyncio.sleep(delay)
+            await self.wait_generations(timeout)
+            logger.info("Drain finished, shutting down")
+            previous(signal.SIGTERM, None)
+
+        def start_drain() -> None:
+            self._drain_task = loop.create_task(drain())
+
+        def handle(sig, frame) -> None:
+            if self.draining:
+                previous(sig, frame)
+                return
+            self.draining = True
+            logger.info("SIGTERM: draining for %.1f s before shutdown", delay)
+            loop.call_soon_threadsafe(start_drain)
+
+        try:
+            signal.signal(signal.SIGTERM, handle)
+        except ValueError:
+            # Сигналы ставятся только из главного потока (не так в TestClient)
+            return lambda: None
+        return lambda: signal.signal(signal.SIGTERM, previous)
+
+
+readiness = Readiness()
+
+
+class WarmupMiddleware:
+    """Запросы ждут прогрева, кроме путей, которым БД не нужна."""
+
+    def __init__(
+        self,
+        app,
+        skip_paths: Sequence[str] = ("/api/health", "/api/ready", "/api/categories", "/metrics"),
+    ):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or warmup.ready or scope.get("path") in self.skip_paths:
+            return await self.app(scope, receive, send)
+
+        try:
+            await warmup.wait()
+        except Exception:
+            response = JSONResponse(
+                {"detail": "Сервис не готов: ошибка инициализации"}, status_code=503
+            )
+            return await response(scope, receive, send)
+        await self.app(scope, receive, send)
@@ -1,5 +1,6 @@
 import { useEffect } from 'react';
 import { useStore } from './store';
+import { userApi } from './api';
 import { initTelegram } from './telegram';
 import { Navigation } from './components/Navigation';
 import { HomePage } from './pages/HomePage';
@@ -9,10 +10,19 @@ import { HistoryPage } from './pages/HistoryPage';
 import { FavoritesPage } from './pages/FavoritesPage';
 
 function App() {
-  const { currentTab } = useStore();
+  const { currentTab, applyBootstrap, finishBootstrap } = useStore();
 
   useEffect(() => {
     initTelegram();
+
+    // Стартовые данные одним запросом вместо отдельных запросов страниц
+    userApi
+      .bootstrap()
+      .then(applyBootstrap)
+      .catch((err) => {
+        console.error('Failed to bootstrap:', err);
+        finishBootstrap();
+      });
   }, []);
 
   const renderPage = () => {
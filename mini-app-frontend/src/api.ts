@@ -1,4 +1,4 @@
-import { getTelegramUser, getMockUser, isTelegramWebApp } from './telegram';
+import { tg, getTelegramUser, getMockUser, isTelegramWebApp } from './telegram';
 
 // В production замените на URL вашего backend на Render
 const API_BASE = import.meta.env.VITE_API_URL || '/api';
@@ -18,10 +18,20 @@ export interface Tobacco {
   brand: string | null;
   category_id: number | null;
   notes: string | null;
+  catalog_id: number | null;
   created_at: string;
   category: Category | null;
 }
 
+export interface CatalogSuggestion {
+  id: number;
+  kind: 'brand' | 'flavor';
+  name: string;
+  brand_id: number | null;
+  brand: string | null;
+  category_id: number | null;
+}
+
 export interface MixComponent {
   tobacco: string;
   portion: number;
@@ -53,6 +63,40 @@ export interface Stats {
   tobaccos_count: number;
   mixes_count: number;
   favorites_count: number;
+  likes_count: number;
+  dislikes_count: number;
+}
+
+export interface User {
+  id: number;
+  telegram_id: number;
+  username: string | null;
+  first_name: string | null;
+  created_at: string;
+}
+
+export interface Bootstrap {
+  user: User;
+  stats: Stats;
+  categories: Category[];
+  tobaccos: Tobacco[];
+  mixes: Mix[];
+  favorites: Mix[];
+}
+
+export type BatchOperation =
+  | { op: 'rate'; mix_id: number; rating: number }
+  | { op: 'favorite'; mix_id: number; is_favorite: boolean }
+  | { op: 'add_tobacco'; name: string; brand?: string; category_id?: number }
+  | { op: 'update_tobacco'; tobacco_id: number; name?: string; brand?: string; category_id?: number }
+  | { op: 'delete_tobacco'; tobacco_id: number };
+
+export interface BatchResult {
+  index: number;
+  op: BatchOperation['op'];
+  status: number;
+  result: Record<string, unknown> | null;
+  detail: string | null;
 }
 
 export interface BulkResult {
@@ -61,14 +105,68 @@ export interface BulkResult {
   errors: string[];
 }
 
+export interface ImportProgress {
+  format: 'ndjson' | 'csv';
+  status: 'running' | 'done' | 'failed';
+  lines: number;
+  bytes_read: number;
+  batches: number;
+  tobaccos_added: number;
+  mixes_added: number;
+  skipped: number;
+  error_count: number;
+  errors: string[];
+  detail: string | null;
+  started_at: string;
+  finished_at: string | null;
+}
+
+// Токен сессии, выданный backend после проверки initData
+let session: { token: string; expiresAt: number } | null = null;
+let sessionPromise: Promise<string | null> | null = null;
+
+// Обмен initData на токен сессии (один раз, до истечения срока)
+const getSessionToken = async (): Promise<string | null> => {
+  if (!isTelegramWebApp() || !tg) return null;
+
+  if (session && session.expiresAt * 1000 > Date.now() + 60_000) {
+    return session.token;
+  }
+
+  if (!sessionPromise) {
+    sessionPromise = fetch(`${API_BASE}/auth`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ init_data: tg.initData }),
+    })
+      .then(async (response) => {
+        if (!response.ok) return null;
+        const data = await response.json();
+        session = { token: data.token, expiresAt: data.expires_at };
+        return session.token;
+      })
+      .finally(() => {
+        sessionPromise = null;
+      });
+  }
+
+  return sessionPromise;
+};
+
 // Получение заголовков с данными пользователя
-const getHeaders = (): Record<string, string> => {
-  const user = isTelegramWebApp() ? getTelegramUser() : getMockUser();
-  
+const getHeaders = async (): Promise<Record<string, string>> => {
   const headers: Record<string, string> = {
     'Content-Type': 'application/json',
   };
-  
+
+  const token = await getSessionToken();
+  if (token) {
+    headers['Authorization'] = `Bearer ${token}`;
+    return headers;
+  }
+
+  // Вне Telegram (разработка) — заголовки с моковым пользователем
+  const user = isTelegramWebApp() ? getTelegramUser() : getMockUser();
   if (user) {
     headers['X-Telegram-User-Id'] = String(user.id);
     if (user.username) headers['X-Telegram-Username'] = encodeURIComponent(user.username);
@@ -81,16 +179,24 @@ const getHeaders = (): Record<string, string> => {
 // Базовая функция запроса
 async function request<T>(
   endpoint: string,
-  options: RequestInit = {}
+  options: RequestInit = {},
+  retried = false
 ): Promise<T> {
   const response = await fetch(`${API_BASE}${endpoint}`, {
     ...options,
     headers: {
-      ...getHeaders(),
+      ...(await getHeaders()),
       ...options.headers,
     },
   });
 
+  // Токен отклонён (например, после перераспределения шардов) — один раз
+  // получаем новый и повторяем запрос
+  if (response.status === 401 && session && !retried) {
+    session = null;
+    return request<T>(endpoint, options, true);
+  }
+
   if (!response.ok) {
     const error = await response.json().catch(() => ({ detail: 'Ошибка сети' }));
     throw new Error(error.detail || 'Произошла ошибка');
@@ -103,6 +209,9 @@ async function request<T>(
 
 export const userApi = {
   getStats: () => request<Stats>('/user/stats'),
+
+  // Всё для стартового экрана одним запросом
+  bootstrap: () => request<Bootstrap>('/bootstrap'),
 };
 
 // ============ CATEGORIES API ============
@@ -111,26 +220,44 @@ export const categoriesApi = {
   getAll: () => request<Category[]>('/categories'),
 };
 
+// ============ CATALOG API ============
+
+export const catalogApi = {
+  // Автодополнение брендов и вкусов; brand_id — вкусы выбранного бренда
+  suggest: (q: string, params: { kind?: 'brand' | 'flavor'; brand_id?: number; limit?: number } = {}) => {
+    const query = new URLSearchParams({ q, limit: String(params.limit ?? 10) });
+    if (params.kind) query.set('kind', params.kind);
+    if (params.brand_id !== undefined) query.set('brand_id', String(params.brand_id));
+    return request<CatalogSuggestion[]>(`/catalog/suggest?${query}`);
+  },
+};
+
 // ============ TOBACCOS API ============
 
 export const tobaccosApi = {
   getAll: () => request<Tobacco[]>('/tobaccos'),
   
   getById: (id: number) => request<Tobacco>(`/tobaccos/${id}`),
+
+  // Нечёткий поиск: опечатки, кириллица/латиница, «мята» ↔ «mint»
+  search: (q: string, limit = 20) =>
+    request<Array<Tobacco & { score: number }>>(
+      `/tobaccos/search?q=${encodeURIComponent(q)}&limit=${limit}`
+    ),
   
-  create: (data: { name: string; brand?: string; category_id?: number }) =>
+  create: (data: { name: string; brand?: string; category_id?: number; catalog_id?: number }) =>
     request<Tobacco>('/tobaccos', {
       method: 'POST',
       body: JSON.stringify(data),
     }),
   
-  createBulk: (tobaccos: Array<{ name: string; brand?: string; category_id?: number }>) =>
+  createBulk: (tobaccos: Array<{ name: string; brand?: string; category_id?: number; catalog_id?: number }>) =>
     request<BulkResult>('/tobaccos/bulk', {
       method: 'POST',
       body: JSON.stringify({ tobaccos }),
     }),
   
-  update: (id: number, data: { name?: string; brand?: string; category_id?: number }) =>
+  update: (id: number, data: { name?: string; brand?: string; category_id?: number; catalog_id?: number }) =>
     request<Tobacco>(`/tobaccos/${id}`, {
       method: 'PUT',
       body: JSON.stringify(data),
@@ -183,3 +310,40 @@ export const mixesApi = {
       method: 'DELETE',
     }),
 };
+
+// ============ BATCH API ============
+
+export const batchApi = {
+  // Накопленные операции (например, офлайн) одной транзакцией
+  apply: (operations: BatchOperation[], atomic = false) =>
+    request<{ applied: number; results: BatchResult[] }>('/batch', {
+      method: 'POST',
+      body: JSON.stringify({ operations, atomic }),
+    }),
+};
+
+// ============ EXPORT / IMPORT API ============
+
+export const transferApi = {
+  // Файл выгрузки целиком (сервер отдаёт его потоком)
+  export: async (format: 'ndjson' | 'csv' = 'ndjson', kind: 'all' | 'tobaccos' | 'mixes' = 'all') => {
+    const response = await fetch(`${API_BASE}/export?format=${format}&kind=${kind}`, {
+      headers: await getHeaders(),
+    });
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({ detail: 'Ошибка сети' }));
+      throw new Error(error.detail || 'Произошла ошибка');
+    }
+    return response.blob();
+  },
+
+  // Файл уходит телом запроса как есть; ход — через progress()
+  import: (file: Blob, format: 'ndjson' | 'csv') =>
+    request<ImportProgress>(`/import?format=${format}`, {
+      method: 'POST',
+      headers: { 'Content-Type': format === 'csv' ? 'text/csv' : 'application/x-ndjson' },
+      body: file,
+    }),
+
+  progress: () => request<ImportProgress>('/import/progress'),
+};
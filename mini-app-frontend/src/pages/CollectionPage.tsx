@@ -11,8 +11,11 @@ import { Loader } from '../components/Loader';
 import { hapticFeedback, showConfirm } from '../telegram';
 
 export function CollectionPage() {
-  const { tobaccos, setTobaccos, addTobacco, removeTobacco, categories, setCategories } = useStore();
-  const [isLoading, setIsLoading] = useState(true);
+  const {
+    tobaccos, setTobaccos, addTobacco, removeTobacco, categories, setCategories,
+    bootstrapped, tobaccosComplete,
+  } = useStore();
+  const [isLoading, setIsLoading] = useState(!tobaccosComplete);
   const [searchQuery, setSearchQuery] = useState('');
   const [showAddModal, setShowAddModal] = useState(false);
   const [showBulkModal, setShowBulkModal] = useState(false);
@@ -27,15 +30,21 @@ export function CollectionPage() {
   const [isSubmitting, setIsSubmitting] = useState(false);
 
   useEffect(() => {
-    loadData();
-  }, []);
+    // Полный список догружаем, только если bootstrap принёс первую страницу
+    if (!bootstrapped) return;
+    if (tobaccosComplete) {
+      setIsLoading(false);
+    } else {
+      loadData();
+    }
+  }, [bootstrapped]);
 
   const loadData = async () => {
     setIsLoading(true);
     try {
       const [tobaccosData, categoriesData] = await Promise.all([
         tobaccosApi.getAll(),
-        categoriesApi.getAll(),
+        categories.length ? Promise.resolve(categories) : categoriesApi.getAll(),
       ]);
       setTobaccos(tobaccosData);
       setCategories(categoriesData);
@@ -16,13 +16,19 @@ const roleEmojis: Record<string, string> = {
 };
 
 export function FavoritesPage() {
-  const { favorites, setFavorites } = useStore();
-  const [isLoading, setIsLoading] = useState(true);
+  const { favorites, setFavorites, bootstrapped, favoritesLoaded } = useStore();
+  const [isLoading, setIsLoading] = useState(!favoritesLoaded);
   const [selectedMix, setSelectedMix] = useState<Mix | null>(null);
 
   useEffect(() => {
-    loadFavorites();
-  }, []);
+    // Избранное приносит bootstrap
+    if (!bootstrapped) return;
+    if (favoritesLoaded) {
+      setIsLoading(false);
+    } else {
+      loadFavorites();
+    }
+  }, [bootstrapped]);
 
   const loadFavorites = async () => {
     setIsLoading(true);
@@ -15,13 +15,19 @@ const roleEmojis: Record<string, string> = {
 };
 
 export function HistoryPage() {
-  const { mixes, setMixes } = useStore();
-  const [isLoading, setIsLoading] = useState(true);
+  const { mixes, setMixes, bootstrapped, mixesLoaded } = useStore();
+  const [isLoading, setIsLoading] = useState(!mixesLoaded);
   const [selectedMix, setSelectedMix] = useState<Mix | null>(null);
 
   useEffect(() => {
-    loadMixes();
-  }, []);
+    // Последние миксы приносит bootstrap
+    if (!bootstrapped) return;
+    if (mixesLoaded) {
+      setIsLoading(false);
+    } else {
+      loadMixes();
+    }
+  }, [bootstrapped]);
 
   const loadMixes = async () => {
     setIsLoading(true);
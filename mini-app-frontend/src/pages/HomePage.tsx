@@ -6,11 +6,15 @@ import { Card } from '../components/Card';
 import { hapticFeedback, getTelegramUser, getMockUser, isTelegramWebApp } from '../telegram';
 
 export function HomePage() {
-  const { stats, setStats, setCurrentTab, tobaccos } = useStore();
+  const { stats, setStats, setCurrentTab, bootstrapped } = useStore();
 
   useEffect(() => {
-    loadStats();
-  }, [tobaccos.length]);
+    // На старте статистику приносит bootstrap; при возврате на вкладку
+    // счётчики могли измениться
+    if (bootstrapped) {
+      loadStats();
+    }
+  }, []);
 
   const loadStats = async () => {
     try {
@@ -21,18 +21,25 @@ const roleEmojis: Record<string, string> = {
 };
 
 export function MixPage() {
-  const { tobaccos, setTobaccos, currentMix, setCurrentMix } = useStore();
-  const [isLoading, setIsLoading] = useState(false);
+  const {
+    tobaccos, setTobaccos, currentMix, setCurrentMix,
+    bootstrapped, tobaccosComplete, invalidateMixes,
+  } = useStore();
+  const [isLoading, setIsLoading] = useState(!bootstrapped);
   const [isGenerating, setIsGenerating] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [selectedBase, setSelectedBase] = useState<string | null>(null);
   const [showBaseSelector, setShowBaseSelector] = useState(false);
 
   useEffect(() => {
-    if (tobaccos.length === 0) {
+    // Для выбора базы хватает первой страницы из bootstrap
+    if (!bootstrapped) return;
+    if (tobaccos.length === 0 && !tobaccosComplete) {
       loadTobaccos();
+    } else {
+      setIsLoading(false);
     }
-  }, []);
+  }, [bootstrapped]);
 
   const loadTobaccos = async () => {
     setIsLoading(true);
@@ -62,6 +69,7 @@ export function MixPage() {
         taste_profile: tasteProfile,
       });
       setCurrentMix(mix);
+      invalidateMixes();
       hapticFeedback.success();
     } catch (err: any) {
       setError(err.message);
@@ -77,6 +85,7 @@ export function MixPage() {
     hapticFeedback.light();
     try {
       await mixesApi.rate(currentMix.id, rating);
+      invalidateMixes();
       hapticFeedback.success();
     } catch (err) {
       hapticFeedback.error();
@@ -89,6 +98,7 @@ export function MixPage() {
     hapticFeedback.light();
     try {
       await mixesApi.toggleFavorite(currentMix.id, true);
+      invalidateMixes();
       hapticFeedback.success();
     } catch (err) {
       hapticFeedback.error();
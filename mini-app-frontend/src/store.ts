@@ -1,5 +1,5 @@
 import { create } from 'zustand';
-import { Category, Tobacco, Mix, Stats, MixGenerateResponse } from './api';
+import { Bootstrap, Category, Tobacco, Mix, Stats, MixGenerateResponse } from './api';
 
 interface AppState {
   // Data
@@ -8,6 +8,14 @@ interface AppState {
   mixes: Mix[];
   favorites: Mix[];
   stats: Stats | null;
+
+  // Полнота данных: bootstrap приносит первую страницу табаков (полна,
+  // если в ней вся коллекция), последние миксы и всё избранное. Страницы
+  // догружают список сами, только если его нет или он неполный
+  bootstrapped: boolean;
+  tobaccosComplete: boolean;
+  mixesLoaded: boolean;
+  favoritesLoaded: boolean;
   
   // UI State
   isLoading: boolean;
@@ -18,6 +26,10 @@ interface AppState {
   currentMix: MixGenerateResponse | null;
   
   // Actions
+  applyBootstrap: (data: Bootstrap) => void;
+  finishBootstrap: () => void;
+  invalidateMixes: () => void;
+
   setCategories: (categories: Category[]) => void;
   setTobaccos: (tobaccos: Tobacco[]) => void;
   addTobacco: (tobacco: Tobacco) => void;
@@ -46,31 +58,52 @@ export const useStore = create<AppState>((set) => ({
   mixes: [],
   favorites: [],
   stats: null,
+  bootstrapped: false,
+  tobaccosComplete: false,
+  mixesLoaded: false,
+  favoritesLoaded: false,
   isLoading: false,
   error: null,
   currentTab: 'home',
   currentMix: null,
   
   // Actions
+  // Первая страница не затирает полный список, если он загружен раньше
+  applyBootstrap: ({ stats, categories, tobaccos, mixes, favorites }) =>
+    set((state) => ({
+      stats,
+      categories,
+      bootstrapped: true,
+      ...(state.tobaccosComplete
+        ? {}
+        : { tobaccos, tobaccosComplete: tobaccos.length >= stats.tobaccos_count }),
+      ...(state.mixesLoaded ? {} : { mixes, mixesLoaded: true }),
+      ...(state.favoritesLoaded ? {} : { favorites, favoritesLoaded: true }),
+    })),
+  // bootstrap не удался — страницы загрузят данные сами
+  finishBootstrap: () => set({ bootstrapped: true }),
+  // История и избранное изменились вне страниц — перечитать при следующем показе
+  invalidateMixes: () => set({ mixesLoaded: false, favoritesLoaded: false }),
+
   setCategories: (categories) => set({ categories }),
   
-  setTobaccos: (tobaccos) => set({ tobaccos }),
+  setTobaccos: (tobaccos) => set({ tobaccos, tobaccosComplete: true }),
   addTobacco: (tobacco) => set((state) => ({ 
     tobaccos: [...state.tobaccos, tobacco].sort((a, b) => a.name.localeCompare(b.name))
   })),
   removeTobacco: (id) => set((state) => ({ 
     tobaccos: state.tobaccos.filter((t) => t.id !== id) 
   })),
-  clearTobaccos: () => set({ tobaccos: [] }),
+  clearTobaccos: () => set({ tobaccos: [], tobaccosComplete: true }),
   
-  setMixes: (mixes) => set({ mixes }),
+  setMixes: (mixes) => set({ mixes, mixesLoaded: true }),
   addMix: (mix) => set((state) => ({ mixes: [mix, ...state.mixes] })),
   updateMix: (mix) => set((state) => ({
     mixes: state.mixes.map((m) => (m.id === mix.id ? mix : m)),
     favorites: state.favorites.map((m) => (m.id === mix.id ? mix : m)),
   })),
   
-  setFavorites: (favorites) => set({ favorites }),
+  setFavorites: (favorites) => set({ favorites, favoritesLoaded: true }),
   
   setStats: (stats) => set({ stats }),
   